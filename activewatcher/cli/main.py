@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import asyncio
+import inspect
 import json
+import os
+from collections.abc import Callable
 from pathlib import Path
-from typing import Optional
+from typing import Annotated, Any, Optional
 
 import typer
 
@@ -16,48 +19,98 @@ app.add_typer(watch_app, name="watch")
 
 @app.command()
 def server(
+    # Annotated form (hence first, having no `=` default): typer only allows
+    # default_factory together with the --tcp/--no-tcp declaration this way.
+    tcp: Annotated[bool, typer.Option("--tcp/--no-tcp", default_factory=app_config.default_server_tcp)],
     host: str = typer.Option("127.0.0.1"),
     port: int = typer.Option(8712),
-    db_path: Path = typer.Option(app_config.default_db_path()),
+    db_path: Path = typer.Option(default_factory=app_config.default_db_path),
     log_level: str = typer.Option("info"),
+    uds: str = typer.Option(
+        default_factory=app_config.default_server_uds,
+        help="Also listen on this unix socket (mode 0600); clients use unix://<path>.",
+    ),
 ) -> None:
     import uvicorn
 
     from activewatcher.server.app import create_app
+    from activewatcher.server.listen import bind_tcp_socket, bind_unix_socket, run_on_sockets
+
+    if not tcp and not uds:
+        raise typer.BadParameter("--no-tcp requires --uds")
 
     api = create_app(db_path)
-    uvicorn.run(api, host=host, port=port, log_level=log_level)
+    if not uds:
+        uvicorn.run(api, host=host, port=port, log_level=log_level)
+        return
+
+    sockets = [bind_unix_socket(Path(uds))]
+    if tcp:
+        sockets.append(bind_tcp_socket(host, port))
+    run_on_sockets(api, sockets=sockets, unix_path=Path(uds), log_level=log_level)
+
+
+@app.command()
+def backup(
+    db_path: Path = typer.Option(default_factory=app_config.default_db_path),
+    dest: Path = typer.Option(default_factory=app_config.default_backup_dir),
+    compression: str = typer.Option(default_factory=app_config.default_backup_compression, help="none or zstd"),
+    full_every: int = typer.Option(7, help="Write a full snapshot after this many (0: only when needed)."),
+) -> None:
+    """Snapshot the database (and its partition files) while the server keeps running."""
+    from activewatcher.server import backup as db_backup
+
+    try:
+        results = db_backup.backup_database(db_path, dest, compression=compression, full_every=full_every)
+    except db_backup.BackupError as e:
+        raise typer.BadParameter(str(e)) from e
+    print(json.dumps([r.to_json() for r in results], indent=2))
+
+
+@app.command()
+def restore(
+    manifest: Path = typer.Argument(..., exists=True, dir_okay=False, help="Snapshot manifest (<file>.<stamp>.json)."),
+    target: Path = typer.Argument(..., help="Database file to create; must not exist."),
+) -> None:
+    """Rebuild a database file from a snapshot and the snapshots it builds on."""
+    from activewatcher.server import backup as db_backup
+
+    try:
+        result = db_backup.restore_snapshot(manifest, target)
+    except db_backup.BackupError as e:
+        raise typer.BadParameter(str(e)) from e
+    print(json.dumps(result, indent=2))
 
 
 @watch_app.command("hyprland")
 def watch_hyprland(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     source: str = typer.Option(
-        app_config.config_str(("watch", "hyprland", "source"), env_var="ACTIVEWATCHER_HYPRLAND_SOURCE", default="hyprland")
+        default_factory=lambda: app_config.config_str(("watch", "hyprland", "source"), env_var="ACTIVEWATCHER_HYPRLAND_SOURCE", default="hyprland")
     ),
     debounce_ms: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "hyprland", "debounce_ms"), env_var="ACTIVEWATCHER_HYPRLAND_DEBOUNCE_MS", default=120
         )
     ),
     title_max_len: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "hyprland", "title_max_len"), env_var="ACTIVEWATCHER_HYPRLAND_TITLE_MAX_LEN", default=200
         )
     ),
     heartbeat_seconds: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "hyprland", "heartbeat_seconds"),
             env_var="ACTIVEWATCHER_HYPRLAND_HEARTBEAT_SECONDS",
             default=30,
         )
     ),
     track_focused: bool = typer.Option(
-        app_config.config_bool(("watch", "hyprland", "track_focused"), env_var="ACTIVEWATCHER_TRACK_FOCUSED", default=True),
+        default_factory=lambda: app_config.config_bool(("watch", "hyprland", "track_focused"), env_var="ACTIVEWATCHER_TRACK_FOCUSED", default=True),
         help="Track the focused window (bucket=window).",
     ),
     track_visible_windows: bool = typer.Option(
-        app_config.config_bool(
+        default_factory=lambda: app_config.config_bool(
             ("watch", "hyprland", "track_visible_windows"),
             env_var="ACTIVEWATCHER_TRACK_VISIBLE_WINDOWS",
             default=False,
@@ -65,7 +118,7 @@ def watch_hyprland(
         help="Track all visible windows (bucket=window_visible).",
     ),
     visible_all_monitors: bool = typer.Option(
-        app_config.config_bool(
+        default_factory=lambda: app_config.config_bool(
             ("watch", "hyprland", "visible_all_monitors"),
             env_var="ACTIVEWATCHER_VISIBLE_ALL_MONITORS",
             default=False,
@@ -73,13 +126,27 @@ def watch_hyprland(
         help="When tracking visible windows, include all monitors (default: focused monitor only).",
     ),
     track_open_apps: bool = typer.Option(
-        app_config.config_bool(("watch", "hyprland", "track_open_apps"), env_var="ACTIVEWATCHER_TRACK_OPEN_APPS", default=False),
+        default_factory=lambda: app_config.config_bool(("watch", "hyprland", "track_open_apps"), env_var="ACTIVEWATCHER_TRACK_OPEN_APPS", default=False),
         help="Track all open apps (bucket=app_open).",
     ),
     track_workspaces: bool = typer.Option(
-        app_config.config_bool(("watch", "hyprland", "track_workspaces"), env_var="ACTIVEWATCHER_TRACK_WORKSPACES", default=True),
+        default_factory=lambda: app_config.config_bool(("watch", "hyprland", "track_workspaces"), env_var="ACTIVEWATCHER_TRACK_WORKSPACES", default=True),
         help="Track workspace switches (bucket=workspace) and switch events (bucket=workspace_switch).",
     ),
+    stats_seconds: int = typer.Option(
+        default_factory=lambda: app_config.config_int(
+            ("watch", "hyprland", "stats_seconds"), env_var="ACTIVEWATCHER_HYPRLAND_STATS_SECONDS", default=0
+        ),
+        help="Print IPC latency statistics every N seconds (0 disables).",
+    ),
+    process_sample_seconds: float = typer.Option(
+        default_factory=lambda: app_config.config_float(
+            ("watch", "hyprland", "process_sample_seconds"),
+            env_var="ACTIVEWATCHER_HYPRLAND_PROCESS_SAMPLE_SECONDS",
+            default=0.0,
+        ),
+        help="Sample CPU time and RSS of the focused window's process tree every N seconds (0 disables).",
+    ),
 ) -> None:
     from activewatcher.watchers import hyprland as hypr_watcher
 
@@ -95,31 +162,33 @@ def watch_hyprland(
             visible_all_monitors=visible_all_monitors,
             track_open_apps=track_open_apps,
             track_workspaces=track_workspaces,
+            stats_seconds=stats_seconds,
+            process_sample_seconds=process_sample_seconds,
         )
     )
 
 
 @watch_app.command("idle")
 def watch_idle(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     source: str = typer.Option(
-        app_config.config_str(("watch", "idle", "source"), env_var="ACTIVEWATCHER_IDLE_SOURCE", default="logind")
+        default_factory=lambda: app_config.config_str(("watch", "idle", "source"), env_var="ACTIVEWATCHER_IDLE_SOURCE", default="logind")
     ),
     threshold_seconds: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "idle", "threshold_seconds"), env_var="ACTIVEWATCHER_IDLE_THRESHOLD_SECONDS", default=120
         )
     ),
     poll_seconds: float = typer.Option(
-        app_config.config_float(("watch", "idle", "poll_seconds"), env_var="ACTIVEWATCHER_IDLE_POLL_SECONDS", default=5.0)
+        default_factory=lambda: app_config.config_float(("watch", "idle", "poll_seconds"), env_var="ACTIVEWATCHER_IDLE_POLL_SECONDS", default=5.0)
     ),
     heartbeat_seconds: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "idle", "heartbeat_seconds"), env_var="ACTIVEWATCHER_IDLE_HEARTBEAT_SECONDS", default=30
         )
     ),
     lock_process: str = typer.Option(
-        app_config.config_str(
+        default_factory=lambda: app_config.config_str(
             ("watch", "idle", "lock_process"),
             env_var="ACTIVEWATCHER_IDLE_LOCK_PROCESS",
             default="hyprlock",
@@ -127,6 +196,10 @@ def watch_idle(
         ),
         help='Treat as AFK while this process is running (set to "" to disable).',
     ),
+    backend: str = typer.Option(
+        default_factory=lambda: app_config.config_str(("watch", "idle", "backend"), env_var="ACTIVEWATCHER_IDLE_BACKEND", default="auto"),
+        help="auto (logind D-Bus signals, else loginctl polling), dbus or loginctl.",
+    ),
 ) -> None:
     from activewatcher.watchers import idle as idle_watcher
 
@@ -138,32 +211,63 @@ def watch_idle(
             poll_seconds=poll_seconds,
             heartbeat_seconds=heartbeat_seconds,
             lock_process=lock_process,
+            backend=backend,
         )
     )
 
 
 @watch_app.command("system")
 def watch_system(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     source: str = typer.Option(
-        app_config.config_str(("watch", "system", "source"), env_var="ACTIVEWATCHER_SYSTEM_SOURCE", default="system")
+        default_factory=lambda: app_config.config_str(("watch", "system", "source"), env_var="ACTIVEWATCHER_SYSTEM_SOURCE", default="system")
     ),
     poll_seconds: float = typer.Option(
-        app_config.config_float(
+        default_factory=lambda: app_config.config_float(
             ("watch", "system", "poll_seconds"), env_var="ACTIVEWATCHER_SYSTEM_POLL_SECONDS", default=5.0
         )
     ),
     heartbeat_seconds: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "system", "heartbeat_seconds"), env_var="ACTIVEWATCHER_SYSTEM_HEARTBEAT_SECONDS", default=30
         )
     ),
     include_loopback: bool = typer.Option(
-        app_config.config_bool(
+        default_factory=lambda: app_config.config_bool(
             ("watch", "system", "include_loopback"), env_var="ACTIVEWATCHER_SYSTEM_INCLUDE_LOOPBACK", default=False
         ),
         help="Include loopback traffic (lo) in network metrics.",
     ),
+    cpu_quantum: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "cpu_quantum"), env_var="ACTIVEWATCHER_SYSTEM_CPU_QUANTUM", default=1.0),
+        help="Round CPU percent to this step.",
+    ),
+    cpu_deadband: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "cpu_deadband"), env_var="ACTIVEWATCHER_SYSTEM_CPU_DEADBAND", default=5.0),
+        help="Only report CPU changes larger than this many percent points.",
+    ),
+    mem_quantum: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "mem_quantum"), env_var="ACTIVEWATCHER_SYSTEM_MEM_QUANTUM", default=0.5),
+        help="Round memory percent to this step.",
+    ),
+    mem_deadband: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "mem_deadband"), env_var="ACTIVEWATCHER_SYSTEM_MEM_DEADBAND", default=2.0),
+        help="Only report memory changes larger than this many percent points.",
+    ),
+    net_quantum: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "net_quantum"), env_var="ACTIVEWATCHER_SYSTEM_NET_QUANTUM", default=4096.0),
+        help="Round network rates to this many bytes/s (also the smallest reported change).",
+    ),
+    net_deadband: float = typer.Option(
+        default_factory=lambda: app_config.config_float(("watch", "system", "net_deadband"), env_var="ACTIVEWATCHER_SYSTEM_NET_DEADBAND", default=0.2),
+        help="Only report network rate changes larger than this fraction of the last sent rate.",
+    ),
+    detail_metrics: bool = typer.Option(
+        default_factory=lambda: app_config.config_bool(
+            ("watch", "system", "detail_metrics"), env_var="ACTIVEWATCHER_SYSTEM_DETAIL_METRICS", default=False
+        ),
+        help="Also store per-core, per-interface, per-disk and PSI metric series.",
+    ),
 ) -> None:
     from activewatcher.watchers import system as system_watcher
 
@@ -174,23 +278,30 @@ def watch_system(
             poll_seconds=poll_seconds,
             heartbeat_seconds=heartbeat_seconds,
             include_loopback=include_loopback,
+            cpu_quantum=cpu_quantum,
+            cpu_deadband=cpu_deadband,
+            mem_quantum=mem_quantum,
+            mem_deadband=mem_deadband,
+            net_quantum=net_quantum,
+            net_deadband=net_deadband,
+            detail_metrics=detail_metrics,
         )
     )
 
 
 @watch_app.command("battery")
 def watch_battery(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     source: str = typer.Option(
-        app_config.config_str(("watch", "battery", "source"), env_var="ACTIVEWATCHER_BATTERY_SOURCE", default="battery")
+        default_factory=lambda: app_config.config_str(("watch", "battery", "source"), env_var="ACTIVEWATCHER_BATTERY_SOURCE", default="battery")
     ),
     poll_seconds: float = typer.Option(
-        app_config.config_float(
+        default_factory=lambda: app_config.config_float(
             ("watch", "battery", "poll_seconds"), env_var="ACTIVEWATCHER_BATTERY_POLL_SECONDS", default=15.0
         )
     ),
     heartbeat_seconds: int = typer.Option(
-        app_config.config_int(
+        default_factory=lambda: app_config.config_int(
             ("watch", "battery", "heartbeat_seconds"),
             env_var="ACTIVEWATCHER_BATTERY_HEARTBEAT_SECONDS",
             default=60,
@@ -209,9 +320,48 @@ def watch_battery(
     )
 
 
+def _option_defaults(command: Callable[..., Any], *, exclude: tuple[str, ...] = ("server_url",)) -> dict[str, Any]:
+    # Resolve the single-watcher commands' config.toml/env-backed option defaults, so
+    # `watch all` can't drift from the individual commands.
+    out: dict[str, Any] = {}
+    for name, param in inspect.signature(command).parameters.items():
+        info = param.default
+        if name in exclude or not isinstance(info, typer.models.OptionInfo):
+            continue
+        out[name] = info.default_factory() if info.default_factory is not None else info.default
+    return out
+
+
+@watch_app.command("all")
+def watch_all(
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
+) -> None:
+    """Run every enabled watcher in one process (enable via [watch.<name>] enabled = true|false)."""
+    from activewatcher.watchers import combined
+
+    commands: dict[str, Callable[..., Any]] = {
+        "hyprland": watch_hyprland,
+        "idle": watch_idle,
+        "system": watch_system,
+        "battery": watch_battery,
+    }
+    watchers: dict[str, dict[str, Any]] = {}
+    for name, command in commands.items():
+        enabled = app_config.config_bool(
+            ("watch", name, "enabled"),
+            env_var=f"ACTIVEWATCHER_{name.upper()}_ENABLED",
+            # Without a Hyprland session the hyprland watcher would only retry connecting.
+            default=name != "hyprland" or bool(os.environ.get("HYPRLAND_INSTANCE_SIGNATURE")),
+        )
+        if enabled:
+            watchers[name] = _option_defaults(command)
+
+    asyncio.run(combined.run(server_url=server_url, watchers=watchers))
+
+
 @app.command()
 def events(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     bucket: Optional[str] = typer.Option(None),
     source: Optional[str] = typer.Option(None),
     from_ts: Optional[str] = typer.Option(None, "--from"),
@@ -238,7 +388,7 @@ def events(
 
 @app.command()
 def summary(
-    server_url: str = typer.Option(app_config.default_server_url()),
+    server_url: str = typer.Option(default_factory=app_config.default_server_url),
     from_ts: Optional[str] = typer.Option(None, "--from"),
     to_ts: Optional[str] = typer.Option(None, "--to"),
     chunk_seconds: int = typer.Option(300),
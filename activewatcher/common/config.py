@@ -186,6 +186,14 @@ def default_server_url() -> str:
     )
 
 
+def default_server_uds() -> str:
+    return config_str(("server", "uds"), env_var="ACTIVEWATCHER_SERVER_UDS", default="", allow_empty=True)
+
+
+def default_server_tcp() -> bool:
+    return config_bool(("server", "tcp"), env_var="ACTIVEWATCHER_SERVER_TCP", default=True)
+
+
 def default_stale_after_seconds() -> int:
     value = config_int(
         ("server", "stale_after_seconds"),
@@ -195,5 +203,93 @@ def default_stale_after_seconds() -> int:
     return max(0, value)
 
 
+def default_stale_sweep_seconds() -> int:
+    value = config_int(
+        ("server", "stale_sweep_seconds"),
+        env_var="ACTIVEWATCHER_STALE_SWEEP_SECONDS",
+        default=60,
+    )
+    return max(0, value)
+
+
+def default_checkpoint_seconds() -> int:
+    value = config_int(
+        ("server", "checkpoint_seconds"),
+        env_var="ACTIVEWATCHER_CHECKPOINT_SECONDS",
+        default=60,
+    )
+    return max(0, value)
+
+
+def default_optimize_seconds() -> int:
+    value = config_int(
+        ("server", "optimize_seconds"),
+        env_var="ACTIVEWATCHER_OPTIMIZE_SECONDS",
+        default=21600,
+    )
+    return max(0, value)
+
+
+def default_wal_limit_mb() -> int:
+    value = config_int(("server", "wal_limit_mb"), env_var="ACTIVEWATCHER_WAL_LIMIT_MB", default=64)
+    return max(1, value)
+
+
+def default_vacuum_convert() -> bool:
+    return config_bool(("server", "vacuum_convert"), env_var="ACTIVEWATCHER_VACUUM_CONVERT", default=False)
+
+
+def default_backup_dir() -> Path:
+    raw = config_str(("server", "backup_dir"), env_var="ACTIVEWATCHER_BACKUP_DIR", default="")
+    if raw:
+        return Path(raw).expanduser()
+    return default_data_dir() / "backups"
+
+
+def default_backup_compression() -> str:
+    return config_str(("server", "backup_compression"), env_var="ACTIVEWATCHER_BACKUP_COMPRESSION", default="none")
+
+
+def default_partition_events() -> bool:
+    return config_bool(("server", "partition_events"), env_var="ACTIVEWATCHER_PARTITION_EVENTS", default=False)
+
+
+def default_partition_retention_months() -> int:
+    value = config_int(
+        ("server", "partition_retention_months"),
+        env_var="ACTIVEWATCHER_PARTITION_RETENTION_MONTHS",
+        default=0,
+    )
+    return max(0, value)
+
+
+def default_metric_raw_days() -> int:
+    """Days raw metric samples are kept; older ranges are served from the 1m/1h/1d rollups (0 keeps forever)."""
+    value = config_int(
+        ("server", "metric_raw_days"),
+        env_var="ACTIVEWATCHER_METRIC_RAW_DAYS",
+        default=30,
+    )
+    return max(0, value)
+
+
+def default_retention_rules() -> dict[str, dict[str, Any]]:
+    """`[server.retention.<bucket>]` tables: raw_days, rollup_days (0 keeps forever), keep."""
+    table = _config_value(("server", "retention"))
+    if not isinstance(table, dict):
+        return {}
+    rules: dict[str, dict[str, Any]] = {}
+    for bucket, rule in table.items():
+        if not isinstance(rule, dict):
+            continue
+        keep = rule.get("keep")
+        rules[str(bucket)] = {
+            "raw_days": max(0, _parse_int(rule.get("raw_days")) or 0),
+            "rollup_days": max(0, _parse_int(rule.get("rollup_days")) or 0),
+            "keep": [str(k) for k in keep] if isinstance(keep, list) else None,
+        }
+    return rules
+
+
 def ensure_parent_dir(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -1,6 +1,33 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from activewatcher.common import config as app_config
+from activewatcher.common.protocol import state_data_hash
+
+T = TypeVar("T")
+
+UNIX_SCHEME = "unix://"
+
+
+def split_server_url(server_url: str) -> tuple[str, str | None]:
+    """Map a server URL to (HTTP base URL, unix socket path or None).
+
+    `unix:///run/user/1000/activewatcher/server.sock` talks HTTP over that socket; the
+    base URL's host is then only used for the Host header.
+    """
+    if server_url.startswith(UNIX_SCHEME):
+        path = server_url[len(UNIX_SCHEME) :]
+        if not path:
+            raise ValueError(f"missing socket path in server URL: {server_url!r}")
+        return "http://localhost", path
+    return server_url.rstrip("/"), None
 
 
 class ActiveWatcherClient:
@@ -12,8 +39,9 @@ class ActiveWatcherClient:
                 "Missing dependency: httpx. Install it (e.g. `pip install httpx`) to use client commands."
             ) from e
 
-        self._base_url = base_url.rstrip("/")
-        self._client = httpx.Client(timeout=timeout_seconds)
+        self._base_url, uds = split_server_url(base_url)
+        transport = httpx.HTTPTransport(uds=uds) if uds else None
+        self._client = httpx.Client(timeout=timeout_seconds, transport=transport)
 
     def close(self) -> None:
         self._client.close()
@@ -24,8 +52,44 @@ class ActiveWatcherClient:
         return resp.json()
 
 
+@dataclass
+class ClientStats:
+    requests: int = 0
+    connections: int = 0
+    retries: int = 0
+    errors: int = 0
+    http_version: str | None = None
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": max(0, self.requests - self.connections),
+            "retries": self.retries,
+            "errors": self.errors,
+            "http_version": self.http_version,
+        }
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # type: ignore  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 class ActiveWatcherAsyncClient:
-    def __init__(self, base_url: str, *, timeout_seconds: float = 5.0) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        timeout_seconds: float = 5.0,
+        http2: bool = False,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.2,
+        max_backoff_seconds: float = 5.0,
+    ) -> None:
         try:
             import httpx  # type: ignore
         except ImportError as e:  # pragma: no cover
@@ -33,13 +97,231 @@ class ActiveWatcherAsyncClient:
                 "Missing dependency: httpx. Install it (e.g. `pip install httpx`) to run watchers."
             ) from e
 
-        self._base_url = base_url.rstrip("/")
-        self._client = httpx.AsyncClient(timeout=timeout_seconds)
+        self._httpx = httpx
+        self._base_url, uds = split_server_url(base_url)
+        self._client = httpx.AsyncClient(
+            timeout=timeout_seconds,
+            transport=httpx.AsyncHTTPTransport(
+                uds=uds,
+                # HTTP/2 needs the optional `h2` package; without it keep-alive HTTP/1.1 is used.
+                http2=http2 and _http2_available(),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=120.0),
+            ),
+        )
+        self._max_retries = max(0, max_retries)
+        self._backoff_seconds = backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._streams: deque[int] = deque(maxlen=16)
+        self._batch_supported = True
+        self.stats = ClientStats()
 
     async def aclose(self) -> None:
         await self._client.aclose()
 
+    async def _post(self, path: str, payload: dict[str, Any]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                resp = await self._client.post(f"{self._base_url}{path}", json=payload)
+            except self._httpx.TransportError:
+                # Server restarting or connection dropped: reconnect with full-jitter backoff.
+                if attempt >= self._max_retries:
+                    self.stats.errors += 1
+                    raise
+                delay = min(self._max_backoff_seconds, self._backoff_seconds * (2**attempt))
+                attempt += 1
+                self.stats.retries += 1
+                await asyncio.sleep(random.uniform(0.0, delay))
+                continue
+            self._record(resp)
+            return resp
+
+    def _record(self, resp: Any) -> None:
+        self.stats.requests += 1
+        self.stats.http_version = getattr(resp, "http_version", None)
+        stream = resp.extensions.get("network_stream")
+        stream_id = id(stream) if stream is not None else None
+        if stream_id is None or stream_id not in self._streams:
+            self.stats.connections += 1
+            if stream_id is not None:
+                self._streams.append(stream_id)
+
     async def post_state(self, payload: dict[str, Any]) -> dict[str, Any]:
-        resp = await self._client.post(f"{self._base_url}/v1/state", json=payload)
+        resp = await self._post("/v1/state", payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def post_state_set(self, payload: dict[str, Any]) -> dict[str, Any]:
+        resp = await self._post("/v1/state_set", payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def refresh_state(self, payload: dict[str, Any], *, data_json: str | None = None) -> dict[str, Any]:
+        """Extend an unchanged state via /v1/touch, falling back to a full post on 409."""
+        touch = {
+            "bucket": payload["bucket"],
+            "source": payload["source"],
+            "ts": payload["ts"],
+            "data_hash": state_data_hash(data_json if data_json is not None else payload["data"]),
+        }
+        resp = await self._post("/v1/touch", touch)
+        if resp.status_code == 409:
+            return await self.post_state(payload)
         resp.raise_for_status()
         return resp.json()
+
+    async def post_batch(self, items: list[dict[str, Any]]) -> dict[str, Any]:
+        """Send spooled {"kind", "payload"} records in order via POST /v1/batch.
+
+        A "touch" item whose interval is gone or holds other data comes back as "resend" in
+        `results`; the caller then has to send the full state.
+        """
+        if self._batch_supported:
+            resp = await self._post("/v1/batch", {"items": items})
+            if resp.status_code != 404:
+                resp.raise_for_status()
+                return resp.json()
+            # Server predates /v1/batch: replay the records one request at a time.
+            self._batch_supported = False
+        results: list[str] = []
+        for item in items:
+            kind = item["kind"]
+            if kind in ("metrics", "process"):
+                # Such servers have no metric or process sample store either.
+                results.append("skipped")
+                continue
+            try:
+                if kind == "set":
+                    await self.post_state_set(item["payload"])
+                elif kind == "touch" and "data" in item["payload"]:
+                    # Spooled before touches were sent as a data hash.
+                    await self.refresh_state(item["payload"])
+                elif kind == "touch":
+                    resp = await self._post("/v1/touch", item["payload"])
+                    if resp.status_code == 409:
+                        results.append("resend")
+                        continue
+                    resp.raise_for_status()
+                else:
+                    await self.post_state(item["payload"])
+            except self._httpx.HTTPStatusError as e:
+                # 409: already ingested before a lost response; skip like /v1/batch does.
+                if e.response.status_code != 409:
+                    raise
+                results.append("skipped")
+                continue
+            results.append(kind)
+        applied = sum(1 for r in results if r not in ("skipped", "resend"))
+        return {"status": "ok", "applied": applied, "skipped": len(items) - applied, "results": results}
+
+
+class SendQueueOverflow(RuntimeError):
+    pass
+
+
+class AsyncSender:
+    """FIFO send queue in front of one long-lived client.
+
+    Watchers submit sends and carry on; a single worker task performs them in order, so a
+    slow or restarting server delays delivery instead of blocking event handling. When more
+    than `max_pending` sends pile up, the oldest are failed with SendQueueOverflow.
+    """
+
+    def __init__(self, client: ActiveWatcherAsyncClient, *, max_pending: int = 1000) -> None:
+        self.client = client
+        self._max_pending = max(1, max_pending)
+        self._queue: deque[tuple[asyncio.Future, Callable[[ActiveWatcherAsyncClient], Awaitable[Any]], float]] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._sent = 0
+        self._failed = 0
+        self._dropped = 0
+        self._max_depth = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+
+    def submit(self, send: Callable[[ActiveWatcherAsyncClient], Awaitable[T]]) -> asyncio.Future[T]:
+        loop = asyncio.get_running_loop()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+        future: asyncio.Future[T] = loop.create_future()
+        while len(self._queue) >= self._max_pending:
+            dropped, _, _ = self._queue.popleft()
+            self._dropped += 1
+            if not dropped.done():
+                dropped.set_exception(SendQueueOverflow("send queue full; dropped oldest send"))
+        self._queue.append((future, send, time.perf_counter()))
+        self._max_depth = max(self._max_depth, len(self._queue))
+        self._wakeup.set()
+        return future
+
+    async def send(self, send: Callable[[ActiveWatcherAsyncClient], Awaitable[T]]) -> T:
+        return await self.submit(send)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            future, send, enqueued_at = self._queue.popleft()
+            if future.done():
+                continue
+            waited_ms = (time.perf_counter() - enqueued_at) * 1000.0
+            self._wait_total_ms += waited_ms
+            self._wait_max_ms = max(self._wait_max_ms, waited_ms)
+            try:
+                result = await send(self.client)
+            except Exception as e:
+                self._failed += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self._sent += 1
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict[str, Any]:
+        started = self._sent + self._failed
+        return {
+            "client": self.client.stats.to_json(),
+            "queue": {
+                "depth": len(self._queue),
+                "max_depth": self._max_depth,
+                "sent": self._sent,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "avg_wait_ms": round(self._wait_total_ms / started, 3) if started else 0.0,
+                "max_wait_ms": round(self._wait_max_ms, 3),
+            },
+        }
+
+    async def aclose(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._queue:
+            future, _, _ = self._queue.popleft()
+            future.cancel()
+        await self.client.aclose()
+
+
+_SENDERS: dict[str, AsyncSender] = {}
+
+
+def shared_sender(base_url: str) -> AsyncSender:
+    """Process-wide sender (and keep-alive client) for `base_url`."""
+    key = base_url.rstrip("/")
+    sender = _SENDERS.get(key)
+    if sender is None:
+        http2 = app_config.config_bool(("client", "http2"), env_var="ACTIVEWATCHER_HTTP2", default=False)
+        sender = AsyncSender(ActiveWatcherAsyncClient(key, http2=http2))
+        _SENDERS[key] = sender
+    return sender
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any
+from typing import Annotated, Any, Literal
 
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
 
+# Re-exported: these used to live here.
+from activewatcher.common.protocol import END_MARKER_KEY, state_data_hash  # noqa: F401
 
-END_MARKER_KEY = "__activewatcher_end__"
+
+def _require_tz(value: datetime) -> datetime:
+    if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
+        raise ValueError("ts must be timezone-aware (include offset or Z)")
+    return value
+
+
+AwareDatetime = Annotated[datetime, AfterValidator(_require_tz)]
 
 
 class StateEvent(BaseModel):
@@ -14,12 +23,94 @@ class StateEvent(BaseModel):
 
     bucket: str = Field(min_length=1)
     source: str = Field(min_length=1)
-    ts: datetime
+    ts: AwareDatetime
     data: dict[str, Any]
 
-    @field_validator("ts")
-    @classmethod
-    def _ts_tz_aware(cls, value: datetime) -> datetime:
-        if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
-            raise ValueError("ts must be timezone-aware (include offset or Z)")
-        return value
+
+class TouchEvent(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    bucket: str = Field(min_length=1)
+    source: str = Field(min_length=1)
+    ts: AwareDatetime
+    data_hash: str | None = None
+
+
+class StateSet(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    bucket: str = Field(min_length=1)
+    source: str = Field(min_length=1)
+    ts: AwareDatetime
+    items: dict[str, dict[str, Any]]
+
+
+class TabOp(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    op: Literal["add", "update", "remove"]
+    id: int | str
+    tab: dict[str, Any] | None = None
+
+
+class TabDelta(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    source: str = Field(min_length=1)
+    browser: str | None = None
+    ts: AwareDatetime
+    seq: int = Field(ge=0)
+    reset: bool = False
+    ops: list[TabOp] = Field(default_factory=list)
+
+
+class MetricPoint(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    ts: AwareDatetime
+    values: dict[str, float]
+
+
+class MetricSamples(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    source: str = Field(min_length=1)
+    points: list[MetricPoint] = Field(default_factory=list, max_length=5000)
+
+
+class ProcessSample(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    ts: AwareDatetime
+    pid: int = Field(ge=1)
+    app: str | None = None
+    cpu_seconds: float = Field(ge=0)
+    interval_seconds: float = Field(ge=0)
+    rss_bytes: int = Field(ge=0)
+    processes: int = Field(ge=1)
+
+
+class ProcessSamples(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # The interval bucket/source the samples are attributed to (the focused window).
+    bucket: str = Field(default="window", min_length=1)
+    source: str = Field(min_length=1)
+    samples: list[ProcessSample] = Field(default_factory=list, max_length=5000)
+
+
+class BatchItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # "touch" items carry a TouchEvent ({"bucket", "source", "ts", "data_hash"}); if the
+    # interval is gone the item's result is "resend" and the sender posts the full state.
+    # "metrics" items carry one {"source", "ts", "values"} sample for the metric store.
+    # "process" items carry one {"bucket", "source", **ProcessSample} focused-process sample.
+    kind: Literal["state", "touch", "set", "metrics", "process"]
+    payload: dict[str, Any]
+
+
+class StateBatch(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    items: list[BatchItem] = Field(default_factory=list, max_length=5000)
@@ -0,0 +1,24 @@
+"""Wire-level constants and helpers shared by watchers, clients and the server.
+
+Kept free of pydantic/fastapi imports so watcher processes don't load the validation
+stack just to build payloads.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+END_MARKER_KEY = "__activewatcher_end__"
+
+
+def canonical_json(data: Any) -> str:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def state_data_hash(data: dict[str, Any] | str) -> str:
+    """Hash of the canonical JSON of a state's data, as compared by POST /v1/touch."""
+    if not isinstance(data, str):
+        data = canonical_json(data)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,515 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import os
+import random
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Literal
+
+from activewatcher.common import config as app_config
+from activewatcher.common.http import AsyncSender, shared_sender
+from activewatcher.common.protocol import END_MARKER_KEY, canonical_json, state_data_hash
+from activewatcher.common.time import parse_rfc3339
+
+RecordKind = Literal["state", "touch", "set", "metrics", "process"]
+
+_SEGMENT_SUFFIX = ".log"
+_CURSOR_FILE = "cursor.json"
+_LOCK_FILE = "lock"
+
+
+class SpoolBusyError(RuntimeError):
+    pass
+
+
+def _record_key(record: dict[str, Any]) -> tuple[bool, str, str]:
+    payload = record.get("payload") or {}
+    return record.get("kind") == "set", str(payload.get("bucket")), str(payload.get("source"))
+
+
+def _record_content(record: dict[str, Any]) -> str:
+    payload = record.get("payload") or {}
+    if record.get("kind") == "touch" and "data" not in payload:
+        return str(payload.get("data_hash"))
+    return canonical_json(payload.get("items") if record.get("kind") == "set" else payload.get("data"))
+
+
+def _record_ts(record: dict[str, Any]) -> datetime | None:
+    try:
+        return parse_rfc3339(str((record.get("payload") or {}).get("ts")))
+    except ValueError:
+        return None
+
+
+def compact_records(records: list[dict[str, Any]], *, max_gap_seconds: float) -> list[dict[str, Any]]:
+    """Drop heartbeats that a later record for the same (bucket, source) supersedes.
+
+    A heartbeat is a touch, or any record repeating the previous content for its key. It is
+    dropped only if the next record for that key lands within `max_gap_seconds` of the
+    last kept one, so the server still sees the interval refreshed often enough to keep it
+    open (max_gap_seconds must stay below the server's stale_after_seconds).
+    """
+    next_index: list[int | None] = [None] * len(records)
+    later: dict[tuple[bool, str, str], int] = {}
+    for i in range(len(records) - 1, -1, -1):
+        key = _record_key(records[i])
+        next_index[i] = later.get(key)
+        later[key] = i
+
+    kept: list[dict[str, Any]] = []
+    anchors: dict[tuple[bool, str, str], tuple[datetime | None, str]] = {}
+    for i, record in enumerate(records):
+        if record.get("kind") in ("metrics", "process"):
+            # Samples are data points, not heartbeats; never drop them.
+            kept.append(record)
+            continue
+        key = _record_key(record)
+        anchor = anchors.get(key)
+        # A touch only ever extends the state before it, so it repeats that content.
+        content = anchor[1] if anchor is not None and record.get("kind") == "touch" else _record_content(record)
+        ts = _record_ts(record)
+        nxt = next_index[i]
+        if anchor is not None and anchor[1] == content and anchor[0] is not None and nxt is not None:
+            next_ts = _record_ts(records[nxt])
+            if next_ts is not None and (next_ts - anchor[0]).total_seconds() <= max_gap_seconds:
+                continue
+        kept.append(record)
+        anchors[key] = (ts, content)
+    return kept
+
+
+class Spool:
+    """Append-only, segmented on-disk log of watcher records awaiting delivery.
+
+    Records are JSON lines in numbered segment files; `cursor.json` remembers how far the
+    drainer got. Fully drained segments are deleted. When the spool outgrows `max_bytes`,
+    undrained sealed segments are compacted first and the oldest are dropped last.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        segment_bytes: int = 1 << 20,
+        max_bytes: int = 64 << 20,
+        heartbeat_gap_seconds: float = 60.0,
+    ) -> None:
+        self.directory = directory
+        self._segment_bytes = max(4096, segment_bytes)
+        self._max_bytes = max(self._segment_bytes * 2, max_bytes)
+        self.heartbeat_gap_seconds = heartbeat_gap_seconds
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock_fd = os.open(directory / _LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as e:
+            os.close(self._lock_fd)
+            raise SpoolBusyError(f"spool {directory} is in use by another process") from e
+
+        self._cursor = self._load_cursor()
+        # End of the last read() not committed yet: segments up to it may be in flight, so
+        # their byte offsets must not change under the drainer.
+        self._inflight: tuple[int, int] | None = None
+        segments = self._segments()
+        # Always start a fresh segment so a write torn by a crash never prefixes new records.
+        self._write_segment = max([*segments, self._cursor[0], 0]) + 1
+        self._write_fd: int | None = None
+        self._write_size = 0
+        self.appended = 0
+        self.drained = 0
+        self.compacted = 0
+        self.dropped = 0
+
+    # -- files ----------------------------------------------------------------------
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"{number:010d}{_SEGMENT_SUFFIX}"
+
+    def _segments(self) -> list[int]:
+        out: list[int] = []
+        for path in self.directory.glob(f"*{_SEGMENT_SUFFIX}"):
+            stem = path.name[: -len(_SEGMENT_SUFFIX)]
+            if stem.isdigit():
+                out.append(int(stem))
+        return sorted(out)
+
+    def _load_cursor(self) -> tuple[int, int]:
+        try:
+            raw = json.loads((self.directory / _CURSOR_FILE).read_text(encoding="utf-8"))
+            return int(raw["segment"]), int(raw["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _save_cursor(self) -> None:
+        tmp = self.directory / f"{_CURSOR_FILE}.tmp"
+        tmp.write_text(json.dumps({"segment": self._cursor[0], "offset": self._cursor[1]}), encoding="utf-8")
+        os.replace(tmp, self.directory / _CURSOR_FILE)
+
+    def _open_write_segment(self) -> None:
+        self._write_fd = os.open(
+            self._segment_path(self._write_segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+        )
+        self._write_size = os.fstat(self._write_fd).st_size
+
+    def _rotate(self) -> None:
+        if self._write_fd is not None:
+            os.fsync(self._write_fd)
+            os.close(self._write_fd)
+            self._write_fd = None
+            self._write_segment += 1
+            # Checked per sealed segment, so the spool overshoots max_bytes by one segment at most.
+            self._enforce_limit()
+        self._open_write_segment()
+
+    # -- writing --------------------------------------------------------------------
+
+    def append(self, records: Iterable[dict[str, Any]]) -> None:
+        lines = [(canonical_json(r) + "\n").encode("utf-8") for r in records]
+        if not lines:
+            return
+        data = b"".join(lines)
+        if self._write_fd is None or (self._write_size and self._write_size + len(data) > self._segment_bytes):
+            self._rotate()
+        assert self._write_fd is not None
+        os.write(self._write_fd, data)
+        self._write_size += len(data)
+        self.appended += len(lines)
+
+    def _size(self) -> int:
+        total = 0
+        for number in self._segments():
+            try:
+                total += self._segment_path(number).stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _enforce_limit(self) -> None:
+        if self._size() <= self._max_bytes:
+            return
+        sealed = [n for n in self._segments() if n < self._write_segment]
+        # Only segments no read() has reached: rewriting one would shift the offsets of a
+        # position the drainer is about to commit.
+        first = max(self._cursor, self._inflight or self._cursor)
+        for number in sealed:
+            if number > first[0] or (number == first[0] and first[1] == 0):
+                self._compact_segment(number)
+        while self._size() > self._max_bytes:
+            sealed = [n for n in self._segments() if n < self._write_segment]
+            if not sealed:
+                return
+            oldest = sealed[0]
+            self.dropped += sum(1 for _ in self._iter_lines(oldest, 0))
+            self._segment_path(oldest).unlink(missing_ok=True)
+            if self._cursor[0] <= oldest:
+                self._cursor = (oldest + 1, 0)
+                self._save_cursor()
+
+    def _compact_segment(self, number: int) -> None:
+        path = self._segment_path(number)
+        records = [rec for _, rec in self._iter_records(number, 0)]
+        kept = compact_records(records, max_gap_seconds=self.heartbeat_gap_seconds)
+        if len(kept) == len(records):
+            return
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(b"".join((canonical_json(r) + "\n").encode("utf-8") for r in kept))
+        os.replace(tmp, path)
+        self.compacted += len(records) - len(kept)
+
+    # -- reading --------------------------------------------------------------------
+
+    def _iter_lines(self, number: int, offset: int) -> Iterable[tuple[int, bytes]]:
+        try:
+            with self._segment_path(number).open("rb") as f:
+                f.seek(offset)
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        return
+                    yield f.tell(), line
+        except FileNotFoundError:
+            return
+
+    def _iter_records(self, number: int, offset: int) -> Iterable[tuple[int, dict[str, Any]]]:
+        for end, line in self._iter_lines(number, offset):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn by a crash mid-write
+            if isinstance(record, dict):
+                yield end, record
+
+    def read(self, max_records: int) -> tuple[list[dict[str, Any]], tuple[int, int]]:
+        """Return up to `max_records` undrained records and the cursor to commit after them."""
+        records: list[dict[str, Any]] = []
+        pos = self._cursor
+        segments = [n for n in self._segments() if n >= self._cursor[0]]
+        for idx, number in enumerate(segments):
+            offset = self._cursor[1] if number == self._cursor[0] else 0
+            pos = (number, offset)
+            for end, record in self._iter_records(number, offset):
+                records.append(record)
+                pos = (number, end)
+                if len(records) >= max_records:
+                    self._inflight = pos
+                    return records, pos
+            if number < self._write_segment and idx + 1 < len(segments):
+                pos = (segments[idx + 1], 0)
+        self._inflight = pos if records else None
+        return records, pos
+
+    def commit(self, pos: tuple[int, int], *, count: int = 0) -> None:
+        self._inflight = None
+        # Behind the cursor: the segment was dropped by the size limit while in flight.
+        if pos <= self._cursor:
+            return
+        self._cursor = pos
+        self.drained += count
+        self._save_cursor()
+        for number in self._segments():
+            if number < pos[0] and number != self._write_segment:
+                self._segment_path(number).unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "bytes": self._size(),
+            "appended": self.appended,
+            "drained": self.drained,
+            "compacted": self.compacted,
+            "dropped": self.dropped,
+        }
+
+    def close(self) -> None:
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+        os.close(self._lock_fd)
+
+
+def _status_code(e: Exception) -> int | None:
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+
+def _rejected_by_server(e: Exception) -> bool:
+    """A 4xx other than 404/408/429: retrying the same request will never succeed."""
+    status = _status_code(e)
+    return status is not None and 400 <= status < 500 and status not in (404, 408, 429)
+
+
+# Consecutive 5xx replies to the same batch before the drainer sends its records one at a
+# time, and to a single record before that record is dropped.
+_MAX_SERVER_ERRORS = 5
+
+
+class Outbox:
+    """Delivers watcher records to the server in order, via the durable spool if present.
+
+    With a spool, `put_many` only appends to disk; a background task drains the spool in
+    batches through POST /v1/batch and retries with backoff until the server accepts them.
+    Without one, records are sent directly and failures propagate to the caller.
+
+    Touches go out as `{bucket, source, ts, data_hash}`; the outbox keeps the last full state
+    of each (bucket, source) and sends it when the server answers a touch with "resend".
+    """
+
+    def __init__(self, sender: AsyncSender, spool: Spool | None, *, batch_size: int = 500) -> None:
+        self._sender = sender
+        self._spool = spool
+        self._batch_size = max(1, batch_size)
+        self._wakeup: asyncio.Event | None = None
+        self._drainer: asyncio.Task | None = None
+        self._batches = 0
+        self._send_failures = 0
+        self._resends = 0
+        # (bucket, source) -> [data, its state_data_hash or None until a touch needs it]
+        self._states: dict[tuple[str, str], list[Any]] = {}
+
+    async def put(self, kind: RecordKind, payload: dict[str, Any]) -> None:
+        await self.put_many([(kind, payload)])
+
+    async def put_many(self, records: list[tuple[RecordKind, dict[str, Any]]]) -> None:
+        items = [{"kind": kind, "payload": self._wire_payload(kind, payload)} for kind, payload in records]
+        if not items:
+            return
+        if self._spool is None:
+            await self._post_or_split(items)
+            return
+        self._spool.append(items)
+        self._ensure_drainer()
+        assert self._wakeup is not None
+        self._wakeup.set()
+
+    def _wire_payload(self, kind: RecordKind, payload: dict[str, Any]) -> dict[str, Any]:
+        """Remember full states, and turn a touch's data into its hash."""
+        if kind not in ("state", "touch"):
+            return payload
+        key = (str(payload["bucket"]), str(payload["source"]))
+        data = payload["data"]
+        if kind == "state":
+            if data.get(END_MARKER_KEY) is True:
+                self._states.pop(key, None)
+            else:
+                self._states[key] = [data, None]
+            return payload
+        entry = self._states.get(key)
+        # Watchers touch with the dict they last sent, so this is usually an identity check.
+        if entry is None or (entry[0] is not data and entry[0] != data):
+            entry = self._states[key] = [data, None]
+        if entry[1] is None:
+            entry[1] = state_data_hash(data)
+        return {"bucket": payload["bucket"], "source": payload["source"], "ts": payload["ts"], "data_hash": entry[1]}
+
+    def _resend_items(self, items: list[dict[str, Any]], results: list[Any]) -> list[dict[str, Any]]:
+        """Full states for the touches the server answered with "resend"."""
+        out: list[dict[str, Any]] = []
+        for item, result in zip(items, results):
+            if result != "resend":
+                continue
+            payload = item["payload"]
+            entry = self._states.get((str(payload.get("bucket")), str(payload.get("source"))))
+            if entry is None or entry[1] != payload.get("data_hash"):
+                # Superseded by a newer state (already queued), or spooled by an earlier run.
+                continue
+            out.append(
+                {
+                    "kind": "state",
+                    "payload": {
+                        "bucket": payload["bucket"],
+                        "source": payload["source"],
+                        "ts": payload["ts"],
+                        "data": entry[0],
+                    },
+                }
+            )
+        return out
+
+    def _ensure_drainer(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self) -> None:
+        assert self._spool is not None and self._wakeup is not None
+        failures = 0
+        server_errors = 0
+        # Records left to send one at a time while looking for one the server fails on.
+        isolating = 0
+        while True:
+            records, pos = self._spool.read(1 if isolating else self._batch_size)
+            if not records:
+                self._spool.commit(pos)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=30.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            items = compact_records(records, max_gap_seconds=self._spool.heartbeat_gap_seconds)
+            try:
+                dropped = await self._post_or_split(items)
+            except Exception as e:
+                if failures == 0:
+                    print(f"[spool] send failed, keeping records spooled: {e}")
+                failures += 1
+                self._send_failures += 1
+                status = _status_code(e)
+                server_errors = server_errors + 1 if status is not None and status >= 500 else 0
+                if server_errors >= _MAX_SERVER_ERRORS:
+                    # The server keeps failing on this batch; don't let one record it can't
+                    # handle hold up the spool forever.
+                    server_errors = 0
+                    if len(records) > 1:
+                        print(f"[spool] server keeps failing ({e}); sending records one at a time")
+                        isolating = len(records)
+                    else:
+                        print(f"[spool] dropping {records[0].get('kind')} record the server keeps failing on: {e}")
+                        self._spool.dropped += 1
+                        self._spool.commit(pos)
+                        isolating = 0
+                        continue
+                await asyncio.sleep(random.uniform(0.0, min(30.0, 0.5 * (2 ** min(failures, 6)))))
+                continue
+            failures = 0
+            server_errors = 0
+            isolating = max(0, isolating - len(records))
+            self._batches += 1
+            self._spool.compacted += len(records) - len(items)
+            self._spool.dropped += dropped
+            self._spool.commit(pos, count=len(records) - dropped)
+
+    async def _post_or_split(self, items: list[dict[str, Any]]) -> int:
+        """Post `items` in order; returns how many the server rejected and were dropped.
+
+        /v1/batch validates the whole batch, so one record the server will never accept (a
+        malformed payload, a kind an older server doesn't know) fails all of them. Such a
+        batch is split in halves until only the rejected records are left to drop.
+        """
+        try:
+            result = await self._sender.send(lambda client: client.post_batch(items))
+        except Exception as e:
+            if not _rejected_by_server(e):
+                raise
+            if len(items) == 1:
+                print(f"[spool] dropping {items[0].get('kind')} record rejected by server: {e}")
+                return 1
+            mid = len(items) // 2
+            return await self._post_or_split(items[:mid]) + await self._post_or_split(items[mid:])
+        resend = self._resend_items(items, result.get("results") or [])
+        if resend:
+            self._resends += len(resend)
+            # States never come back as "resend", so this goes one level deep at most.
+            return await self._post_or_split(resend)
+        return 0
+
+    def stats(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"http": self._sender.stats(), "spool": None}
+        if self._spool is not None:
+            out["spool"] = {
+                **self._spool.stats(),
+                "batches": self._batches,
+                "send_failures": self._send_failures,
+                "resends": self._resends,
+            }
+        return out
+
+
+def default_spool_dir(name: str) -> Path:
+    return app_config.default_data_dir() / "spool" / name
+
+
+def _heartbeat_gap_seconds() -> float:
+    stale_after = app_config.default_stale_after_seconds()
+    return 60.0 if stale_after <= 0 else max(1.0, min(60.0, stale_after / 2.0))
+
+
+_OUTBOXES: dict[tuple[str, str], Outbox] = {}
+
+
+def shared_outbox(base_url: str, name: str) -> Outbox:
+    """Process-wide outbox for a watcher, spooling under <data dir>/spool/<name>."""
+    key = (base_url.rstrip("/"), name)
+    outbox = _OUTBOXES.get(key)
+    if outbox is not None:
+        return outbox
+
+    spool: Spool | None = None
+    if app_config.config_bool(("spool", "enabled"), env_var="ACTIVEWATCHER_SPOOL", default=True):
+        max_mb = app_config.config_int(("spool", "max_mb"), env_var="ACTIVEWATCHER_SPOOL_MAX_MB", default=64)
+        try:
+            spool = Spool(
+                default_spool_dir(name),
+                max_bytes=max(1, max_mb) << 20,
+                heartbeat_gap_seconds=_heartbeat_gap_seconds(),
+            )
+        except (SpoolBusyError, OSError) as e:
+            print(f"[spool] disabled for {name}: {e}")
+    outbox = Outbox(shared_sender(base_url), spool)
+    _OUTBOXES[key] = outbox
+    return outbox
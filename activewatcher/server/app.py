@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -10,10 +11,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
-from activewatcher.common.models import StateEvent
+from activewatcher.common.config import default_backup_compression, default_backup_dir
+from activewatcher.common.models import (
+    MetricSamples,
+    ProcessSamples,
+    StateBatch,
+    StateEvent,
+    StateSet,
+    TabDelta,
+    TouchEvent,
+)
 from activewatcher.common.time import parse_rfc3339, to_utc, utcnow
 
-from . import db, ingest, reports
+from . import backup, db, ingest, maintenance, metrics, processes, reports, tabs
 
 
 def _parse_dt_param(value: str | None, *, default: datetime) -> datetime:
@@ -50,7 +60,23 @@ def create_app(db_path: str | Path) -> FastAPI:
         finally:
             conn.close()
 
+    scheduler = maintenance.MaintenanceScheduler(db_path)
+    background: list[asyncio.Task] = []
+
+    @app.on_event("startup")
+    async def _start_maintenance() -> None:
+        background.append(asyncio.create_task(scheduler.run()))
+        background.append(asyncio.create_task(maintenance.run_stale_closer(db_path, scheduler.stats)))
+        background.append(asyncio.create_task(maintenance.run_event_retention(db_path, scheduler.stats)))
+
+    @app.on_event("shutdown")
+    async def _stop_maintenance() -> None:
+        for task in background:
+            task.cancel()
+        background.clear()
+
     def _get_conn():
+        scheduler.note_activity()
         conn = db.connect(db_path)
         try:
             yield conn
@@ -110,6 +136,28 @@ def create_app(db_path: str | Path) -> FastAPI:
             raise HTTPException(status_code=404, detail="asset not found")
         return _ui_response()
 
+    @app.get("/v1/admin/maintenance")
+    def get_maintenance() -> dict[str, Any]:
+        return scheduler.status()
+
+    @app.post("/v1/admin/backup")
+    def post_backup(
+        compression: str | None = Query(None, pattern="^(none|zstd)$"),
+        full_every: int = Query(7, ge=0, le=365),
+    ) -> dict[str, Any]:
+        # Always into the configured directory: the endpoint must not write anywhere a client picks.
+        try:
+            with scheduler.paused():
+                results = backup.backup_database(
+                    db_path,
+                    default_backup_dir(),
+                    compression=compression or default_backup_compression(),
+                    full_every=full_every,
+                )
+        except backup.BackupError as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+        return {"status": "ok", "dest": str(default_backup_dir()), "snapshots": [r.to_json() for r in results]}
+
     @app.post("/v1/state")
     def post_state(state: StateEvent, conn=Depends(_get_conn)) -> dict[str, Any]:
         try:
@@ -118,6 +166,86 @@ def create_app(db_path: str | Path) -> FastAPI:
             raise HTTPException(status_code=409, detail=str(e)) from e
         return {"status": "ok", **result.to_json()}
 
+    @app.post("/v1/touch")
+    def post_touch(touch: TouchEvent, conn=Depends(_get_conn)) -> dict[str, Any]:
+        try:
+            result = ingest.touch_state(conn, touch)
+        except ingest.StateMismatchError as e:
+            raise HTTPException(status_code=409, detail={"resend": True, "message": f"resend full state: {e}"}) from e
+        return {"status": "ok", **result.to_json()}
+
+    @app.post("/v1/state_set")
+    def post_state_set(state_set: StateSet, conn=Depends(_get_conn)) -> dict[str, Any]:
+        try:
+            result = ingest.ingest_state_set(conn, state_set)
+        except ingest.NonMonotonicTimestampError as e:
+            raise HTTPException(status_code=409, detail=str(e)) from e
+        return {"status": "ok", **result.to_json()}
+
+    @app.post("/v1/batch")
+    def post_batch(batch: StateBatch, conn=Depends(_get_conn)) -> dict[str, Any]:
+        result = ingest.ingest_batch(conn, batch.items)
+        return {"status": "ok", **result.to_json()}
+
+    @app.post("/v1/metrics")
+    def post_metrics(samples: MetricSamples, conn=Depends(_get_conn)) -> dict[str, Any]:
+        result = metrics.ingest_metrics(conn, samples)
+        return {"status": "ok", **result.to_json()}
+
+    @app.get("/v1/metrics")
+    def get_metrics(
+        name: str = Query(..., min_length=1),
+        source: str | None = Query(None),
+        from_ts: str | None = Query(None, alias="from"),
+        to_ts: str | None = Query(None, alias="to"),
+        step: int = Query(0, ge=0, le=31_536_000),
+        max_points: int = Query(2000, ge=1, le=20_000),
+        conn=Depends(_get_conn),
+    ) -> dict[str, Any]:
+        now = utcnow()
+        to_dt = _parse_dt_param(to_ts, default=now)
+        from_dt = _parse_dt_param(from_ts, default=(to_dt - timedelta(hours=24)))
+        return metrics.query_metric(
+            conn, name=name, source=source, from_ts=from_dt, to_ts=to_dt, step=step, max_points=max_points
+        )
+
+    @app.get("/v1/metrics/series")
+    def get_metric_series(conn=Depends(_get_conn)) -> dict[str, Any]:
+        return {"series": metrics.list_series(conn)}
+
+    @app.post("/v1/process_samples")
+    def post_process_samples(samples: ProcessSamples, conn=Depends(_get_conn)) -> dict[str, Any]:
+        result = processes.ingest_process_samples(conn, samples)
+        return {"status": "ok", **result.to_json()}
+
+    @app.get("/v1/processes/report")
+    def get_process_report(
+        from_ts: str | None = Query(None, alias="from"),
+        to_ts: str | None = Query(None, alias="to"),
+        source: str | None = Query(None),
+        battery_source: str | None = Query(None),
+        conn=Depends(_get_conn),
+    ) -> dict[str, Any]:
+        now = utcnow()
+        to_dt = _parse_dt_param(to_ts, default=now)
+        from_dt = _parse_dt_param(from_ts, default=(to_dt - timedelta(hours=24)))
+        return processes.process_report(
+            conn, from_ts=from_dt, to_ts=to_dt, source=source, battery_source=battery_source
+        )
+
+    @app.post("/v1/tabs/delta")
+    def post_tabs_delta(delta: TabDelta, conn=Depends(_get_conn)) -> dict[str, Any]:
+        try:
+            result = tabs.apply_tab_delta(conn, delta)
+        except tabs.TabSequenceGapError as e:
+            raise HTTPException(
+                status_code=409,
+                detail={"resync": True, "expected_seq": e.expected_seq, "message": str(e)},
+            ) from e
+        except ingest.NonMonotonicTimestampError as e:
+            raise HTTPException(status_code=409, detail={"resync": True, "message": str(e)}) from e
+        return {"status": "ok", **result.to_json()}
+
     @app.get("/v1/range")
     def get_range(
         bucket: str | None = Query(None),
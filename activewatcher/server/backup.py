@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Literal
+
+from activewatcher.common.time import to_rfc3339, utcnow
+
+from . import db, partitions
+
+# Pages copied per backup step; the source is only read, so ingest is never blocked, and
+# small steps keep each one to a few ms.
+_PAGES_PER_STEP = 256
+_DIGEST_SIZE = 16
+# A delta that changes more than this share of the pages is written as a full snapshot.
+_MAX_DELTA_SHARE = 0.5
+_DELTA_RECORD = struct.Struct(">I")
+_FORMAT = 1
+
+Compression = Literal["none", "zstd"]
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class SnapshotResult:
+    file: str
+    manifest: str
+    kind: Literal["full", "delta"]
+    page_count: int
+    changed_pages: int
+    bytes_written: int
+    seconds: float
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+def _zstd() -> Any:
+    try:
+        import zstandard  # type: ignore
+    except ImportError as e:
+        raise BackupError("zstd compression needs the `zstd` extra (pip install -e .[zstd])") from e
+    return zstandard
+
+
+@contextmanager
+def _open_write(path: Path, compression: Compression) -> Iterator[IO[bytes]]:
+    with path.open("wb") as f:
+        if compression == "zstd":
+            with _zstd().ZstdCompressor(level=3).stream_writer(f, closefd=False) as z:
+                yield z
+        else:
+            yield f
+
+
+@contextmanager
+def _open_read(path: Path, compression: Compression) -> Iterator[IO[bytes]]:
+    with path.open("rb") as f:
+        if compression == "zstd":
+            with _zstd().ZstdDecompressor().stream_reader(f) as z:
+                yield z
+        else:
+            yield f
+
+
+def _read_exact(f: IO[bytes], size: int) -> bytes:
+    chunks: list[bytes] = []
+    while size > 0:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _copy_online(src_path: Path, tmp_path: Path) -> int:
+    """Copy `src_path` to `tmp_path` with the backup API; returns the page size.
+
+    The source connection holds one read transaction for the whole copy, so every step
+    reads the same snapshot: writers carry on (WAL), and their commits neither show up in
+    the copy nor make the backup restart.
+    """
+    src = db.connect(src_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        src.backup(dst, pages=_PAGES_PER_STEP)
+        src.execute("COMMIT")
+        return int(dst.execute("PRAGMA page_size").fetchone()[0])
+    finally:
+        dst.close()
+        src.close()
+
+
+def _page_digests(path: Path, page_size: int) -> list[bytes]:
+    digests: list[bytes] = []
+    with path.open("rb") as f:
+        while page := f.read(page_size):
+            digests.append(hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest())
+    return digests
+
+
+def _manifests(dest_dir: Path, name: str) -> list[Path]:
+    # Stamps sort chronologically.
+    return sorted(dest_dir.glob(f"{name}.*.json"))
+
+
+def _load_manifest(path: Path) -> dict[str, Any]:
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        raise BackupError(f"unreadable backup manifest {path}: {e}") from e
+    if not isinstance(manifest, dict) or manifest.get("format") != _FORMAT:
+        raise BackupError(f"unsupported backup manifest {path}")
+    return manifest
+
+
+def _chain(manifest_path: Path) -> list[tuple[Path, dict[str, Any]]]:
+    """The full snapshot a manifest builds on, followed by its deltas up to the manifest."""
+    chain: list[tuple[Path, dict[str, Any]]] = []
+    path: Path | None = manifest_path
+    while path is not None:
+        manifest = _load_manifest(path)
+        chain.append((path, manifest))
+        if manifest["kind"] == "full":
+            break
+        base = manifest.get("base")
+        if not base:
+            raise BackupError(f"delta {path} has no base snapshot")
+        path = path.with_name(str(base))
+        if not path.is_file():
+            raise BackupError(f"base snapshot {path} of {manifest_path} is missing")
+    chain.reverse()
+    return chain
+
+
+def snapshot_file(
+    src_path: Path,
+    dest_dir: Path,
+    *,
+    compression: Compression = "none",
+    full_every: int = 7,
+    now: datetime | None = None,
+) -> SnapshotResult:
+    """Back up one database file into `dest_dir` as a full image or a page delta.
+
+    Each snapshot is `<file>.<stamp>.json` (manifest), `.hashes` (a digest per page, what
+    the next snapshot diffs against) and `.full`/`.delta` data, optionally zstd-compressed.
+    A delta holds only the pages whose digest changed since the previous snapshot of the
+    same file; every `full_every`-th snapshot (or one that changed most pages) is full.
+    """
+    t0 = time.monotonic()
+    if compression not in ("none", "zstd"):
+        raise BackupError(f"unknown compression {compression!r} (none or zstd)")
+    if compression == "zstd":
+        _zstd()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    name = src_path.name
+    stamp = (now or utcnow()).strftime("%Y%m%dT%H%M%S%f")[:-3] + "Z"
+    base_name = f"{name}.{stamp}"
+    tmp_path = dest_dir / f".{base_name}.tmp"
+    try:
+        page_size = _copy_online(src_path, tmp_path)
+        digests = _page_digests(tmp_path, page_size)
+
+        previous: tuple[Path, dict[str, Any]] | None = None
+        prev_digests: list[bytes] = []
+        existing = _manifests(dest_dir, name)
+        if existing:
+            prev_path = existing[-1]
+            prev = _load_manifest(prev_path)
+            hashes_path = prev_path.with_name(str(prev["hashes"]))
+            if prev["page_size"] == page_size and hashes_path.is_file():
+                raw = hashes_path.read_bytes()
+                prev_digests = [raw[i : i + _DIGEST_SIZE] for i in range(0, len(raw), _DIGEST_SIZE)]
+                previous = (prev_path, prev)
+
+        changed = [
+            pgno
+            for pgno, digest in enumerate(digests, start=1)
+            if pgno > len(prev_digests) or prev_digests[pgno - 1] != digest
+        ]
+        kind: Literal["full", "delta"] = "delta"
+        if previous is None or len(changed) > _MAX_DELTA_SHARE * max(1, len(digests)):
+            kind = "full"
+        elif full_every > 0 and len(_chain(previous[0])) >= full_every:
+            kind = "full"
+
+        suffix = ".zst" if compression == "zstd" else ""
+        data_path = dest_dir / f"{base_name}.{kind}{suffix}"
+        if kind == "full" and compression == "none":
+            os.replace(tmp_path, data_path)
+        elif kind == "full":
+            with tmp_path.open("rb") as src, _open_write(data_path, compression) as out:
+                while chunk := src.read(1 << 20):
+                    out.write(chunk)
+        else:
+            with tmp_path.open("rb") as src, _open_write(data_path, compression) as out:
+                for pgno in changed:
+                    src.seek((pgno - 1) * page_size)
+                    out.write(_DELTA_RECORD.pack(pgno))
+                    out.write(src.read(page_size))
+
+        hashes_path = dest_dir / f"{base_name}.hashes"
+        hashes_path.write_bytes(b"".join(digests))
+        manifest = {
+            "format": _FORMAT,
+            "file": name,
+            "created": to_rfc3339(now or utcnow()),
+            "kind": kind,
+            "base": previous[0].name if kind == "delta" and previous is not None else None,
+            "page_size": page_size,
+            "page_count": len(digests),
+            "changed_pages": len(changed) if kind == "delta" else len(digests),
+            "compression": compression,
+            "data": data_path.name,
+            "hashes": hashes_path.name,
+        }
+        manifest_path = dest_dir / f"{base_name}.json"
+        tmp_manifest = dest_dir / f".{base_name}.json.tmp"
+        tmp_manifest.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        # Last: a snapshot only exists (and is diffed against) once its manifest does.
+        os.replace(tmp_manifest, manifest_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return SnapshotResult(
+        file=name,
+        manifest=str(manifest_path),
+        kind=kind,
+        page_count=len(digests),
+        changed_pages=int(manifest["changed_pages"]),
+        bytes_written=data_path.stat().st_size + hashes_path.stat().st_size,
+        seconds=round(time.monotonic() - t0, 3),
+    )
+
+
+def backup_database(
+    db_path: str | Path,
+    dest_dir: str | Path,
+    *,
+    compression: Compression = "none",
+    full_every: int = 7,
+) -> list[SnapshotResult]:
+    """Snapshot the database and each of its monthly partition files (see partitions.py).
+
+    Sealed months rarely change, so their snapshots are usually empty deltas.
+    """
+    db_path = Path(db_path)
+    dest_dir = Path(dest_dir)
+    now = utcnow()
+    conn = db.connect(db_path)
+    try:
+        months = [str(r["month"]) for r in conn.execute("SELECT month FROM event_partitions ORDER BY month")]
+    finally:
+        conn.close()
+    files = [db_path] + [partitions.partition_path(db_path, m) for m in months]
+    return [
+        snapshot_file(path, dest_dir, compression=compression, full_every=full_every, now=now)
+        for path in files
+        if path.is_file()
+    ]
+
+
+def restore_snapshot(manifest_path: str | Path, target_path: str | Path) -> dict[str, Any]:
+    """Rebuild the database file a snapshot manifest describes at `target_path`."""
+    manifest_path = Path(manifest_path)
+    target_path = Path(target_path)
+    if target_path.exists():
+        raise BackupError(f"{target_path} already exists")
+    chain = _chain(manifest_path)
+    final = chain[-1][1]
+    page_size = int(final["page_size"])
+    tmp_path = target_path.with_name(f".{target_path.name}.restore")
+    try:
+        with tmp_path.open("wb") as out:
+            for path, manifest in chain:
+                data_path = path.with_name(str(manifest["data"]))
+                with _open_read(data_path, manifest["compression"]) as src:
+                    if manifest["kind"] == "full":
+                        out.seek(0)
+                        out.truncate()
+                        while chunk := src.read(1 << 20):
+                            out.write(chunk)
+                        continue
+                    while header := _read_exact(src, _DELTA_RECORD.size):
+                        (pgno,) = _DELTA_RECORD.unpack(header)
+                        out.seek((pgno - 1) * page_size)
+                        out.write(_read_exact(src, page_size))
+            out.truncate(int(final["page_count"]) * page_size)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            check = str(conn.execute("PRAGMA quick_check").fetchone()[0])
+        finally:
+            conn.close()
+        if check != "ok":
+            raise BackupError(f"restored database fails quick_check: {check}")
+        os.replace(tmp_path, target_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return {"target": str(target_path), "snapshots": len(chain), "page_count": int(final["page_count"])}
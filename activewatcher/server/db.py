@@ -3,21 +3,73 @@ from __future__ import annotations
 import sqlite3
 from pathlib import Path
 
-from activewatcher.common.config import ensure_parent_dir
+from activewatcher.common.config import default_wal_limit_mb, ensure_parent_dir
 
 
 def connect(db_path: str | Path) -> sqlite3.Connection:
     path = Path(db_path)
     ensure_parent_dir(path)
+    is_new = not path.exists() or path.stat().st_size == 0
     conn = sqlite3.connect(path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
+    if is_new:
+        # Has to come before journal_mode writes the header (and on an existing file it
+        # would write to the WAL on every connect); existing databases are converted once
+        # by the maintenance scheduler.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
     conn.execute("PRAGMA journal_mode = WAL;")
     conn.execute("PRAGMA synchronous = NORMAL;")
+    # Checkpoints that reset the WAL truncate it back to this size.
+    conn.execute(f"PRAGMA journal_size_limit = {default_wal_limit_mb() * 1024 * 1024};")
     return conn
 
 
-def init_db(conn: sqlite3.Connection) -> None:
+def _init_bucket_stats(conn: sqlite3.Connection) -> None:
+    """Longest closed interval per bucket, the bound behind reports' overlap queries.
+
+    Kept by triggers on every write path that closes or inserts a closed row (ingest, the
+    stale sweep, imports), so the maximum only grows; a fresh table is filled from the
+    existing rows once.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bucket_stats'"
+    ).fetchone()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bucket_stats (
+          bucket TEXT PRIMARY KEY,
+          max_seconds REAL NOT NULL
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    for name, event in (("trg_events_closed_insert", "INSERT"), ("trg_events_closed_update", "UPDATE OF end_ts")):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON events
+            WHEN NEW.end_ts IS NOT NULL
+            BEGIN
+              INSERT INTO bucket_stats(bucket, max_seconds)
+              VALUES (NEW.bucket, (julianday(NEW.end_ts) - julianday(NEW.start_ts)) * 86400.0)
+              ON CONFLICT(bucket) DO UPDATE SET max_seconds = max(max_seconds, excluded.max_seconds);
+            END
+            """.strip()
+        )
+    if exists is None:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO bucket_stats(bucket, max_seconds)
+            SELECT bucket, max((julianday(end_ts) - julianday(start_ts)) * 86400.0)
+              FROM events
+             WHERE end_ts IS NOT NULL
+             GROUP BY bucket
+            """.strip()
+        )
+        conn.commit()
+
+
+def init_events(conn: sqlite3.Connection) -> None:
+    """The events table with its indexes, bucket_stats and event_rollups (also the schema of partition files)."""
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS events (
@@ -43,3 +95,105 @@ def init_db(conn: sqlite3.Connection) -> None:
     )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_events_bucket_start ON events(bucket, start_ts)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_events_end ON events(end_ts)")
+    # Superseded by the bucket_stats start_ts bound; open rows use idx_events_end.
+    conn.execute("DROP INDEX IF EXISTS idx_events_bucket_end")
+    _init_bucket_stats(conn)
+    # Hourly totals of raw intervals folded away by retention rules (see retention.py).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_rollups (
+          hour_ts TEXT NOT NULL,
+          bucket TEXT NOT NULL,
+          source TEXT NOT NULL,
+          data_json TEXT NOT NULL,
+          seconds REAL NOT NULL,
+          PRIMARY KEY (hour_ts, bucket, source, data_json)
+        ) WITHOUT ROWID
+        """.strip()
+    )
+
+
+def init_db(conn: sqlite3.Connection) -> None:
+    init_events(conn)
+    # Months of closed events moved out to their own files (see partitions.py).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_partitions (
+          month TEXT PRIMARY KEY,
+          min_start_ts TEXT NOT NULL,
+          max_end_ts TEXT NOT NULL
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    # Latest last_seen_ts of each (bucket, source) among the moved rows, so ingest can
+    # reject backdated records without attaching partition files.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS partition_last_seen (
+          bucket TEXT NOT NULL,
+          source TEXT NOT NULL,
+          last_seen_ts TEXT NOT NULL,
+          PRIMARY KEY (bucket, source)
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tab_streams (
+          source TEXT PRIMARY KEY,
+          seq INTEGER NOT NULL,
+          tabs_json TEXT NOT NULL
+        )
+        """.strip()
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metric_series (
+          id INTEGER PRIMARY KEY,
+          source TEXT NOT NULL,
+          name TEXT NOT NULL,
+          UNIQUE(source, name)
+        )
+        """.strip()
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metric_samples (
+          series_id INTEGER NOT NULL REFERENCES metric_series(id),
+          ts_ms INTEGER NOT NULL,
+          value REAL NOT NULL,
+          PRIMARY KEY (series_id, ts_ms)
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+          series_id INTEGER NOT NULL REFERENCES metric_series(id),
+          step INTEGER NOT NULL,
+          bucket_ts INTEGER NOT NULL,
+          samples INTEGER NOT NULL,
+          min_value REAL NOT NULL,
+          max_value REAL NOT NULL,
+          sum_value REAL NOT NULL,
+          PRIMARY KEY (series_id, step, bucket_ts)
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS process_samples (
+          source TEXT NOT NULL,
+          ts_ms INTEGER NOT NULL,
+          event_id INTEGER,
+          app TEXT NOT NULL,
+          pid INTEGER NOT NULL,
+          interval_seconds REAL NOT NULL,
+          cpu_seconds REAL NOT NULL,
+          rss_bytes INTEGER NOT NULL,
+          processes INTEGER NOT NULL,
+          PRIMARY KEY (source, ts_ms)
+        ) WITHOUT ROWID
+        """.strip()
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_process_samples_ts ON process_samples(ts_ms)")
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
-import json
 import sqlite3
 from dataclasses import asdict, dataclass
-from typing import Literal
+from typing import Any, Literal
+
+from pydantic import ValidationError
 
 from activewatcher.common.config import default_stale_after_seconds
-from activewatcher.common.models import END_MARKER_KEY, StateEvent
+from activewatcher.common.models import (
+    END_MARKER_KEY,
+    BatchItem,
+    StateEvent,
+    StateSet,
+    TouchEvent,
+    state_data_hash,
+)
+from activewatcher.common.protocol import canonical_json
 from activewatcher.common.time import parse_rfc3339, to_rfc3339
 
 
@@ -14,6 +23,10 @@ class NonMonotonicTimestampError(ValueError):
     pass
 
 
+class StateMismatchError(ValueError):
+    pass
+
+
 @dataclass(frozen=True)
 class IngestResult:
     action: Literal["inserted", "refreshed", "rotated", "ended", "ended_noop"]
@@ -24,93 +37,156 @@ class IngestResult:
         return asdict(self)
 
 
-def _canonical_json(data: dict) -> str:
-    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+@dataclass(frozen=True)
+class BatchResult:
+    applied: int
+    skipped: int
+    results: list[str]
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class StateSetResult:
+    inserted: int
+    refreshed: int
+    rotated: int
+    ended: int
+
+    def to_json(self) -> dict:
+        return asdict(self)
 
 
 def ingest_state(conn: sqlite3.Connection, state: StateEvent) -> IngestResult:
-    bucket = state.bucket
-    source = state.source
-    ts = to_rfc3339(state.ts)
-    end_requested = state.data.get(END_MARKER_KEY) is True
-    data = dict(state.data)
-    data.pop(END_MARKER_KEY, None)
-    data_json = _canonical_json(data)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = ingest_state_in_tx(
+            conn,
+            bucket=state.bucket,
+            source=state.source,
+            ts=to_rfc3339(state.ts),
+            data=state.data,
+        )
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
 
+
+def touch_state(conn: sqlite3.Connection, touch: TouchEvent) -> IngestResult:
     conn.execute("BEGIN IMMEDIATE")
     try:
-        row = conn.execute(
-            """
-            SELECT id, start_ts, last_seen_ts, data_json
-              FROM events
-             WHERE bucket = ? AND source = ? AND end_ts IS NULL
-             LIMIT 1
-            """.strip(),
-            (bucket, source),
-        ).fetchone()
+        result = touch_state_in_tx(conn, touch)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def touch_state_in_tx(conn: sqlite3.Connection, touch: TouchEvent) -> IngestResult:
+    bucket = touch.bucket
+    source = touch.source
+    ts = to_rfc3339(touch.ts)
 
-        if end_requested:
-            if row is None:
-                conn.execute("COMMIT")
-                return IngestResult(action="ended_noop", previous_event_id=None, current_event_id=None)
+    row = conn.execute(
+        """
+        SELECT id, last_seen_ts, data_json
+          FROM events
+         WHERE bucket = ? AND source = ? AND end_ts IS NULL
+         LIMIT 1
+        """.strip(),
+        (bucket, source),
+    ).fetchone()
+    if row is None:
+        raise StateMismatchError(f"no open interval for ({bucket},{source})")
+    if touch.data_hash is not None and state_data_hash(str(row["data_json"])) != touch.data_hash:
+        raise StateMismatchError(f"data hash mismatch for ({bucket},{source})")
 
-            event_id = int(row["id"])
-            last_seen_ts = str(row["last_seen_ts"])
-            start_ts = str(row["start_ts"])
+    event_id = int(row["id"])
+    last_seen_ts = str(row["last_seen_ts"])
+    stale_after_seconds = default_stale_after_seconds()
+    if stale_after_seconds > 0 and ts > last_seen_ts:
+        gap_seconds = (parse_rfc3339(ts) - parse_rfc3339(last_seen_ts)).total_seconds()
+        if gap_seconds > stale_after_seconds:
+            # The interval has to be split at last_seen_ts, which needs the full state.
+            raise StateMismatchError(f"stale interval for ({bucket},{source})")
 
-            if ts < last_seen_ts:
-                raise NonMonotonicTimestampError(
-                    f"non-monotonic ts for end ({bucket},{source}): {ts} < {last_seen_ts}"
-                )
-            if ts < start_ts:
-                raise NonMonotonicTimestampError(
-                    f"non-monotonic ts for end ({bucket},{source}): {ts} < {start_ts}"
-                )
+    if ts > last_seen_ts:
+        conn.execute("UPDATE events SET last_seen_ts = ? WHERE id = ?", (ts, event_id))
+    return IngestResult(action="refreshed", previous_event_id=event_id, current_event_id=event_id)
 
-            conn.execute("UPDATE events SET end_ts = ?, last_seen_ts = ? WHERE id = ?", (ts, ts, event_id))
-            conn.execute("COMMIT")
-            return IngestResult(action="ended", previous_event_id=event_id, current_event_id=None)
 
+def ingest_state_in_tx(
+    conn: sqlite3.Connection,
+    *,
+    bucket: str,
+    source: str,
+    ts: str,
+    data: dict[str, Any],
+) -> IngestResult:
+    # Caller owns the transaction (see ingest_state); this lets several ingests share one commit.
+    end_requested = data.get(END_MARKER_KEY) is True
+    data = dict(data)
+    data.pop(END_MARKER_KEY, None)
+    data_json = canonical_json(data)
+
+    row = conn.execute(
+        """
+        SELECT id, start_ts, last_seen_ts, data_json
+          FROM events
+         WHERE bucket = ? AND source = ? AND end_ts IS NULL
+         LIMIT 1
+        """.strip(),
+        (bucket, source),
+    ).fetchone()
+
+    if end_requested:
         if row is None:
-            cur = conn.execute(
-                """
-                INSERT INTO events(bucket, source, start_ts, end_ts, last_seen_ts, data_json)
-                VALUES (?, ?, ?, NULL, ?, ?)
-                """.strip(),
-                (bucket, source, ts, ts, data_json),
-            )
-            event_id = int(cur.lastrowid)
-            conn.execute("COMMIT")
-            return IngestResult(action="inserted", previous_event_id=None, current_event_id=event_id)
+            return IngestResult(action="ended_noop", previous_event_id=None, current_event_id=None)
 
         event_id = int(row["id"])
         last_seen_ts = str(row["last_seen_ts"])
         start_ts = str(row["start_ts"])
-        stale_after_seconds = default_stale_after_seconds()
-        stale_gap = False
-        if stale_after_seconds > 0 and ts > last_seen_ts:
-            # If the source was silent for too long (e.g. reboot/suspend), split the interval
-            # at the last seen timestamp instead of bridging the offline gap as runtime.
-            gap_seconds = (parse_rfc3339(ts) - parse_rfc3339(last_seen_ts)).total_seconds()
-            stale_gap = gap_seconds > stale_after_seconds
-
-        if str(row["data_json"]) == data_json and not stale_gap:
-            if ts > last_seen_ts:
-                conn.execute("UPDATE events SET last_seen_ts = ? WHERE id = ?", (ts, event_id))
-            conn.execute("COMMIT")
-            return IngestResult(action="refreshed", previous_event_id=event_id, current_event_id=event_id)
-
-        if ts <= last_seen_ts:
+
+        if ts < last_seen_ts:
             raise NonMonotonicTimestampError(
-                f"non-monotonic ts for ({bucket},{source}): {ts} <= {last_seen_ts}"
+                f"non-monotonic ts for end ({bucket},{source}): {ts} < {last_seen_ts}"
             )
-        if ts <= start_ts:
+        if ts < start_ts:
             raise NonMonotonicTimestampError(
-                f"non-monotonic ts for ({bucket},{source}): {ts} <= {start_ts}"
+                f"non-monotonic ts for end ({bucket},{source}): {ts} < {start_ts}"
             )
 
-        end_ts = last_seen_ts if stale_gap else ts
-        conn.execute("UPDATE events SET end_ts = ?, last_seen_ts = ? WHERE id = ?", (end_ts, end_ts, event_id))
+        conn.execute("UPDATE events SET end_ts = ?, last_seen_ts = ? WHERE id = ?", (ts, ts, event_id))
+        return IngestResult(action="ended", previous_event_id=event_id, current_event_id=None)
+
+    if row is None:
+        # The source's last interval may have been closed by the stale sweep (or an end
+        # marker), and moved to a partition file since; a replayed or backdated record must
+        # not reopen time it already covers.
+        last = conn.execute(
+            """
+            SELECT max(last_seen_ts) AS last_seen_ts FROM (
+              SELECT * FROM (
+                SELECT last_seen_ts
+                  FROM events
+                 WHERE bucket = ? AND source = ?
+                 ORDER BY start_ts DESC
+                 LIMIT 1
+              )
+              UNION ALL
+              SELECT last_seen_ts FROM partition_last_seen WHERE bucket = ? AND source = ?
+            )
+            """.strip(),
+            (bucket, source, bucket, source),
+        ).fetchone()
+        if last["last_seen_ts"] is not None and ts <= str(last["last_seen_ts"]):
+            raise NonMonotonicTimestampError(
+                f"non-monotonic ts for ({bucket},{source}): {ts} <= {last['last_seen_ts']}"
+            )
         cur = conn.execute(
             """
             INSERT INTO events(bucket, source, start_ts, end_ts, last_seen_ts, data_json)
@@ -118,9 +194,155 @@ def ingest_state(conn: sqlite3.Connection, state: StateEvent) -> IngestResult:
             """.strip(),
             (bucket, source, ts, ts, data_json),
         )
-        new_id = int(cur.lastrowid)
+        event_id = int(cur.lastrowid)
+        return IngestResult(action="inserted", previous_event_id=None, current_event_id=event_id)
+
+    event_id = int(row["id"])
+    last_seen_ts = str(row["last_seen_ts"])
+    start_ts = str(row["start_ts"])
+    stale_after_seconds = default_stale_after_seconds()
+    stale_gap = False
+    if stale_after_seconds > 0 and ts > last_seen_ts:
+        # If the source was silent for too long (e.g. reboot/suspend), split the interval
+        # at the last seen timestamp instead of bridging the offline gap as runtime.
+        gap_seconds = (parse_rfc3339(ts) - parse_rfc3339(last_seen_ts)).total_seconds()
+        stale_gap = gap_seconds > stale_after_seconds
+
+    if str(row["data_json"]) == data_json and not stale_gap:
+        if ts > last_seen_ts:
+            conn.execute("UPDATE events SET last_seen_ts = ? WHERE id = ?", (ts, event_id))
+        return IngestResult(action="refreshed", previous_event_id=event_id, current_event_id=event_id)
+
+    if ts <= last_seen_ts:
+        raise NonMonotonicTimestampError(
+            f"non-monotonic ts for ({bucket},{source}): {ts} <= {last_seen_ts}"
+        )
+    if ts <= start_ts:
+        raise NonMonotonicTimestampError(
+            f"non-monotonic ts for ({bucket},{source}): {ts} <= {start_ts}"
+        )
+
+    end_ts = last_seen_ts if stale_gap else ts
+    conn.execute("UPDATE events SET end_ts = ?, last_seen_ts = ? WHERE id = ?", (end_ts, end_ts, event_id))
+    cur = conn.execute(
+        """
+        INSERT INTO events(bucket, source, start_ts, end_ts, last_seen_ts, data_json)
+        VALUES (?, ?, ?, NULL, ?, ?)
+        """.strip(),
+        (bucket, source, ts, ts, data_json),
+    )
+    new_id = int(cur.lastrowid)
+    return IngestResult(action="rotated", previous_event_id=event_id, current_event_id=new_id)
+
+
+def member_source(set_source: str, key: str) -> str:
+    return f"{set_source}:{key}"
+
+
+def ingest_state_set(conn: sqlite3.Connection, state_set: StateSet) -> StateSetResult:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = ingest_state_set_in_tx(conn, state_set)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def ingest_state_set_in_tx(conn: sqlite3.Connection, state_set: StateSet) -> StateSetResult:
+    bucket = state_set.bucket
+    prefix = member_source(state_set.source, "")
+    ts = to_rfc3339(state_set.ts)
+    counts = {"inserted": 0, "refreshed": 0, "rotated": 0, "ended": 0}
+
+    # ';' sorts right after ':', so this range is exactly the "<source>:" prefix.
+    open_rows = conn.execute(
+        """
+        SELECT source
+          FROM events
+         WHERE bucket = ? AND end_ts IS NULL AND source >= ? AND source < ?
+        """.strip(),
+        (bucket, prefix, prefix[:-1] + ";"),
+    ).fetchall()
+    wanted = {member_source(state_set.source, key): data for key, data in state_set.items.items()}
+
+    for row in open_rows:
+        source = str(row["source"])
+        if source in wanted:
+            continue
+        ingest_state_in_tx(conn, bucket=bucket, source=source, ts=ts, data={END_MARKER_KEY: True})
+        counts["ended"] += 1
+
+    for source in sorted(wanted):
+        result = ingest_state_in_tx(conn, bucket=bucket, source=source, ts=ts, data=wanted[source])
+        counts[result.action] += 1
+
+    return StateSetResult(**counts)
+
+
+def _ingest_batch_item(conn: sqlite3.Connection, item: BatchItem) -> str:
+    if item.kind == "metrics":
+        from .metrics import ingest_metric_item_in_tx
+
+        ingest_metric_item_in_tx(conn, item.payload)
+        return "metrics"
+    if item.kind == "process":
+        from .processes import ingest_process_item_in_tx
+
+        ingest_process_item_in_tx(conn, item.payload)
+        return "process"
+    if item.kind == "set":
+        ingest_state_set_in_tx(conn, StateSet.model_validate(item.payload))
+        return "set"
+    if item.kind == "touch" and "data" not in item.payload:
+        try:
+            return touch_state_in_tx(conn, TouchEvent.model_validate(item.payload)).action
+        except StateMismatchError:
+            # The sender keeps the full state and posts it in a follow-up batch.
+            return "resend"
+    state = StateEvent.model_validate(item.payload)
+    ts = to_rfc3339(state.ts)
+    if item.kind == "touch":
+        # Spooled by an older watcher, with the full state instead of its hash.
+        touch = TouchEvent(bucket=state.bucket, source=state.source, ts=state.ts, data_hash=state_data_hash(state.data))
+        try:
+            return touch_state_in_tx(conn, touch).action
+        except StateMismatchError:
+            pass
+    return ingest_state_in_tx(conn, bucket=state.bucket, source=state.source, ts=ts, data=state.data).action
+
+
+def ingest_batch(conn: sqlite3.Connection, items: list[BatchItem]) -> BatchResult:
+    """Apply spooled watcher records in order within one transaction.
+
+    Items that can't apply (typically a replay of records already ingested before a lost
+    response, which is non-monotonic by now) are skipped without affecting the rest, and so
+    is an item whose data breaks an ingest helper ("error"): retrying it would fail the same
+    way and hold up every record queued behind it. A touch whose interval is gone comes back
+    as "resend". Database errors such as a full disk still fail the whole batch.
+    """
+    results: list[str] = []
+    applied = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for item in items:
+            conn.execute("SAVEPOINT batch_item")
+            try:
+                result = _ingest_batch_item(conn, item)
+            except (NonMonotonicTimestampError, ValidationError):
+                conn.execute("ROLLBACK TO SAVEPOINT batch_item")
+                result = "skipped"
+            except (sqlite3.IntegrityError, ValueError, KeyError, TypeError) as e:
+                conn.execute("ROLLBACK TO SAVEPOINT batch_item")
+                print(f"[server] batch item {item.kind} failed: {type(e).__name__}: {e}")
+                result = "error"
+            conn.execute("RELEASE SAVEPOINT batch_item")
+            results.append(result)
+            if result not in ("skipped", "error", "resend"):
+                applied += 1
         conn.execute("COMMIT")
-        return IngestResult(action="rotated", previous_event_id=event_id, current_event_id=new_id)
     except Exception:
         conn.execute("ROLLBACK")
         raise
+    return BatchResult(applied=applied, skipped=len(items) - applied, results=results)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import socket
+import stat
+from pathlib import Path
+from typing import Any
+
+from activewatcher.common.config import ensure_parent_dir
+
+
+def remove_unix_socket(path: Path) -> None:
+    try:
+        if stat.S_ISSOCK(path.lstat().st_mode):
+            path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def bind_unix_socket(path: Path) -> socket.socket:
+    """Bind a listening unix socket readable and writable by the owner only.
+
+    Filesystem permissions are the access control here: only the user running the server
+    (and root) can connect, unlike the loopback TCP port.
+    """
+    ensure_parent_dir(path)
+    remove_unix_socket(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        sock.bind(str(path))
+    except Exception:
+        sock.close()
+        raise
+    finally:
+        os.umask(old_umask)
+    os.chmod(path, 0o600)
+    sock.listen(128)
+    return sock
+
+
+def bind_tcp_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind((host, port))
+    except Exception:
+        sock.close()
+        raise
+    sock.listen(2048)
+    return sock
+
+
+def run_on_sockets(api: Any, *, sockets: list[socket.socket], unix_path: Path | None, log_level: str) -> None:
+    import uvicorn
+
+    class _Server(uvicorn.Server):
+        async def shutdown(self, sockets: list[socket.socket] | None = None) -> None:
+            await super().shutdown(sockets=sockets)
+            # uvicorn re-raises the captured SIGTERM/SIGINT once serving stops, so clean up here
+            # rather than after run() returns.
+            if unix_path is not None:
+                remove_unix_socket(unix_path)
+
+    try:
+        _Server(uvicorn.Config(api, log_level=log_level)).run(sockets=sockets)
+    finally:
+        for sock in sockets:
+            sock.close()
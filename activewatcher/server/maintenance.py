@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from activewatcher.common.config import (
+    default_checkpoint_seconds,
+    default_metric_raw_days,
+    default_optimize_seconds,
+    default_partition_events,
+    default_partition_retention_months,
+    default_stale_after_seconds,
+    default_stale_sweep_seconds,
+    default_vacuum_convert,
+    default_wal_limit_mb,
+)
+from activewatcher.common.time import to_rfc3339, utcnow
+
+from . import db, metrics, partitions, retention
+
+_RETENTION_PASS_SECONDS = 3600
+# Pause between chunks, so ingest gets the write lock in between.
+_RETENTION_CHUNK_PAUSE_SECONDS = 0.05
+
+_TICK_SECONDS = 5.0
+# No request for this long counts as idle: time for checkpoints that wait for readers
+# and for vacuuming.
+_IDLE_SECONDS = 10.0
+# How long a truncating checkpoint may hold up writers while waiting for readers.
+_TRUNCATE_BUSY_MS = 250
+_VACUUM_MIN_FREE_PAGES = 256
+_VACUUM_STEP_PAGES = 2048
+_VACUUM_PASS_SECONDS = 600
+# SQLite >= 3.46 can check every table from a fresh connection (0x10000); older versions
+# only consider tables the same connection queried, so they get a bounded ANALYZE.
+_OPTIMIZE_ALL_TABLES_VERSION = (3, 46, 0)
+_ANALYSIS_LIMIT = 1000
+
+
+@dataclass
+class TaskStats:
+    runs: int = 0
+    errors: int = 0
+    last_started: str | None = None
+    last_ms: float | None = None
+    max_ms: float = 0.0
+    total_ms: float = 0.0
+    last_result: Any = None
+    last_error: str | None = None
+
+
+class MaintenanceStats:
+    """Timings and last results of the maintenance tasks, for GET /v1/admin/maintenance."""
+
+    def __init__(self) -> None:
+        self.tasks: dict[str, TaskStats] = {}
+
+    async def timed(self, name: str, work: Awaitable[Any]) -> Any:
+        """Await `work` and record it; sqlite errors are logged, not raised."""
+        stats = self.tasks.setdefault(name, TaskStats())
+        stats.last_started = to_rfc3339(utcnow())
+        t0 = time.perf_counter()
+        try:
+            result = await work
+        except sqlite3.Error as e:
+            stats.errors += 1
+            stats.last_error = str(e)
+            print(f"[server] maintenance task {name} failed: {e}")
+            result = None
+        else:
+            stats.last_result = result
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        stats.runs += 1
+        stats.last_ms = round(elapsed_ms, 3)
+        stats.max_ms = round(max(stats.max_ms, elapsed_ms), 3)
+        stats.total_ms = round(stats.total_ms + elapsed_ms, 3)
+        return result
+
+    def to_json(self) -> dict[str, Any]:
+        return {name: asdict(stats) for name, stats in sorted(self.tasks.items())}
+
+
+def _with_conn(db_path: str | Path, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+    conn = db.connect(db_path)
+    try:
+        return fn(conn)
+    finally:
+        conn.close()
+
+
+def close_stale_intervals(
+    conn: sqlite3.Connection, *, stale_after_seconds: int, now: datetime | None = None
+) -> int:
+    """End open intervals not seen for `stale_after_seconds` at their `last_seen_ts`.
+
+    This is the split ingest would make once the source posts again, done ahead of time so
+    the open-row set stays small and range queries need no query-time clipping. A record
+    that still arrives for a closed interval (say, replayed from a watcher's spool) is
+    rejected as non-monotonic if it is not newer than `last_seen_ts`, as it would be while
+    the interval was open; a newer one starts a new interval.
+    """
+    if stale_after_seconds <= 0:
+        return 0
+    cutoff = to_rfc3339((now or utcnow()) - timedelta(seconds=stale_after_seconds))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Served by the partial idx_events_open_unique index (end_ts IS NULL).
+        cur = conn.execute(
+            "UPDATE events SET end_ts = last_seen_ts WHERE end_ts IS NULL AND last_seen_ts < ?",
+            (cutoff,),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cur.rowcount
+
+
+async def run_stale_closer(db_path: str | Path, stats: MaintenanceStats) -> None:
+    """Close stale intervals every `[server] stale_sweep_seconds` (0 disables).
+
+    The first sweep waits one staleness period after startup, so watchers that were
+    spooling while the server was down get to drain and refresh their intervals first.
+    """
+    sweep_seconds = default_stale_sweep_seconds()
+    stale_after_seconds = default_stale_after_seconds()
+    if sweep_seconds <= 0 or stale_after_seconds <= 0:
+        return
+
+    await asyncio.sleep(stale_after_seconds)
+    while True:
+        await stats.timed(
+            "stale_sweep",
+            asyncio.to_thread(
+                _with_conn, db_path, lambda conn: close_stale_intervals(conn, stale_after_seconds=stale_after_seconds)
+            ),
+        )
+        await asyncio.sleep(sweep_seconds)
+
+
+async def run_event_retention(db_path: str | Path, stats: MaintenanceStats) -> None:
+    """Hourly pass over old events: monthly partitions and per-bucket retention rules.
+
+    With `[server] partition_events`, closed events of past months move to monthly files
+    (the first pass also migrates an existing single-file database) and months past
+    `partition_retention_months` are dropped as files. Then `[server.retention.<bucket>]`
+    rules fold old raw intervals into hourly rollups and expire old rollups, and raw metric
+    samples past `metric_raw_days` are deleted. All of it runs a chunk per transaction with
+    a pause in between, so ingest never waits long.
+    """
+    partitioned = default_partition_events()
+    retention_months = default_partition_retention_months()
+    rules = retention.retention_rules()
+    metric_raw_days = default_metric_raw_days()
+    if not partitioned and not rules and metric_raw_days <= 0:
+        return
+
+    async def _chunks(fn: Callable[[sqlite3.Connection], int]) -> int:
+        total = 0
+        while True:
+            n = await asyncio.to_thread(_with_conn, db_path, fn)
+            if n <= 0:
+                return total
+            total += n
+            await asyncio.sleep(_RETENTION_CHUNK_PAUSE_SECONDS)
+
+    if partitioned:
+        await stats.timed("partition_last_seen", asyncio.to_thread(_with_conn, db_path, partitions.backfill_last_seen))
+    while True:
+        if partitioned:
+            await stats.timed(
+                "partition_drop",
+                asyncio.to_thread(
+                    _with_conn,
+                    db_path,
+                    lambda conn: partitions.drop_expired_partitions(conn, retention_months=retention_months),
+                ),
+            )
+            await stats.timed(
+                "partition_move",
+                _chunks(lambda conn: partitions.move_closed_rows(conn, retention_months=retention_months)),
+            )
+        if rules:
+            # After the move, so no row is folded while it still has a copy in the other file.
+            await stats.timed("retention_fold", _chunks(lambda conn: retention.apply_retention_chunk(conn, rules)))
+        if metric_raw_days > 0:
+            await stats.timed(
+                "metric_prune", _chunks(lambda conn: metrics.prune_raw_samples(conn, raw_days=metric_raw_days))
+            )
+        await asyncio.sleep(_RETENTION_PASS_SECONDS)
+
+
+def checkpoint(conn: sqlite3.Connection, mode: str) -> dict[str, int]:
+    """`PRAGMA wal_checkpoint(mode)`; busy=1 means readers or writers kept it from finishing."""
+    row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return {"busy": int(row[0]), "wal_pages": int(row[1]), "checkpointed_pages": int(row[2])}
+
+
+def optimize(conn: sqlite3.Connection) -> str:
+    conn.execute(f"PRAGMA analysis_limit = {_ANALYSIS_LIMIT}")
+    if sqlite3.sqlite_version_info >= _OPTIMIZE_ALL_TABLES_VERSION:
+        conn.execute("PRAGMA optimize = 0x10002")
+        return "optimize"
+    conn.execute("ANALYZE")
+    conn.commit()
+    return "analyze"
+
+
+def incremental_vacuum(conn: sqlite3.Connection, *, max_pages: int) -> int:
+    """Return up to `max_pages` free pages per file (main, then partitions) to the filesystem.
+
+    Only files created with auto_vacuum=INCREMENTAL can do this. Returns the pages freed.
+    """
+
+    def _vacuum(schema: str) -> int:
+        if int(conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0]) != 2:
+            return 0
+        free = int(conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0])
+        if free < _VACUUM_MIN_FREE_PAGES:
+            return 0
+        # Each step of the statement frees one page, and execute() stops after the first step
+        # of a statement without result rows; executescript() runs it to completion.
+        conn.executescript(f"PRAGMA {schema}.incremental_vacuum({min(free, max_pages)});")
+        return free - int(conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0])
+
+    freed = _vacuum("main")
+    for schema in partitions.all_partitions(conn):
+        freed += _vacuum(schema)
+    return freed
+
+
+def convert_auto_vacuum(conn: sqlite3.Connection) -> bool:
+    """Switch a database created without auto_vacuum to INCREMENTAL; rewrites the whole file."""
+    if int(conn.execute("PRAGMA auto_vacuum").fetchone()[0]) != 0:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+class MaintenanceScheduler:
+    """Checkpoints, statistics and vacuuming for the server's database.
+
+    Every tick it runs the first due of:
+    - a truncating checkpoint once no request came for a while, or right away when the WAL
+      has outgrown `[server] wal_limit_mb` (long reads kept passive checkpoints from
+      resetting it). It waits for readers for at most _TRUNCATE_BUSY_MS.
+    - a passive checkpoint every `checkpoint_seconds`, which never waits.
+    It also runs PRAGMA optimize every `optimize_seconds`. While idle it runs incremental
+    vacuum in steps, plus, if `vacuum_convert` opts in, a one-off VACUUM that switches an
+    existing database to auto_vacuum=INCREMENTAL; it blocks writers for the whole rewrite.
+    """
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self.stats = MaintenanceStats()
+        self.checkpoint_seconds = default_checkpoint_seconds()
+        self.optimize_seconds = default_optimize_seconds()
+        self.wal_limit_bytes = default_wal_limit_mb() * 1024 * 1024
+        self.vacuum_convert = default_vacuum_convert()
+        self._last_activity = time.monotonic()
+        self._paused = 0
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """Hold off truncating checkpoints and vacuuming, e.g. while a backup pins a snapshot.
+
+        A truncating checkpoint would hold up writers waiting for that reader to finish.
+        """
+        self._paused += 1
+        try:
+            yield
+        finally:
+            self._paused -= 1
+
+    def note_activity(self) -> None:
+        self._last_activity = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self._last_activity
+
+    def wal_bytes(self) -> int:
+        try:
+            return os.path.getsize(f"{self.db_path}-wal")
+        except OSError:
+            return 0
+
+    def _in_thread(self, fn: Callable[[sqlite3.Connection], Any], *, busy_ms: int | None = None) -> Awaitable[Any]:
+        def _run(conn: sqlite3.Connection) -> Any:
+            if busy_ms is not None:
+                conn.execute(f"PRAGMA busy_timeout = {busy_ms}")
+            return fn(conn)
+
+        return asyncio.to_thread(_with_conn, self.db_path, _run)
+
+    async def run(self) -> None:
+        start = time.monotonic()
+        last_passive = start
+        last_optimize = start - self.optimize_seconds
+        last_vacuum = start - _VACUUM_PASS_SECONDS
+        vacuum_pending = False
+        converted = not self.vacuum_convert
+        while True:
+            await asyncio.sleep(_TICK_SECONDS)
+            now = time.monotonic()
+            idle = self.idle_seconds() >= _IDLE_SECONDS and not self._paused
+            wal = self.wal_bytes()
+
+            if not self._paused and (wal > self.wal_limit_bytes or (idle and wal > 0)):
+                await self.stats.timed(
+                    "checkpoint_truncate",
+                    self._in_thread(lambda conn: checkpoint(conn, "TRUNCATE"), busy_ms=_TRUNCATE_BUSY_MS),
+                )
+                last_passive = now
+            elif self.checkpoint_seconds > 0 and wal > 0 and now - last_passive >= self.checkpoint_seconds:
+                await self.stats.timed("checkpoint_passive", self._in_thread(lambda conn: checkpoint(conn, "PASSIVE")))
+                last_passive = now
+
+            if self.optimize_seconds > 0 and now - last_optimize >= self.optimize_seconds:
+                await self.stats.timed("optimize", self._in_thread(optimize))
+                last_optimize = now
+
+            if not idle:
+                continue
+            if not converted:
+                converted = True
+                print(f"[server] converting {self.db_path} to auto_vacuum=INCREMENTAL (one-off VACUUM)")
+                await self.stats.timed("vacuum_convert", self._in_thread(convert_auto_vacuum))
+            elif vacuum_pending or now - last_vacuum >= _VACUUM_PASS_SECONDS:
+                freed = await self.stats.timed(
+                    "incremental_vacuum",
+                    self._in_thread(lambda conn: incremental_vacuum(conn, max_pages=_VACUUM_STEP_PAGES)),
+                )
+                # Keep stepping on the following idle ticks until a step comes up short.
+                vacuum_pending = bool(freed) and freed >= _VACUUM_STEP_PAGES
+                last_vacuum = now
+
+    def status(self) -> dict[str, Any]:
+        def _database(conn: sqlite3.Connection) -> dict[str, Any]:
+            def pragma(name: str) -> int:
+                return int(conn.execute(f"PRAGMA {name}").fetchone()[0])
+
+            page_size = pragma("page_size")
+            return {
+                "sqlite_version": sqlite3.sqlite_version,
+                "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(pragma("auto_vacuum"), "unknown"),
+                "page_size": page_size,
+                "page_count": pragma("page_count"),
+                "freelist_count": pragma("freelist_count"),
+                "file_bytes": pragma("page_count") * page_size,
+                "wal_bytes": self.wal_bytes(),
+                "wal_limit_bytes": self.wal_limit_bytes,
+                "partitions": int(conn.execute("SELECT count(*) FROM event_partitions").fetchone()[0]),
+            }
+
+        return {
+            "idle_seconds": round(self.idle_seconds(), 3),
+            "database": _with_conn(self.db_path, _database),
+            "tasks": self.stats.to_json(),
+        }
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import math
+import sqlite3
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any
+
+from activewatcher.common.config import default_metric_raw_days
+from activewatcher.common.models import MetricSamples
+from activewatcher.common.time import to_rfc3339, utcnow
+
+# Rollup resolutions kept for every series (seconds, aligned to the Unix epoch / UTC).
+ROLLUP_STEPS = (60, 3600, 86400)
+# Steps `step=0` picks from, smallest first, to stay within `max_points`.
+AUTO_STEPS = (60, 300, 900, 3600, 6 * 3600, 86400, 7 * 86400)
+_PRUNE_CHUNK_ROWS = 5000
+
+
+@dataclass(frozen=True)
+class MetricIngestResult:
+    inserted: int
+    duplicates: int
+    rejected: int
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+def _series_ids(conn: sqlite3.Connection, source: str, names: set[str]) -> dict[str, int]:
+    conn.executemany(
+        "INSERT OR IGNORE INTO metric_series(source, name) VALUES (?, ?)",
+        [(source, name) for name in sorted(names)],
+    )
+    placeholders = ",".join("?" for _ in names)
+    rows = conn.execute(
+        f"SELECT id, name FROM metric_series WHERE source = ? AND name IN ({placeholders})",
+        (source, *sorted(names)),
+    ).fetchall()
+    return {str(r["name"]): int(r["id"]) for r in rows}
+
+
+def ingest_points_in_tx(
+    conn: sqlite3.Connection, *, source: str, points: list[tuple[datetime, dict[str, float]]]
+) -> MetricIngestResult:
+    """Append samples and fold them into the 1m/1h/1d rollups.
+
+    Samples are keyed by (series, millisecond timestamp), so replaying a batch after a lost
+    response neither duplicates raw rows nor double-counts rollups. Samples older than
+    `[server] metric_raw_days` are rejected: their raw rows may already be pruned, so a
+    replay could no longer be recognized.
+    """
+    names = {name for _ts, values in points for name in values}
+    if not names:
+        return MetricIngestResult(inserted=0, duplicates=0, rejected=0)
+    series = _series_ids(conn, source, names)
+    horizon_ms = _raw_horizon_ms(default_metric_raw_days())
+
+    inserted = duplicates = rejected = 0
+    # (series_id, step, bucket_ts) -> [samples, min, max, sum]
+    rollups: dict[tuple[int, int, int], list[float]] = {}
+    for ts, values in points:
+        ts_ms = int(round(ts.timestamp() * 1000))
+        ts_s = ts_ms // 1000
+        for name, value in values.items():
+            value = float(value)
+            if not math.isfinite(value) or ts_ms < horizon_ms:
+                rejected += 1
+                continue
+            series_id = series[name]
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO metric_samples(series_id, ts_ms, value) VALUES (?, ?, ?)",
+                (series_id, ts_ms, value),
+            )
+            if cur.rowcount == 0:
+                duplicates += 1
+                continue
+            inserted += 1
+            for step in ROLLUP_STEPS:
+                key = (series_id, step, ts_s - ts_s % step)
+                acc = rollups.get(key)
+                if acc is None:
+                    rollups[key] = [1, value, value, value]
+                else:
+                    acc[0] += 1
+                    acc[1] = min(acc[1], value)
+                    acc[2] = max(acc[2], value)
+                    acc[3] += value
+
+    if rollups:
+        conn.executemany(
+            """
+            INSERT INTO metric_rollups(series_id, step, bucket_ts, samples, min_value, max_value, sum_value)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(series_id, step, bucket_ts) DO UPDATE SET
+              samples = samples + excluded.samples,
+              min_value = min(min_value, excluded.min_value),
+              max_value = max(max_value, excluded.max_value),
+              sum_value = sum_value + excluded.sum_value
+            """.strip(),
+            [(*key, int(acc[0]), acc[1], acc[2], acc[3]) for key, acc in rollups.items()],
+        )
+    return MetricIngestResult(inserted=inserted, duplicates=duplicates, rejected=rejected)
+
+
+def _raw_horizon_ms(raw_days: int) -> int:
+    if raw_days <= 0:
+        return 0
+    return int(utcnow().timestamp() * 1000) - raw_days * 86400 * 1000
+
+
+def prune_raw_samples(conn: sqlite3.Connection, *, raw_days: int, limit: int = _PRUNE_CHUNK_ROWS) -> int:
+    """Delete up to `limit` raw samples older than `raw_days`; their rollups stay."""
+    horizon_ms = _raw_horizon_ms(raw_days)
+    if horizon_ms <= 0:
+        return 0
+    deleted = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Per series, so each delete is a range on the primary key rather than a table scan.
+        for row in conn.execute("SELECT id FROM metric_series ORDER BY id").fetchall():
+            cur = conn.execute(
+                """
+                DELETE FROM metric_samples
+                 WHERE series_id = ? AND ts_ms IN (
+                   SELECT ts_ms FROM metric_samples WHERE series_id = ? AND ts_ms < ? LIMIT ?
+                 )
+                """.strip(),
+                (int(row["id"]), int(row["id"]), horizon_ms, limit - deleted),
+            )
+            deleted += cur.rowcount
+            if deleted >= limit:
+                break
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return deleted
+
+
+def ingest_metric_item_in_tx(conn: sqlite3.Connection, payload: dict[str, Any]) -> MetricIngestResult:
+    """Apply one spooled {"source", "ts", "values"} sample (a /v1/batch "metrics" item)."""
+    samples = MetricSamples.model_validate(
+        {"source": payload.get("source"), "points": [{"ts": payload.get("ts"), "values": payload.get("values")}]}
+    )
+    return ingest_points_in_tx(conn, source=samples.source, points=[(p.ts, p.values) for p in samples.points])
+
+
+def ingest_metrics(conn: sqlite3.Connection, samples: MetricSamples) -> MetricIngestResult:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = ingest_points_in_tx(
+            conn, source=samples.source, points=[(p.ts, p.values) for p in samples.points]
+        )
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def list_series(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+    rows = conn.execute(
+        """
+        SELECT s.source, s.name, min(r.bucket_ts) AS first_ts, max(r.bucket_ts) AS last_ts
+        FROM metric_series s
+        LEFT JOIN metric_rollups r ON r.series_id = s.id AND r.step = 86400
+        GROUP BY s.id
+        ORDER BY s.name, s.source
+        """.strip()
+    ).fetchall()
+    return [
+        {"source": str(r["source"]), "name": str(r["name"]), "first_day": r["first_ts"], "last_day": r["last_ts"]}
+        for r in rows
+    ]
+
+
+def choose_step(span_seconds: float, max_points: int) -> int:
+    for step in AUTO_STEPS:
+        if span_seconds / step <= max_points:
+            return step
+    return AUTO_STEPS[-1]
+
+
+def query_metric(
+    conn: sqlite3.Connection,
+    *,
+    name: str,
+    source: str | None,
+    from_ts: datetime,
+    to_ts: datetime,
+    step: int,
+    max_points: int = 2000,
+) -> dict[str, Any]:
+    """Aggregate one metric into `step`-second buckets as parallel arrays.
+
+    Steps that are a multiple of a rollup resolution are answered from the rollup table
+    (a year of 1d buckets is 365 rows); other steps aggregate raw samples. A range that
+    reaches past `[server] metric_raw_days` is rounded up to a whole minute, since only
+    rollups cover it. Without `source`, all sources reporting `name` are combined. `t`
+    holds bucket starts in Unix seconds.
+    """
+    from_s = int(from_ts.timestamp())
+    to_s = int(math.ceil(to_ts.timestamp()))
+    if step <= 0:
+        step = choose_step(to_s - from_s, max_points)
+    if from_s * 1000 < _raw_horizon_ms(default_metric_raw_days()) and step % ROLLUP_STEPS[0]:
+        step += ROLLUP_STEPS[0] - step % ROLLUP_STEPS[0]
+    out: dict[str, Any] = {
+        "name": name,
+        "source": source,
+        "step": step,
+        "from_ts": to_rfc3339(from_ts),
+        "to_ts": to_rfc3339(to_ts),
+        "t": [],
+        "min": [],
+        "max": [],
+        "avg": [],
+        "count": [],
+    }
+
+    if source is None:
+        rows = conn.execute("SELECT id FROM metric_series WHERE name = ?", (name,)).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT id FROM metric_series WHERE name = ? AND source = ?", (name, source)
+        ).fetchall()
+    series_ids = [int(r["id"]) for r in rows]
+    if not series_ids:
+        return out
+    placeholders = ",".join("?" for _ in series_ids)
+    start = from_s - from_s % step
+
+    rollup_step = next((r for r in reversed(ROLLUP_STEPS) if step % r == 0), None)
+    if rollup_step is not None:
+        rows = conn.execute(
+            f"""
+            SELECT (bucket_ts / ?) * ? AS t, sum(samples) AS n, min(min_value) AS lo,
+                   max(max_value) AS hi, sum(sum_value) AS total
+            FROM metric_rollups
+            WHERE series_id IN ({placeholders}) AND step = ? AND bucket_ts >= ? AND bucket_ts < ?
+            GROUP BY t
+            ORDER BY t
+            """.strip(),
+            (step, step, *series_ids, rollup_step, start, to_s),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"""
+            SELECT (ts_ms / ?) * ? AS t, count(*) AS n, min(value) AS lo, max(value) AS hi, sum(value) AS total
+            FROM metric_samples
+            WHERE series_id IN ({placeholders}) AND ts_ms >= ? AND ts_ms < ?
+            GROUP BY t
+            ORDER BY t
+            """.strip(),
+            (step * 1000, step, *series_ids, start * 1000, to_s * 1000),
+        ).fetchall()
+
+    for r in rows:
+        n = int(r["n"])
+        out["t"].append(int(r["t"]))
+        out["min"].append(float(r["lo"]))
+        out["max"].append(float(r["hi"]))
+        out["avg"].append(round(float(r["total"]) / n, 6) if n else None)
+        out["count"].append(n)
+    return out
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from activewatcher.common.time import utcnow
+
+from . import db
+
+# Closed events are moved out of the main file once their start month is over; the main
+# file keeps the current month, open rows of any age and everything that is not events.
+_MOVE_CHUNK_ROWS = 2000
+
+_UPSERT_LAST_SEEN_SQL = """
+INSERT INTO main.partition_last_seen(bucket, source, last_seen_ts)
+SELECT bucket, source, max(last_seen_ts) FROM {table} WHERE {where} GROUP BY bucket, source
+ON CONFLICT(bucket, source) DO UPDATE SET last_seen_ts = max(last_seen_ts, excluded.last_seen_ts)
+""".strip()
+
+# Never moved or folded away: new rows get max(id) + 1, so while the row holding the highest
+# id stays in the main file, no id that a partition file holds is handed out again.
+KEEP_MAX_ID_SQL = "id < (SELECT max(id) FROM main.events)"
+
+
+def _main_path(conn: sqlite3.Connection) -> Path | None:
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return Path(row[2]) if row[2] else None
+    return None
+
+
+def partition_path(db_path: Path, month: str) -> Path:
+    """`events.sqlite3` -> `events-2026-09.sqlite3` for month "2026-09"."""
+    return db_path.with_name(f"{db_path.stem}-{month}{db_path.suffix}")
+
+
+def _month(dt: datetime) -> str:
+    return f"{dt.year:04d}-{dt.month:02d}"
+
+
+def _add_months(month: str, delta: int) -> str:
+    year, mon = (int(p) for p in month.split("-"))
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+@contextmanager
+def _attached(conn: sqlite3.Connection, path: Path, month: str) -> Iterator[str]:
+    schema = "part_" + month.replace("-", "_")
+    conn.execute("ATTACH DATABASE ? AS " + schema, (str(path),))
+    try:
+        yield schema
+    finally:
+        conn.execute("DETACH DATABASE " + schema)
+
+
+def _attach_each(conn: sqlite3.Connection, months: list[str]) -> Iterator[str]:
+    # One at a time: a year of months is more than SQLite's default limit of 10 attached files.
+    db_path = _main_path(conn) if months else None
+    if db_path is None:
+        return
+    for month in months:
+        path = partition_path(db_path, month)
+        if not path.is_file():
+            # ATTACH would create an empty file in its place.
+            print(f"[server] event partition {path} is missing")
+            continue
+        with _attached(conn, path, month) as schema:
+            yield schema
+
+
+def overlapping_partitions(conn: sqlite3.Connection, *, from_iso: str, to_iso: str) -> Iterator[str]:
+    """Attach each partition holding events that overlap [from_iso, to_iso) and yield its schema.
+
+    The partition stays attached until the caller asks for the next one, so results must be
+    fetched before that. Call this after reading the main file's rows: a row the mover takes
+    out of the main file in between is then already listed here (rows keep their id, so a
+    row seen in both places can be dropped by id).
+    """
+    months = [
+        str(r["month"])
+        for r in conn.execute(
+            "SELECT month FROM event_partitions WHERE min_start_ts < ? AND max_end_ts > ? ORDER BY month",
+            (to_iso, from_iso),
+        )
+    ]
+    yield from _attach_each(conn, months)
+
+
+def all_partitions(conn: sqlite3.Connection) -> Iterator[str]:
+    months = [str(r["month"]) for r in conn.execute("SELECT month FROM event_partitions ORDER BY month")]
+    yield from _attach_each(conn, months)
+
+
+def _create_partition(path: Path) -> None:
+    part = db.connect(path)
+    try:
+        db.init_events(part)
+        part.commit()
+    finally:
+        part.close()
+
+
+def move_closed_rows(
+    conn: sqlite3.Connection,
+    *,
+    retention_months: int = 0,
+    limit: int = _MOVE_CHUNK_ROWS,
+    now: datetime | None = None,
+) -> int:
+    """Move up to `limit` closed events that started before this month into their month's file.
+
+    Each month's rows are first committed to the partition, then deleted from the main file
+    together with the catalog update and partition_last_seen, so a crash in between leaves rows in both places
+    (read paths drop duplicates) and the next call finishes the move. Only rows the partition
+    holds under the same id and (bucket, source, start_ts) are deleted; one that could not be
+    copied stays in the main file. Rows of months past `retention_months` are deleted instead.
+    Returns the number of rows moved or deleted; 0 once nothing is left.
+    """
+    db_path = _main_path(conn)
+    if db_path is None:
+        return 0
+    head = _month(now or utcnow())
+    head_start = f"{head}-01T00:00:00.000Z"
+    horizon = _add_months(head, -retention_months) if retention_months > 0 else None
+
+    by_month: dict[str, list[int]] = {}
+    bounds: dict[str, tuple[str, str]] = {}
+    taken = 0
+    for bucket_row in conn.execute("SELECT bucket FROM bucket_stats").fetchall():
+        if taken >= limit:
+            break
+        rows = conn.execute(
+            f"""
+            SELECT id, start_ts, end_ts FROM main.events
+             WHERE bucket = ? AND start_ts < ? AND end_ts IS NOT NULL AND {KEEP_MAX_ID_SQL}
+             ORDER BY start_ts
+             LIMIT ?
+            """.strip(),
+            (bucket_row["bucket"], head_start, limit - taken),
+        ).fetchall()
+        for r in rows:
+            start_ts, end_ts = str(r["start_ts"]), str(r["end_ts"])
+            month = start_ts[:7]
+            by_month.setdefault(month, []).append(int(r["id"]))
+            lo, hi = bounds.get(month, (start_ts, end_ts))
+            bounds[month] = (min(lo, start_ts), max(hi, end_ts))
+        taken += len(rows)
+
+    done = 0
+    for month, ids in sorted(by_month.items()):
+        ids_json = json.dumps(ids)
+        if horizon is None or month >= horizon:
+            path = partition_path(db_path, month)
+            if not path.is_file():
+                _create_partition(path)
+            with _attached(conn, path, month) as schema:
+                conn.execute("BEGIN")
+                try:
+                    conn.execute(
+                        f"""
+                        INSERT OR IGNORE INTO {schema}.events(id, bucket, source, start_ts, end_ts, last_seen_ts, data_json)
+                        SELECT id, bucket, source, start_ts, end_ts, last_seen_ts, data_json
+                          FROM main.events
+                         WHERE id IN (SELECT value FROM json_each(?))
+                        """.strip(),
+                        (ids_json,),
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                # Rows already there from an interrupted move are expected; a different row
+                # under the same id is not, and its main-file copy must not be deleted.
+                copied = [
+                    int(r["id"])
+                    for r in conn.execute(
+                        f"""
+                        SELECT m.id FROM main.events m
+                          JOIN {schema}.events p
+                            ON p.id = m.id AND p.bucket = m.bucket AND p.source = m.source AND p.start_ts = m.start_ts
+                         WHERE m.id IN (SELECT value FROM json_each(?))
+                        """.strip(),
+                        (ids_json,),
+                    )
+                ]
+            if len(copied) != len(ids):
+                print(
+                    f"[server] {len(ids) - len(copied)} events of {month} collide with other rows "
+                    "in the partition file; leaving them in the main file"
+                )
+            ids_json = json.dumps(copied)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if horizon is None or month >= horizon:
+                lo, hi = bounds[month]
+                conn.execute(
+                    """
+                    INSERT INTO event_partitions(month, min_start_ts, max_end_ts) VALUES (?, ?, ?)
+                    ON CONFLICT(month) DO UPDATE SET
+                      min_start_ts = min(min_start_ts, excluded.min_start_ts),
+                      max_end_ts = max(max_end_ts, excluded.max_end_ts)
+                    """.strip(),
+                    (month, lo, hi),
+                )
+            conn.execute(
+                _UPSERT_LAST_SEEN_SQL.format(table="main.events", where="id IN (SELECT value FROM json_each(?))"),
+                (ids_json,),
+            )
+            done += conn.execute(
+                "DELETE FROM main.events WHERE id IN (SELECT value FROM json_each(?))", (ids_json,)
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return done
+
+
+def backfill_last_seen(conn: sqlite3.Connection) -> int:
+    """Fill partition_last_seen from the partition files, for databases partitioned before it existed."""
+    if conn.execute("SELECT 1 FROM partition_last_seen LIMIT 1").fetchone() is not None:
+        return 0
+    total = 0
+    for schema in all_partitions(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total += conn.execute(_UPSERT_LAST_SEEN_SQL.format(table=f"{schema}.events", where="true")).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return total
+
+
+def drop_expired_partitions(
+    conn: sqlite3.Connection, *, retention_months: int, now: datetime | None = None
+) -> list[str]:
+    """Delete the files of months older than `retention_months` (0 keeps everything)."""
+    db_path = _main_path(conn)
+    if retention_months <= 0 or db_path is None:
+        return []
+    horizon = _add_months(_month(now or utcnow()), -retention_months)
+    months = {str(r["month"]) for r in conn.execute("SELECT month FROM event_partitions WHERE month < ?", (horizon,))}
+    # Also files whose catalog row was never written (a move interrupted right after creating them).
+    prefix, suffix = f"{db_path.stem}-", db_path.suffix
+    for path in db_path.parent.glob(f"{prefix}[0-9][0-9][0-9][0-9]-[0-9][0-9]{suffix}"):
+        month = path.name[len(prefix) : len(path.name) - len(suffix)]
+        if month < horizon:
+            months.add(month)
+
+    dropped: list[str] = []
+    for month in sorted(months):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM event_partitions WHERE month = ?", (month,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # Readers that attached the file before the catalog change keep their open handle.
+        path = partition_path(db_path, month)
+        for victim in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+            try:
+                os.unlink(victim)
+            except FileNotFoundError:
+                pass
+        dropped.append(month)
+    return dropped
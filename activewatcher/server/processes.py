@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any
+
+from activewatcher.common.models import ProcessSamples
+from activewatcher.common.time import to_rfc3339
+
+# Battery metrics (see watchers/battery.py) the report joins on, at their 1m rollups.
+_POWER_METRIC = "power_w"
+_MAINS_METRIC = "mains_online"
+_POWER_STEP = 60
+
+
+@dataclass(frozen=True)
+class ProcessIngestResult:
+    inserted: int
+    duplicates: int
+    unattributed: int
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+def ingest_process_samples_in_tx(conn: sqlite3.Connection, samples: ProcessSamples) -> ProcessIngestResult:
+    """Store focused-process samples against the `bucket`/`source` interval open at each ts.
+
+    The interval is the latest one starting at or before the sample, if it has not ended
+    before it (the watcher stamps the sample that closes a focus just before the next
+    state); its `app` wins over the one the sample carries. Keyed by (source, millisecond
+    ts), so replays are no-ops.
+    """
+    inserted = duplicates = unattributed = 0
+    for sample in samples.samples:
+        ts = to_rfc3339(sample.ts)
+        row = conn.execute(
+            """
+            SELECT id, end_ts, json_extract(data_json, '$.app') AS app FROM events
+            WHERE bucket = ? AND source = ? AND start_ts <= ?
+            ORDER BY start_ts DESC
+            LIMIT 1
+            """.strip(),
+            (samples.bucket, samples.source, ts),
+        ).fetchone()
+        event_id: int | None = None
+        app = sample.app or ""
+        if row is not None and (row["end_ts"] is None or str(row["end_ts"]) >= ts):
+            event_id = int(row["id"])
+            app = str(row["app"] or app)
+        else:
+            unattributed += 1
+        cur = conn.execute(
+            """
+            INSERT OR IGNORE INTO process_samples(
+              source, ts_ms, event_id, app, pid, interval_seconds, cpu_seconds, rss_bytes, processes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """.strip(),
+            (
+                samples.source,
+                int(round(sample.ts.timestamp() * 1000)),
+                event_id,
+                app,
+                sample.pid,
+                sample.interval_seconds,
+                sample.cpu_seconds,
+                sample.rss_bytes,
+                sample.processes,
+            ),
+        )
+        if cur.rowcount == 0:
+            duplicates += 1
+        else:
+            inserted += 1
+    return ProcessIngestResult(inserted=inserted, duplicates=duplicates, unattributed=unattributed)
+
+
+def ingest_process_item_in_tx(conn: sqlite3.Connection, payload: dict[str, Any]) -> ProcessIngestResult:
+    """Apply one spooled {"bucket", "source", **sample} record (a /v1/batch "process" item)."""
+    sample = {k: v for k, v in payload.items() if k not in ("bucket", "source")}
+    samples = ProcessSamples.model_validate(
+        {"bucket": payload.get("bucket", "window"), "source": payload.get("source"), "samples": [sample]}
+    )
+    return ingest_process_samples_in_tx(conn, samples)
+
+
+def ingest_process_samples(conn: sqlite3.Connection, samples: ProcessSamples) -> ProcessIngestResult:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = ingest_process_samples_in_tx(conn, samples)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _minute_stats(
+    conn: sqlite3.Connection, name: str, source: str | None, start_s: int, end_s: int
+) -> dict[int, tuple[float, float]]:
+    """minute start -> (mean, max) of a metric, from its 1m rollups."""
+    where = ["s.name = ?", "r.step = ?", "r.bucket_ts >= ?", "r.bucket_ts < ?"]
+    params: list[Any] = [name, _POWER_STEP, start_s, end_s]
+    if source is not None:
+        where.append("s.source = ?")
+        params.append(source)
+    rows = conn.execute(
+        f"""
+        SELECT r.bucket_ts AS t, sum(r.sum_value) AS total, sum(r.samples) AS n, max(r.max_value) AS hi
+        FROM metric_rollups r
+        JOIN metric_series s ON s.id = r.series_id
+        WHERE {' AND '.join(where)}
+        GROUP BY r.bucket_ts
+        """.strip(),
+        tuple(params),
+    ).fetchall()
+    return {int(r["t"]): (float(r["total"]) / int(r["n"]), float(r["hi"])) for r in rows if int(r["n"]) > 0}
+
+
+def process_report(
+    conn: sqlite3.Connection,
+    *,
+    from_ts: datetime,
+    to_ts: datetime,
+    source: str | None = None,
+    battery_source: str | None = None,
+) -> dict[str, Any]:
+    """CPU time, memory and battery drain per focused app over [from_ts, to_ts).
+
+    `cpu_percent` is CPU time per second of sampled focus, in percent of one core.
+    `avg_power_w` / `energy_wh` are the whole-system battery draw (the battery watcher's
+    `power_w`, per minute) while the app had focus, counting only minutes spent off
+    mains power; `battery_seconds` is the focus time they cover.
+    """
+    from_ms = int(from_ts.timestamp() * 1000)
+    to_ms = int(to_ts.timestamp() * 1000)
+    where = ["ts_ms >= ?", "ts_ms < ?"]
+    params: list[Any] = [from_ms, to_ms]
+    if source is not None:
+        where.append("source = ?")
+        params.append(source)
+    rows = conn.execute(
+        f"""
+        SELECT ts_ms, app, interval_seconds, cpu_seconds, rss_bytes
+        FROM process_samples
+        WHERE {' AND '.join(where)}
+        ORDER BY ts_ms
+        """.strip(),
+        tuple(params),
+    ).fetchall()
+
+    # Samples cover the span before their timestamp, which may start before from_ts.
+    start_s = from_ms // 1000 - 3600
+    end_s = to_ms // 1000 + _POWER_STEP
+    power = _minute_stats(conn, _POWER_METRIC, battery_source, start_s, end_s)
+    mains = _minute_stats(conn, _MAINS_METRIC, battery_source, start_s, end_s)
+
+    apps: dict[str, dict[str, float]] = {}
+    for r in rows:
+        app = str(r["app"])
+        interval = float(r["interval_seconds"])
+        acc = apps.get(app)
+        if acc is None:
+            acc = apps[app] = {
+                "samples": 0,
+                "sampled_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "rss_total": 0.0,
+                "max_rss_bytes": 0,
+                "battery_seconds": 0.0,
+                "energy_ws": 0.0,
+            }
+        acc["samples"] += 1
+        acc["sampled_seconds"] += interval
+        acc["cpu_seconds"] += float(r["cpu_seconds"])
+        acc["rss_total"] += int(r["rss_bytes"])
+        acc["max_rss_bytes"] = max(acc["max_rss_bytes"], int(r["rss_bytes"]))
+
+        midpoint_s = int(r["ts_ms"]) / 1000.0 - interval / 2.0
+        minute = int(midpoint_s) - int(midpoint_s) % _POWER_STEP
+        drain = power.get(minute)
+        on_mains = mains.get(minute)
+        if drain is not None and (on_mains is None or on_mains[1] <= 0):
+            acc["battery_seconds"] += interval
+            acc["energy_ws"] += drain[0] * interval
+
+    out_apps: list[dict[str, Any]] = []
+    for app, acc in apps.items():
+        sampled = acc["sampled_seconds"]
+        battery = acc["battery_seconds"]
+        out_apps.append(
+            {
+                "app": app,
+                "samples": int(acc["samples"]),
+                "sampled_seconds": round(sampled, 3),
+                "cpu_seconds": round(acc["cpu_seconds"], 3),
+                "cpu_percent": round(acc["cpu_seconds"] / sampled * 100.0, 3) if sampled > 0 else None,
+                "avg_rss_bytes": int(acc["rss_total"] / acc["samples"]),
+                "max_rss_bytes": int(acc["max_rss_bytes"]),
+                "battery_seconds": round(battery, 3),
+                "avg_power_w": round(acc["energy_ws"] / battery, 3) if battery > 0 else None,
+                "energy_wh": round(acc["energy_ws"] / 3600.0, 6),
+            }
+        )
+    out_apps.sort(key=lambda a: (-a["cpu_seconds"], a["app"]))
+    return {
+        "from_ts": to_rfc3339(from_ts),
+        "to_ts": to_rfc3339(to_ts),
+        "source": source,
+        "battery_source": battery_source,
+        "apps": out_apps,
+    }
@@ -12,6 +12,8 @@ from activewatcher.common.categories import CategoryCatalog, category_catalog
 from activewatcher.common.config import default_stale_after_seconds
 from activewatcher.common.time import parse_rfc3339, to_rfc3339, to_utc, utcnow
 
+from . import partitions, retention
+
 
 @dataclass(frozen=True)
 class Interval:
@@ -98,6 +100,154 @@ def _tzinfo(tz: str | None) -> timezone | ZoneInfo:
         raise ValueError(f"unknown timezone: {name}") from e
 
 
+# Earliest start_ts a closed row overlapping [from, to) can have: `from` minus the longest
+# closed interval of the bucket(s) (bucket_stats, kept by triggers in db.init_db), plus a
+# second of slack for julianday rounding. Evaluated inside the query, so it is consistent
+# with the rows it reads.
+_START_BOUND_SQL = (
+    "strftime('%Y-%m-%dT%H:%M:%fZ', julianday(?) - (coalesce(({max_sql}), 0) + 1) / 86400.0)"
+)
+
+
+def _overlapping_rows_in(
+    conn: sqlite3.Connection,
+    schema: str,
+    columns: str,
+    *,
+    from_iso: str,
+    to_iso: str,
+    bucket: str | None,
+    where: list[str],
+    params: list[Any],
+) -> list[sqlite3.Row]:
+    if bucket is not None:
+        bucket_sql = "bucket = ?"
+        bound_sql = _START_BOUND_SQL.format(max_sql=f"SELECT max_seconds FROM {schema}.bucket_stats WHERE bucket = ?")
+        closed_params: list[Any] = [bucket, from_iso, bucket]
+        open_params: list[Any] = [bucket]
+    else:
+        # Every bucket with closed rows has a bucket_stats row.
+        bucket_sql = f"bucket IN (SELECT bucket FROM {schema}.bucket_stats)"
+        bound_sql = _START_BOUND_SQL.format(max_sql=f"SELECT max(max_seconds) FROM {schema}.bucket_stats")
+        closed_params = [from_iso]
+        open_params = []
+    extra = "".join(f" AND {w}" for w in where)
+    # Unary "+" keeps the open branch on idx_events_end (end_ts IS NULL) even without
+    # ANALYZE stats; a bucket/start_ts index range would walk the whole history.
+    open_bucket_sql = " AND +bucket = ?" if bucket is not None else ""
+    return conn.execute(
+        f"""
+        SELECT {columns} FROM {schema}.events
+         WHERE {bucket_sql} AND start_ts >= {bound_sql} AND start_ts < ? AND +end_ts > ?{extra}
+        UNION ALL
+        SELECT {columns} FROM {schema}.events
+         WHERE end_ts IS NULL AND +start_ts < ?{open_bucket_sql}{extra}
+        """.strip(),
+        (*closed_params, to_iso, from_iso, *params, to_iso, *open_params, *params),
+    ).fetchall()
+
+
+def _row_key(row: sqlite3.Row) -> tuple[str, str, str]:
+    return (str(row["bucket"]), str(row["source"]), str(row["start_ts"]))
+
+
+def _overlapping_rows(
+    conn: sqlite3.Connection,
+    columns: str,
+    *,
+    from_iso: str,
+    to_iso: str,
+    bucket: str | None,
+    where: list[str],
+    params: list[Any],
+) -> list[sqlite3.Row]:
+    """Event rows overlapping [from_iso, to_iso), ordered by start_ts.
+
+    Closed rows are a start_ts range on idx_events_bucket_start bounded on both sides:
+    none can start more than its bucket's longest closed interval before `from_iso`, so
+    the rows walked are the result plus at most that much history, however old the range.
+    Open rows (few, see maintenance.close_stale_intervals) come from a separate branch
+    on the open-row index. The same query then runs in each monthly partition file that
+    overlaps the range; a row the mover left in both files is kept once, matched on
+    (bucket, source, start_ts) rather than id, as files partitioned before the main file
+    kept its highest id (partitions.KEEP_MAX_ID_SQL) may hold one id twice.
+    `columns` must include bucket, source and start_ts.
+    """
+    query = dict(from_iso=from_iso, to_iso=to_iso, bucket=bucket, where=where, params=params)
+    rows = _overlapping_rows_in(conn, "main", columns, **query)
+    seen = {_row_key(r) for r in rows}
+    for schema in partitions.overlapping_partitions(conn, from_iso=from_iso, to_iso=to_iso):
+        rows.extend(r for r in _overlapping_rows_in(conn, schema, columns, **query) if _row_key(r) not in seen)
+    # Sorted here: an ORDER BY makes SQLite merge the branches in start_ts index order,
+    # which may walk more rows than the bounded range.
+    rows.sort(key=lambda r: str(r["start_ts"]))
+    return rows
+
+
+def _rollup_rows(
+    conn: sqlite3.Connection,
+    *,
+    from_dt: datetime,
+    to_dt: datetime,
+    bucket: str | None,
+    source: str | None,
+) -> list[sqlite3.Row]:
+    """Hourly rollups (see retention.py) of the hours overlapping [from_dt, to_dt), from all files."""
+    hour_from = to_rfc3339(retention.floor_hour(from_dt))
+    to_iso = to_rfc3339(to_dt)
+    where = ["hour_ts >= ?", "hour_ts < ?"]
+    params: list[Any] = [hour_from, to_iso]
+    if bucket is not None:
+        where.append("bucket = ?")
+        params.append(bucket)
+    if source is not None:
+        where.append("source = ?")
+        params.append(source)
+    sql = "SELECT hour_ts, bucket, source, data_json, seconds FROM {schema}.event_rollups WHERE " + " AND ".join(where)
+    rows = conn.execute(sql.format(schema="main"), tuple(params)).fetchall()
+    for schema in partitions.overlapping_partitions(conn, from_iso=hour_from, to_iso=to_iso):
+        rows.extend(conn.execute(sql.format(schema=schema), tuple(params)).fetchall())
+    return rows
+
+
+def _rollup_intervals(rows: list[sqlite3.Row], *, from_dt: datetime, to_dt: datetime) -> list[Interval]:
+    """Rolled-up time as synthetic intervals, with negative ids.
+
+    A (bucket, source, hour)'s totals are laid end to end from the start of the part of the
+    hour inside [from_dt, to_dt), each scaled by that part's share of the hour, so totals
+    stay right for ranges that cut through an hour. Where in the hour the time was spent is
+    lost, so overlaps between buckets (window vs idle) within a rolled-up hour are approximate.
+    """
+    groups: dict[tuple[str, str, str], list[sqlite3.Row]] = {}
+    for r in rows:
+        groups.setdefault((str(r["hour_ts"]), str(r["bucket"]), str(r["source"])), []).append(r)
+
+    intervals: list[Interval] = []
+    for (hour_ts, bucket, source), group in sorted(groups.items()):
+        hour = parse_rfc3339(hour_ts)
+        span_start = max(hour, from_dt)
+        span_end = min(hour + timedelta(hours=1), to_dt)
+        share = (span_end - span_start).total_seconds() / 3600.0
+        if share <= 0:
+            continue
+        cursor = span_start
+        for r in sorted(group, key=lambda r: (-float(r["seconds"]), str(r["data_json"]))):
+            end = min(span_end, cursor + timedelta(seconds=float(r["seconds"]) * share))
+            if end > cursor:
+                intervals.append(
+                    Interval(
+                        id=-(len(intervals) + 1),
+                        bucket=bucket,
+                        source=source,
+                        start=cursor,
+                        end=end,
+                        data=_parse_json(str(r["data_json"])),
+                    )
+                )
+            cursor = end
+    return intervals
+
+
 def list_apps(
     conn: sqlite3.Connection,
     *,
@@ -114,18 +264,17 @@ def list_apps(
     from_iso = to_rfc3339(from_dt)
     to_iso = to_rfc3339(to_dt)
 
-    rows = conn.execute(
-        """
-        SELECT data_json
-          FROM events
-         WHERE bucket = 'window'
-           AND start_ts < ?
-           AND (end_ts IS NULL OR end_ts > ?)
-         ORDER BY start_ts ASC
-        """.strip(),
-        (to_iso, from_iso),
-    ).fetchall()
+    rows = _overlapping_rows(
+        conn,
+        "bucket, source, start_ts, data_json",
+        from_iso=from_iso,
+        to_iso=to_iso,
+        bucket="window",
+        where=[],
+        params=[],
+    )
 
+    rows.extend(_rollup_rows(conn, from_dt=from_dt, to_dt=to_dt, bucket="window", source=None))
     apps: set[str] = set()
     for r in rows:
         data = _parse_json(str(r["data_json"]))
@@ -273,26 +422,25 @@ def load_intervals(
     from_iso = to_rfc3339(from_dt)
     to_iso = to_rfc3339(to_dt)
 
-    where = ["start_ts < ?", "(end_ts IS NULL OR end_ts > ?)"]
-    params: list[Any] = [to_iso, from_iso]
-    if bucket is not None:
-        where.append("bucket = ?")
-        params.append(bucket)
+    where: list[str] = []
+    params: list[Any] = []
     if source is not None:
         where.append("source = ?")
         params.append(source)
 
-    rows = conn.execute(
-        f"""
-        SELECT id, bucket, source, start_ts, end_ts, last_seen_ts, data_json
-          FROM events
-         WHERE {' AND '.join(where)}
-         ORDER BY start_ts ASC
-        """.strip(),
-        tuple(params),
-    ).fetchall()
+    rows = _overlapping_rows(
+        conn,
+        "id, bucket, source, start_ts, end_ts, last_seen_ts, data_json",
+        from_iso=from_iso,
+        to_iso=to_iso,
+        bucket=bucket,
+        where=where,
+        params=params,
+    )
 
     intervals: list[Interval] = []
+    # Open rows normally stay fresh (maintenance.close_stale_intervals ends silent ones),
+    # but clip any the background sweep hasn't reached yet.
     stale_after = default_stale_after_seconds()
     stale_before = to_dt - timedelta(seconds=stale_after) if stale_after > 0 else None
     for r in rows:
@@ -322,6 +470,11 @@ def load_intervals(
             )
         )
 
+    rollups = _rollup_rows(conn, from_dt=from_dt, to_dt=to_dt, bucket=bucket, source=source)
+    if rollups:
+        intervals.extend(_rollup_intervals(rollups, from_dt=from_dt, to_dt=to_dt))
+        intervals.sort(key=lambda it: it.start)
+
     return from_dt, to_dt, intervals
 
 
@@ -342,22 +495,42 @@ def data_range(
 
     where_sql = f"WHERE {' AND '.join(where)}" if where else ""
 
-    row = conn.execute(
-        f"""
-        SELECT MIN(start_ts) AS min_start_ts,
-               MAX(COALESCE(end_ts, last_seen_ts)) AS max_end_ts
-          FROM events
-          {where_sql}
-        """.strip(),
-        tuple(params),
-    ).fetchone()
-
-    if row is None or row["min_start_ts"] is None or row["max_end_ts"] is None:
+    def _bounds(schema: str) -> list[tuple[str | None, str | None]]:
+        row = conn.execute(
+            f"""
+            SELECT MIN(start_ts) AS min_start_ts,
+                   MAX(COALESCE(end_ts, last_seen_ts)) AS max_end_ts
+              FROM {schema}.events
+              {where_sql}
+            """.strip(),
+            tuple(params),
+        ).fetchone()
+        rollup = conn.execute(
+            f"""
+            SELECT MIN(hour_ts) AS min_start_ts,
+                   strftime('%Y-%m-%dT%H:%M:%fZ', MAX(hour_ts), '+1 hour') AS max_end_ts
+              FROM {schema}.event_rollups
+              {where_sql}
+            """.strip(),
+            tuple(params),
+        ).fetchone()
+        return [(row["min_start_ts"], row["max_end_ts"]), (rollup["min_start_ts"], rollup["max_end_ts"])]
+
+    found = _bounds("main")
+    if where:
+        for schema in partitions.all_partitions(conn):
+            found.extend(_bounds(schema))
+    else:
+        row = conn.execute("SELECT MIN(min_start_ts), MAX(max_end_ts) FROM event_partitions").fetchone()
+        found.append((row[0], row[1]))
+    starts = [str(lo) for lo, _ in found if lo is not None]
+    ends = [str(hi) for _, hi in found if hi is not None]
+    if not starts or not ends:
         return None, None
 
     try:
-        from_dt = to_utc(parse_rfc3339(str(row["min_start_ts"])))
-        to_dt = to_utc(parse_rfc3339(str(row["max_end_ts"])))
+        from_dt = to_utc(parse_rfc3339(min(starts)))
+        to_dt = to_utc(parse_rfc3339(max(ends)))
     except Exception:
         return None, None
 
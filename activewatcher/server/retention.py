@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from activewatcher.common.config import default_retention_rules
+from activewatcher.common.time import parse_rfc3339, to_rfc3339, to_utc, utcnow
+
+from . import partitions
+
+_CHUNK_ROWS = 2000
+_HOUR = timedelta(hours=1)
+
+
+@dataclass(frozen=True)
+class RetentionRule:
+    bucket: str
+    # Raw intervals that ended more than this many days ago are folded into hourly rollups
+    # (0 keeps raw intervals forever).
+    raw_days: int
+    # Rollups older than this many days are deleted (0 keeps them forever).
+    rollup_days: int
+    # Data keys kept in rollups; None keeps the whole payload.
+    keep: tuple[str, ...] | None
+
+
+def retention_rules() -> list[RetentionRule]:
+    return [
+        RetentionRule(
+            bucket=bucket,
+            raw_days=rule["raw_days"],
+            rollup_days=rule["rollup_days"],
+            keep=tuple(rule["keep"]) if rule["keep"] is not None else None,
+        )
+        for bucket, rule in sorted(default_retention_rules().items())
+    ]
+
+
+def floor_hour(dt: datetime) -> datetime:
+    return to_utc(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def _split_by_hour(start: datetime, end: datetime) -> Iterator[tuple[datetime, float]]:
+    hour = floor_hour(start)
+    while hour < end:
+        seconds = (min(end, hour + _HOUR) - max(start, hour)).total_seconds()
+        if seconds > 0:
+            yield hour, seconds
+        hour += _HOUR
+
+
+def _rollup_data_json(data_json: str, keep: tuple[str, ...] | None) -> str:
+    if keep is None:
+        return data_json
+    try:
+        data = json.loads(data_json)
+    except json.JSONDecodeError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    kept = {k: data[k] for k in keep if k in data}
+    return json.dumps(kept, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def fold_raw_intervals(
+    conn: sqlite3.Connection,
+    rule: RetentionRule,
+    *,
+    schema: str = "main",
+    limit: int = _CHUNK_ROWS,
+    now: datetime | None = None,
+) -> int:
+    """Fold up to `limit` of the bucket's old raw intervals into hourly rollups, in one transaction.
+
+    Only closed rows ending before the hour-aligned horizon are folded, and each row is
+    folded whole, so a report never sees the same time both raw and rolled up. The main
+    file's highest id is never folded (see partitions.KEEP_MAX_ID_SQL). Returns the
+    number of rows folded; 0 once nothing is left.
+    """
+    if rule.raw_days <= 0:
+        return 0
+    horizon = to_rfc3339(floor_hour((now or utcnow()) - timedelta(days=rule.raw_days)))
+    keep_max_id = f" AND {partitions.KEEP_MAX_ID_SQL}" if schema == "main" else ""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT id, source, start_ts, end_ts, data_json FROM {schema}.events
+             WHERE bucket = ? AND start_ts < ? AND end_ts IS NOT NULL AND +end_ts <= ?{keep_max_id}
+             ORDER BY start_ts
+             LIMIT ?
+            """.strip(),
+            (rule.bucket, horizon, horizon, limit),
+        ).fetchall()
+        totals: dict[tuple[str, str, str], float] = {}
+        for r in rows:
+            data_json = _rollup_data_json(str(r["data_json"]), rule.keep)
+            start = parse_rfc3339(str(r["start_ts"]))
+            end = parse_rfc3339(str(r["end_ts"]))
+            for hour, seconds in _split_by_hour(start, end):
+                key = (to_rfc3339(hour), str(r["source"]), data_json)
+                totals[key] = totals.get(key, 0.0) + seconds
+        conn.executemany(
+            f"""
+            INSERT INTO {schema}.event_rollups(hour_ts, bucket, source, data_json, seconds)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(hour_ts, bucket, source, data_json) DO UPDATE SET seconds = seconds + excluded.seconds
+            """.strip(),
+            [(hour_ts, rule.bucket, source, data_json, seconds) for (hour_ts, source, data_json), seconds in totals.items()],
+        )
+        conn.execute(
+            f"DELETE FROM {schema}.events WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([int(r["id"]) for r in rows]),),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def expire_rollups(
+    conn: sqlite3.Connection,
+    rule: RetentionRule,
+    *,
+    schema: str = "main",
+    limit: int = _CHUNK_ROWS,
+    now: datetime | None = None,
+) -> int:
+    """Delete up to `limit` of the bucket's rollups older than `rollup_days`."""
+    if rule.rollup_days <= 0:
+        return 0
+    cutoff = to_rfc3339((now or utcnow()) - timedelta(days=rule.rollup_days))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur = conn.execute(
+            f"""
+            DELETE FROM {schema}.event_rollups
+             WHERE (hour_ts, bucket, source, data_json) IN (
+               SELECT hour_ts, bucket, source, data_json FROM {schema}.event_rollups
+                WHERE hour_ts < ? AND bucket = ?
+                LIMIT ?
+             )
+            """.strip(),
+            (cutoff, rule.bucket, limit),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cur.rowcount
+
+
+def apply_retention_chunk(
+    conn: sqlite3.Connection, rules: list[RetentionRule], *, now: datetime | None = None
+) -> int:
+    """One chunk of retention work in the first file (main, then each partition) that has any.
+
+    Returns the rows folded or deleted; 0 once every rule is satisfied everywhere.
+    """
+    now = now or utcnow()
+
+    def _chunk(schema: str) -> int:
+        for rule in rules:
+            done = fold_raw_intervals(conn, rule, schema=schema, now=now)
+            done += expire_rollups(conn, rule, schema=schema, now=now)
+            if done:
+                return done
+        return 0
+
+    done = _chunk("main")
+    if done:
+        return done
+    for schema in partitions.all_partitions(conn):
+        done = _chunk(schema)
+        if done:
+            return done
+    return 0
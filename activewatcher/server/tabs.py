@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from dataclasses import asdict, dataclass
+from typing import Any, Literal
+
+from activewatcher.common.models import TabDelta
+from activewatcher.common.time import to_rfc3339
+
+from .ingest import IngestResult, ingest_state_in_tx
+
+TABS_BUCKET = "browser_tabs"
+
+
+class TabSequenceGapError(ValueError):
+    def __init__(self, source: str, *, expected_seq: int | None, got_seq: int) -> None:
+        super().__init__(f"sequence gap for {source}: expected {expected_seq}, got {got_seq}")
+        self.source = source
+        self.expected_seq = expected_seq
+        self.got_seq = got_seq
+
+
+@dataclass(frozen=True)
+class TabDeltaResult:
+    action: Literal["applied", "duplicate"]
+    seq: int
+    tab_count: int
+    ingest: IngestResult | None
+
+    def to_json(self) -> dict:
+        out = asdict(self)
+        out["ingest"] = self.ingest.to_json() if self.ingest is not None else None
+        return out
+
+
+def _tab_key(value: Any) -> str:
+    return str(value)
+
+
+def _load_stream(conn: sqlite3.Connection, source: str) -> tuple[int, dict[str, dict[str, Any]]] | None:
+    row = conn.execute("SELECT seq, tabs_json FROM tab_streams WHERE source = ?", (source,)).fetchone()
+    if row is None:
+        return None
+    try:
+        tabs = json.loads(str(row["tabs_json"]))
+    except json.JSONDecodeError:
+        tabs = {}
+    if not isinstance(tabs, dict):
+        tabs = {}
+    return int(row["seq"]), {str(k): v for k, v in tabs.items() if isinstance(v, dict)}
+
+
+def _sort_key(tab: dict[str, Any]) -> tuple:
+    window_id = tab.get("window_id")
+    index = tab.get("index")
+    return (
+        window_id if isinstance(window_id, int) else -1,
+        index if isinstance(index, int) else -1,
+        str(tab.get("id")),
+    )
+
+
+def tabs_snapshot(browser: str, tabs: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    items = sorted(tabs.values(), key=_sort_key)
+    window_ids = {t.get("window_id") for t in items if t.get("window_id") is not None}
+    return {
+        "browser": browser,
+        "count": len(items),
+        "window_count": len(window_ids),
+        "incognito_tabs": sum(1 for t in items if t.get("incognito")),
+        "pinned_tabs": sum(1 for t in items if t.get("pinned")),
+        "audible_tabs": sum(1 for t in items if t.get("audible")),
+        "muted_tabs": sum(1 for t in items if t.get("muted")),
+        "tabs": items,
+    }
+
+
+def _apply_ops(tabs: dict[str, dict[str, Any]], delta: TabDelta) -> None:
+    for op in delta.ops:
+        key = _tab_key(op.id)
+        if op.op == "remove":
+            tabs.pop(key, None)
+            continue
+        if op.op == "add" or key not in tabs:
+            tab = dict(op.tab or {})
+        else:
+            tab = dict(tabs[key])
+            tab.update(op.tab or {})
+        tab["id"] = op.id
+        tabs[key] = tab
+
+
+def apply_tab_delta(conn: sqlite3.Connection, delta: TabDelta) -> TabDeltaResult:
+    browser = str(delta.browser or delta.source)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stream = _load_stream(conn, delta.source)
+        if delta.reset:
+            tabs: dict[str, dict[str, Any]] = {}
+        elif stream is None:
+            raise TabSequenceGapError(delta.source, expected_seq=None, got_seq=delta.seq)
+        else:
+            last_seq, tabs = stream
+            if delta.seq <= last_seq:
+                # Replayed batch whose response got lost; it is already part of the set.
+                conn.execute("COMMIT")
+                return TabDeltaResult(action="duplicate", seq=last_seq, tab_count=len(tabs), ingest=None)
+            if delta.seq != last_seq + 1:
+                raise TabSequenceGapError(delta.source, expected_seq=last_seq + 1, got_seq=delta.seq)
+
+        _apply_ops(tabs, delta)
+        conn.execute(
+            """
+            INSERT INTO tab_streams(source, seq, tabs_json) VALUES (?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET seq = excluded.seq, tabs_json = excluded.tabs_json
+            """.strip(),
+            (delta.source, delta.seq, json.dumps(tabs, separators=(",", ":"), ensure_ascii=False)),
+        )
+        result = ingest_state_in_tx(
+            conn,
+            bucket=TABS_BUCKET,
+            source=delta.source,
+            ts=to_rfc3339(delta.ts),
+            data=tabs_snapshot(browser, tabs),
+        )
+        conn.execute("COMMIT")
+        return TabDeltaResult(action="applied", seq=delta.seq, tab_count=len(tabs), ingest=result)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
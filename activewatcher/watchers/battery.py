@@ -1,20 +1,24 @@
 from __future__ import annotations
 
-import asyncio
-import json
+import errno
+import socket
 import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
-from activewatcher.common.http import ActiveWatcherAsyncClient
-
-POWER_SUPPLY_ROOT = Path("/sys/class/power_supply")
+from activewatcher.common.protocol import canonical_json
+from activewatcher.common.spool import shared_outbox
 
+from .procfs import ProcFile
+from .schedule import sleep_aligned
 
-def _canonical_json(data: dict[str, Any]) -> str:
-    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+POWER_SUPPLY_ROOT = Path("/sys/class/power_supply")
+_UEVENT_PREFIX = "POWER_SUPPLY_"
+_EXTERNAL_SUPPLY_TYPES = {"mains", "usb", "usb-c", "usb_pd", "wireless"}
+_NETLINK_KOBJECT_UEVENT = 15
+_REDISCOVER_SECONDS = 300.0
 
 
 def _read_text(path: Path) -> str | None:
@@ -27,8 +31,19 @@ def _read_text(path: Path) -> str | None:
     return value
 
 
-def _read_int(path: Path) -> int | None:
-    value = _read_text(path)
+def _parse_uevent(data: bytes) -> dict[str, str]:
+    """POWER_SUPPLY_* lines of a supply's uevent file, keyed by lowercased attribute name."""
+    props: dict[str, str] = {}
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        key, sep, value = line.partition("=")
+        value = value.strip()
+        if sep and value and key.startswith(_UEVENT_PREFIX):
+            props[key[len(_UEVENT_PREFIX) :].lower()] = value
+    return props
+
+
+def _prop_int(props: dict[str, str], key: str) -> int | None:
+    value = props.get(key)
     if value is None:
         return None
     try:
@@ -37,15 +52,15 @@ def _read_int(path: Path) -> int | None:
         return None
 
 
-def _read_micro_as_base(path: Path) -> float | None:
-    value = _read_int(path)
+def _prop_micro_as_base(props: dict[str, str], key: str) -> float | None:
+    value = _prop_int(props, key)
     if value is None:
         return None
     return round(value / 1_000_000.0, 6)
 
 
-def _read_temp_c(path: Path) -> float | None:
-    value = _read_int(path)
+def _prop_temp_c(props: dict[str, str], key: str) -> float | None:
+    value = _prop_int(props, key)
     if value is None:
         return None
     return round(value / 10.0, 3)
@@ -69,74 +84,184 @@ def _compact(data: dict[str, Any]) -> dict[str, Any]:
     return compacted
 
 
-def _supply_dirs() -> list[Path]:
-    try:
-        entries = [entry for entry in POWER_SUPPLY_ROOT.iterdir() if entry.is_dir()]
-    except OSError:
-        return []
-    entries.sort(key=lambda p: p.name.lower())
-    return entries
+class _HotplugMonitor:
+    """Kernel uevent netlink socket, drained without blocking once per poll.
 
+    Only power_supply events other than "change" (which the kernel emits on every
+    battery property update) mean the set of supplies may differ.
+    """
 
-def _battery_dirs() -> list[Path]:
-    batteries: list[Path] = []
-    for path in _supply_dirs():
-        supply_type = (_read_text(path / "type") or "").lower()
-        if supply_type == "battery":
-            batteries.append(path)
-    return batteries
+    def __init__(self) -> None:
+        self._sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC, _NETLINK_KOBJECT_UEVENT
+        )
+        try:
+            # Multicast group 1 carries the kernel's own events (udevd re-broadcasts on 2).
+            self._sock.bind((0, 1))
+        except OSError:
+            self._sock.close()
+            raise
+
+    def supplies_changed(self) -> bool:
+        changed = False
+        while True:
+            try:
+                msg = self._sock.recv(16384)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # Events were dropped; assume one of them mattered.
+                    changed = True
+                    continue
+                raise
+            fields = msg.split(b"\0")
+            action = fields[0].partition(b"@")[0]
+            if action != b"change" and b"SUBSYSTEM=power_supply" in fields:
+                changed = True
+
+    def close(self) -> None:
+        self._sock.close()
 
 
-def _mains_online() -> bool | None:
+@dataclass
+class _Supply:
+    name: str
+    type: str
+    uevent: ProcFile
+
+
+class SupplyIndex:
+    """Cached power supply list whose uevent files are read with one pread each.
+
+    Discovery (listing `POWER_SUPPLY_ROOT` and reading every `type`) only repeats after a
+    power_supply hotplug event on the kernel uevent socket, a failed read, or every
+    `rediscover_seconds` when netlink is unavailable or as a safety net.
+    """
+
+    def __init__(self, root: Path = POWER_SUPPLY_ROOT, *, rediscover_seconds: float = _REDISCOVER_SECONDS) -> None:
+        self.root = root
+        self.rediscover_seconds = rediscover_seconds
+        self.discoveries = 0
+        self._supplies: list[_Supply] = []
+        self._discovered_at: float | None = None
+        self._hotplug: _HotplugMonitor | None
+        try:
+            self._hotplug = _HotplugMonitor()
+        except OSError:
+            self._hotplug = None
+
+    @property
+    def mode(self) -> str:
+        return "netlink" if self._hotplug is not None else "timer"
+
+    def _stale(self) -> bool:
+        if self._discovered_at is None:
+            return True
+        if self._hotplug is not None:
+            try:
+                if self._hotplug.supplies_changed():
+                    return True
+            except OSError:
+                self._hotplug.close()
+                self._hotplug = None
+        return time.monotonic() - self._discovered_at >= self.rediscover_seconds
+
+    def _discover(self) -> None:
+        self._close_files()
+        self.discoveries += 1
+        self._discovered_at = time.monotonic()
+        try:
+            entries = [entry for entry in self.root.iterdir() if entry.is_dir()]
+        except OSError:
+            return
+        entries.sort(key=lambda p: p.name.lower())
+        for path in entries:
+            try:
+                uevent = ProcFile(str(path / "uevent"), size=4096)
+            except OSError:
+                continue
+            self._supplies.append(_Supply(path.name, (_read_text(path / "type") or "").lower(), uevent))
+
+    def read(self) -> list[tuple[str, str, dict[str, str]]]:
+        """(name, type, uevent properties) for every supply, rediscovering first if stale."""
+        if self._stale():
+            self._discover()
+        out: list[tuple[str, str, dict[str, str]]] = []
+        failed = False
+        for supply in self._supplies:
+            try:
+                data = supply.uevent.read()
+            except OSError:
+                # Removed (ENODEV) or a driver error; the next poll lists supplies again.
+                failed = True
+                continue
+            out.append((supply.name, supply.type, _parse_uevent(data)))
+        if failed:
+            self._discovered_at = None
+        return out
+
+    def _close_files(self) -> None:
+        for supply in self._supplies:
+            supply.uevent.close()
+        self._supplies = []
+
+    def close(self) -> None:
+        self._close_files()
+        if self._hotplug is not None:
+            self._hotplug.close()
+            self._hotplug = None
+
+
+def _mains_online(supplies: list[tuple[str, str, dict[str, str]]]) -> bool | None:
     states: list[bool] = []
-    for path in _supply_dirs():
-        supply_type = (_read_text(path / "type") or "").lower()
-        online = _read_int(path / "online")
+    for _name, supply_type, props in supplies:
+        online = _prop_int(props, "online")
         if online is None:
             continue
-        if supply_type in {"mains", "usb", "usb-c", "usb_pd", "wireless"}:
+        if supply_type in _EXTERNAL_SUPPLY_TYPES:
             states.append(online != 0)
     if not states:
         return None
     return any(states)
 
 
-def _read_battery(path: Path) -> dict[str, Any]:
-    status = _read_text(path / "status")
+def _read_battery(name: str, props: dict[str, str]) -> dict[str, Any]:
+    status = props.get("status")
     status_norm = (status or "").lower()
 
-    capacity = _read_int(path / "capacity")
-    energy_now_wh = _read_micro_as_base(path / "energy_now")
-    energy_full_wh = _read_micro_as_base(path / "energy_full")
+    capacity = _prop_int(props, "capacity")
+    energy_now_wh = _prop_micro_as_base(props, "energy_now")
+    energy_full_wh = _prop_micro_as_base(props, "energy_full")
     if capacity is None and energy_now_wh is not None and energy_full_wh is not None and energy_full_wh > 0:
         capacity = int(round((energy_now_wh / energy_full_wh) * 100.0))
     if capacity is not None:
         capacity = max(0, min(100, capacity))
 
-    present_raw = _read_int(path / "present")
+    present_raw = _prop_int(props, "present")
 
     data = {
-        "name": path.name,
+        "name": name,
         "status": status,
         "capacity_percent": float(capacity) if capacity is not None else None,
         "is_charging": status_norm == "charging" if status else None,
         "is_discharging": status_norm == "discharging" if status else None,
         "is_full": status_norm == "full" if status else None,
         "present": (present_raw != 0) if present_raw is not None else None,
-        "voltage_v": _read_micro_as_base(path / "voltage_now"),
-        "current_a": _read_micro_as_base(path / "current_now"),
-        "power_w": _read_micro_as_base(path / "power_now"),
+        "voltage_v": _prop_micro_as_base(props, "voltage_now"),
+        "current_a": _prop_micro_as_base(props, "current_now"),
+        "power_w": _prop_micro_as_base(props, "power_now"),
         "energy_now_wh": energy_now_wh,
         "energy_full_wh": energy_full_wh,
-        "energy_full_design_wh": _read_micro_as_base(path / "energy_full_design"),
-        "charge_now_ah": _read_micro_as_base(path / "charge_now"),
-        "charge_full_ah": _read_micro_as_base(path / "charge_full"),
-        "charge_full_design_ah": _read_micro_as_base(path / "charge_full_design"),
-        "technology": _read_text(path / "technology"),
-        "cycle_count": _read_int(path / "cycle_count"),
-        "temperature_c": _read_temp_c(path / "temp"),
-        "time_to_empty_seconds": _read_int(path / "time_to_empty_now"),
-        "time_to_full_seconds": _read_int(path / "time_to_full_now"),
+        "energy_full_design_wh": _prop_micro_as_base(props, "energy_full_design"),
+        "charge_now_ah": _prop_micro_as_base(props, "charge_now"),
+        "charge_full_ah": _prop_micro_as_base(props, "charge_full"),
+        "charge_full_design_ah": _prop_micro_as_base(props, "charge_full_design"),
+        "technology": props.get("technology"),
+        "cycle_count": _prop_int(props, "cycle_count"),
+        "temperature_c": _prop_temp_c(props, "temp"),
+        "time_to_empty_seconds": _prop_int(props, "time_to_empty_now"),
+        "time_to_full_seconds": _prop_int(props, "time_to_full_now"),
     }
     return _compact(data)
 
@@ -165,9 +290,10 @@ def _aggregate_capacity_percent(batteries: list[dict[str, Any]]) -> float | None
     return round(sum(capacity_values) / len(capacity_values), 3)
 
 
-def _collect_snapshot() -> dict[str, Any]:
-    batteries = [_read_battery(path) for path in _battery_dirs()]
-    mains_online = _mains_online()
+def _collect_snapshot(index: SupplyIndex) -> dict[str, Any]:
+    supplies = index.read()
+    batteries = [_read_battery(name, props) for name, supply_type, props in supplies if supply_type == "battery"]
+    mains_online = _mains_online(supplies)
     if not batteries:
         payload = {
             "available": False,
@@ -192,6 +318,23 @@ def _collect_snapshot() -> dict[str, Any]:
     return _compact(payload)
 
 
+def _metric_values(snapshot: dict[str, Any]) -> dict[str, float]:
+    """Numeric samples for the server's metric store (totals across batteries)."""
+    values: dict[str, float] = {}
+    capacity = snapshot.get("capacity_percent")
+    if isinstance(capacity, (int, float)):
+        values["capacity_percent"] = float(capacity)
+    batteries = snapshot.get("batteries") or []
+    for key in ("power_w", "energy_now_wh"):
+        readings = [b[key] for b in batteries if isinstance(b.get(key), (int, float))]
+        if readings:
+            values[key] = round(sum(readings), 6)
+    mains_online = snapshot.get("mains_online")
+    if isinstance(mains_online, bool):
+        values["mains_online"] = 1.0 if mains_online else 0.0
+    return values
+
+
 @dataclass
 class BatteryWatcher:
     server_url: str
@@ -202,11 +345,13 @@ class BatteryWatcher:
     def __post_init__(self) -> None:
         self._last_sent_state: str | None = None
         self._last_sent_at: float = 0.0
+        self.supplies = SupplyIndex()
 
     async def maybe_send(self, *, data: dict[str, Any], force: bool) -> None:
         now = time.monotonic()
-        state_json = _canonical_json(data)
-        should_send = force or state_json != self._last_sent_state
+        state_json = canonical_json(data)
+        changed = state_json != self._last_sent_state
+        should_send = force or changed
         if self.heartbeat_seconds > 0 and (now - self._last_sent_at) >= self.heartbeat_seconds:
             should_send = True
         if not should_send:
@@ -215,17 +360,21 @@ class BatteryWatcher:
         ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
         payload = {"bucket": "battery", "source": self.source, "ts": ts, "data": data}
 
-        client = ActiveWatcherAsyncClient(self.server_url)
-        try:
-            await client.post_state(payload)
-            self._last_sent_state = state_json
-            self._last_sent_at = now
-        finally:
-            await client.aclose()
+        # Spooled to disk first; the outbox drains it to the server in the background.
+        await shared_outbox(self.server_url, "battery").put("state" if changed else "touch", payload)
+        self._last_sent_state = state_json
+        self._last_sent_at = now
+
+    async def send_metrics(self, values: dict[str, float]) -> None:
+        if not values:
+            return
+        ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        await shared_outbox(self.server_url, "battery").put("metrics", {"source": self.source, "ts": ts, "values": values})
 
     async def tick(self) -> None:
-        data = _collect_snapshot()
+        data = _collect_snapshot(self.supplies)
         await self.maybe_send(data=data, force=False)
+        await self.send_metrics(_metric_values(data))
 
 
 async def run(
@@ -241,11 +390,11 @@ async def run(
         poll_seconds=poll_seconds,
         heartbeat_seconds=heartbeat_seconds,
     )
-    print(f"[battery] poll={poll_seconds}s heartbeat={heartbeat_seconds}s")
+    print(f"[battery] poll={poll_seconds}s heartbeat={heartbeat_seconds}s discovery={watcher.supplies.mode}")
 
     while True:
         try:
             await watcher.tick()
         except Exception as e:
             print(f"[battery] error: {e}")
-        await asyncio.sleep(max(0.2, poll_seconds))
+        await sleep_aligned(poll_seconds)
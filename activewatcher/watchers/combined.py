@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+WATCHERS = ("hyprland", "idle", "system", "battery")
+
+_RESTART_DELAY_SECONDS = 5.0
+
+
+async def _supervise(name: str, start: Callable[[], Awaitable[None]]) -> None:
+    # Watchers loop forever on their own; this only catches startup failures (no Hyprland
+    # session yet, logind not reachable, ...) so one watcher can't take the others down.
+    while True:
+        try:
+            await start()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[all] {name} stopped: {e}; restarting in {_RESTART_DELAY_SECONDS:.0f}s")
+            await asyncio.sleep(_RESTART_DELAY_SECONDS)
+
+
+async def run(*, server_url: str, watchers: dict[str, dict[str, Any]]) -> None:
+    """Run several watchers as tasks of one event loop.
+
+    `watchers` maps a watcher name to the keyword arguments of its module's `run()`
+    (without server_url). The tasks share the process-wide HTTP client, send queue and
+    aligned poll ticks.
+    """
+    if not watchers:
+        print("[all] no watchers enabled")
+        return
+    tasks = []
+    for name, kwargs in watchers.items():
+        module = importlib.import_module(f"activewatcher.watchers.{name}")
+        start = lambda module=module, kwargs=kwargs: module.run(server_url=server_url, **kwargs)  # noqa: E731
+        tasks.append(asyncio.create_task(_supervise(name, start), name=f"watch-{name}"))
+    print(f"[all] running {', '.join(watchers)}")
+    await asyncio.gather(*tasks)
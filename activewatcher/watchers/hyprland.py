@@ -9,8 +9,19 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from activewatcher.common.http import ActiveWatcherAsyncClient
-from activewatcher.common.models import END_MARKER_KEY
+from activewatcher.common.protocol import END_MARKER_KEY, canonical_json
+from activewatcher.common.spool import RecordKind, shared_outbox
+
+from .hyprland_ipc import HyprlandIPC
+from .hyprland_model import ALL_FACETS, MODEL_VIEWS, HyprlandModel, event_facets, facet_views
+from .proctree import ProcessTreeSampler
+from .schedule import sleep_aligned
+
+
+# Marks heartbeat payloads whose data is unchanged; they are sent as /v1/touch lease renewals.
+_TOUCH_KEY = "__touch__"
+# Marks focused-process resource samples (spooled as "process" records).
+_PROCESS_KEY = "__process__"
 
 
 def socket2_path() -> str:
@@ -29,62 +40,6 @@ def socket1_path_from_socket2(socket2: str) -> str:
     return str(pathlib.Path(socket2).with_name(".socket.sock"))
 
 
-async def _hypr_socket_json(socket1: str, command: str) -> Any:
-    last_error: Exception | None = None
-    for suffix in ("", "\n"):
-        reader, writer = await asyncio.open_unix_connection(socket1)
-        try:
-            writer.write(f"j/{command}{suffix}".encode("utf-8", "strict"))
-            await writer.drain()
-            buf = bytearray()
-            loop = asyncio.get_running_loop()
-            deadline = loop.time() + 2.0
-            while True:
-                timeout = min(0.2, max(0.0, deadline - loop.time()))
-                if timeout <= 0:
-                    break
-                try:
-                    chunk = await asyncio.wait_for(reader.read(4096), timeout=timeout)
-                except asyncio.TimeoutError:
-                    break
-                if not chunk:
-                    break
-                buf += chunk
-                text = buf.decode("utf-8", "replace").strip()
-                if not text:
-                    continue
-                try:
-                    return json.loads(text)
-                except json.JSONDecodeError:
-                    continue
-
-            text = buf.decode("utf-8", "replace").strip()
-            if not text:
-                last_error = RuntimeError("empty response")
-                continue
-            try:
-                return json.loads(text)
-            except json.JSONDecodeError:
-                last_error = RuntimeError(f"invalid Hyprland IPC JSON for {command}: {text[:200]}")
-                continue
-        except Exception as e:
-            last_error = e
-        finally:
-            writer.close()
-            try:
-                await writer.wait_closed()
-            except Exception:
-                pass
-
-    if last_error:
-        raise last_error
-    return None
-
-
-def _canonical_json(data: dict[str, Any]) -> str:
-    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
-
-
 def _truncate_title(title: str, max_len: int) -> str:
     t = " ".join(title.split())
     if max_len <= 0:
@@ -125,6 +80,12 @@ def _ws_id(value: Any) -> int | None:
     return None
 
 
+def _pid(value: Any) -> int | None:
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+
 def _monitor_id(value: Any) -> int | None:
     if isinstance(value, int):
         return value
@@ -264,12 +225,13 @@ def _workspace_payload(
 
 async def _get_focused_state(
     *,
-    socket1_path: str,
+    ipc: HyprlandIPC,
     title_max_len: int,
     monitors: list[dict[str, Any]] | None,
 ) -> dict[str, Any]:
-    active_window = await _hypr_socket_json(socket1_path, "activewindow")
-    active_ws = await _hypr_socket_json(socket1_path, "activeworkspace")
+    views = await ipc.query("activewindow", "activeworkspace")
+    active_window = views["activewindow"]
+    active_ws = views["activeworkspace"]
 
     workspace = None
     monitor = None
@@ -298,7 +260,7 @@ async def _get_focused_state(
     if monitor and monitor.isdigit():
         if monitors is None:
             try:
-                monitors_raw = await _hypr_socket_json(socket1_path, "monitors")
+                monitors_raw = await ipc.get("monitors")
             except Exception:
                 monitors_raw = None
             if isinstance(monitors_raw, list):
@@ -315,6 +277,7 @@ async def _get_focused_state(
         "monitor": monitor,
         "xwayland": xwayland,
         "no_focus": False,
+        "pid": _pid(active_window.get("pid")),
     }
 
 
@@ -376,6 +339,7 @@ def _window_payload_data(
         "monitor": monitor_name,
         "xwayland": xwayland,
         "no_focus": False,
+        "pid": _pid(client.get("pid")),
     }
 
 
@@ -391,44 +355,131 @@ class HyprlandWatcher:
     visible_all_monitors: bool
     track_open_apps: bool
     track_workspaces: bool
+    process_sample_seconds: float = 0.0
 
     def __post_init__(self) -> None:
         self._pending: asyncio.Task | None = None
-        self._socket1_path: str | None = None
+        self._refresh_again = False
+        self._force_refresh = False
+        self._ipc: HyprlandIPC | None = None
+        self._model = HyprlandModel()
+        self._resync_needed = True
+        self._resyncing = False
+        self._events_during_resync: list[tuple[str, str]] = []
+        self._model_events = 0
+        self._resyncs = 0
+        self._partial_resyncs = 0
+        # Facets touched by the events coalesced into the next refresh, and the subset the
+        # model could not patch from event payloads (refetched from socket1 on their own).
+        self._dirty: set[str] = set(ALL_FACETS)
+        self._stale: set[str] = set()
         self._last_focused_state: dict[str, Any] | None = None
         self._last_focused_sent_state: str | None = None
         self._last_focused_sent_at: float = 0.0
 
-        self._visible_sent_state: dict[str, str] = {}
+        self._visible_sent_json: str | None = None
         self._last_visible_sent_at: float = 0.0
 
-        self._open_apps_sent: set[str] = set()
+        self._open_apps_sent_json: str | None = None
         self._last_open_apps_sent_at: float = 0.0
 
         self._last_workspace_state: dict[str, Any] | None = None
         self._last_workspace_key: str | None = None
         self._last_workspace_sent_at: float = 0.0
+        self._last_workspace_sent_data: dict[str, Any] | None = None
+
+        self._process_sampler = ProcessTreeSampler() if self.process_sample_seconds > 0 else None
+        self._process_task: asyncio.Task | None = None
 
     def set_socket1_path(self, socket1_path: str) -> None:
-        self._socket1_path = socket1_path
+        if self._ipc is None or self._ipc.socket_path != socket1_path:
+            self._ipc = HyprlandIPC(socket1_path)
+            self._resync_needed = True
 
-    def trigger_refresh(self) -> None:
+    def stats(self) -> dict[str, Any]:
+        return {
+            "ipc": self._ipc.stats.to_json() if self._ipc is not None else None,
+            "model_events": self._model_events,
+            "resyncs": self._resyncs,
+            "partial_resyncs": self._partial_resyncs,
+            "process_sampler": self._process_sampler.stats() if self._process_sampler is not None else None,
+            **shared_outbox(self.server_url, "hyprland").stats(),
+        }
+
+    def handle_event(self, event: str, payload: str) -> None:
+        facets = event_facets(event)
+        self._dirty |= facets
+        if self._resyncing:
+            self._events_during_resync.append((event, payload))
+        elif self._model.apply(event, payload):
+            self._model_events += 1
+        else:
+            self._stale |= facets
+        self.trigger_refresh()
+
+    def trigger_refresh(self, *, force: bool = False) -> None:
+        self._force_refresh = self._force_refresh or force
         if self._pending and not self._pending.done():
+            # Events that arrive while a refresh is running still need their own pass.
+            self._refresh_again = True
             return
         self._pending = asyncio.create_task(self._debounced_refresh())
 
     async def _debounced_refresh(self) -> None:
-        await asyncio.sleep(max(0.0, self.debounce_ms / 1000.0))
+        while True:
+            self._refresh_again = False
+            await asyncio.sleep(max(0.0, self.debounce_ms / 1000.0))
+            force, self._force_refresh = self._force_refresh, False
+            try:
+                await self.refresh_and_send(force=force)
+            except Exception as e:
+                print(f"[hyprland] refresh failed: {e}")
+            if not self._refresh_again:
+                return
+
+    async def _load_views(self, ipc: HyprlandIPC, *, resync: bool) -> None:
+        full = resync or self._resync_needed or not self._model.loaded or self._stale >= ALL_FACETS
+        if not full and not self._stale:
+            ipc.prime(self._model.views())
+            return
+
+        # A partial resync only asks socket1 for the views behind the stale facets and merges
+        # them into the model; everything else keeps coming from event payloads.
+        stale, self._stale = self._stale, set()
+        commands = MODEL_VIEWS if full else facet_views(stale)
+        # Events arriving until the model is consistent again (including the fallback full
+        # query below) are buffered and replayed on top of it.
+        self._resyncing = True
         try:
-            await self.refresh_and_send(force=False)
-        except Exception as e:
-            print(f"[hyprland] refresh failed: {e}")
+            try:
+                views = await ipc.query(*commands)
+            except Exception:
+                self._stale |= stale
+                raise
+            if full:
+                self._resyncs += 1
+                self._resync_needed = not self._model.load(views)
+            else:
+                self._partial_resyncs += 1
+                if not self._model.merge(views):
+                    # e.g. the active window is missing from a model whose clients weren't stale.
+                    self._resyncs += 1
+                    self._resync_needed = True  # stays set if the fallback query fails
+                    self._resync_needed = not self._model.load(await ipc.query(*MODEL_VIEWS))
+        finally:
+            self._resyncing = False
+        pending, self._events_during_resync = self._events_during_resync, []
+        for event, payload in pending:
+            if not self._model.apply(event, payload):
+                self._stale |= event_facets(event)
+        if not self._resync_needed and not self._stale:
+            ipc.prime(self._model.views())
 
-    def _window_source(self, address: str) -> str:
-        return f"{self.source}:win:{address}"
+    def _window_set_source(self) -> str:
+        return f"{self.source}:win"
 
-    def _app_source(self, app: str) -> str:
-        return f"{self.source}:app:{app}"
+    def _app_set_source(self) -> str:
+        return f"{self.source}:app"
 
     def _workspace_source(self) -> str:
         return f"{self.source}:workspace"
@@ -439,19 +490,30 @@ class HyprlandWatcher:
     async def _post_payloads(self, payloads: list[dict[str, Any]]) -> bool:
         if not payloads:
             return True
-        client = ActiveWatcherAsyncClient(self.server_url)
+
+        records: list[tuple[RecordKind, dict[str, Any]]] = []
+        for payload in payloads:
+            if payload.pop(_PROCESS_KEY, False):
+                records.append(("process", payload))
+            elif "items" in payload:
+                records.append(("set", payload))
+            elif payload.pop(_TOUCH_KEY, False):
+                records.append(("touch", payload))
+            else:
+                records.append(("state", payload))
+
+        # Records are spooled to disk and drained in the background, so a slow or restarting
+        # server neither blocks this refresh nor loses the state changes.
         try:
-            for payload in payloads:
-                await client.post_state(payload)
+            await shared_outbox(self.server_url, "hyprland").put_many(records)
         except Exception as e:
             print(f"[hyprland] post_state failed: {e}")
             return False
-        finally:
-            await client.aclose()
         return True
 
     async def refresh_and_send(self, *, force: bool) -> None:
-        if not self._socket1_path:
+        ipc = self._ipc
+        if ipc is None:
             return
         now = time.monotonic()
         now_dt = datetime.now(timezone.utc)
@@ -462,10 +524,22 @@ class HyprlandWatcher:
 
         monitors: list[dict[str, Any]] | None = None
         clients: list[dict[str, Any]] | None = None
+        dirty, self._dirty = (set(ALL_FACETS) if force else self._dirty), set()
+
+        # Serve this refresh from the event-driven model; a full batched socket1 resync only
+        # happens at startup, on heartbeats (force) or after an event the model can't apply.
+        # The per-view lookups below are then answered from the IPC cache.
+        ipc.invalidate()
+        try:
+            await self._load_views(ipc, resync=force)
+        except Exception as e:
+            self._resync_needed = True
+            dirty = set(ALL_FACETS)
+            print(f"[hyprland] batched fetch failed: {e}")
 
         if self.track_visible_windows or self.track_workspaces:
             try:
-                monitors_raw = await _hypr_socket_json(self._socket1_path, "monitors")
+                monitors_raw = await ipc.get("monitors")
                 if isinstance(monitors_raw, list):
                     monitors = [m for m in monitors_raw if isinstance(m, dict)]
             except Exception as e:
@@ -474,7 +548,7 @@ class HyprlandWatcher:
 
         if self.track_visible_windows or self.track_open_apps:
             try:
-                clients_raw = await _hypr_socket_json(self._socket1_path, "clients")
+                clients_raw = await ipc.get("clients")
                 if isinstance(clients_raw, list):
                     clients = [c for c in clients_raw if isinstance(c, dict)]
             except Exception as e:
@@ -489,19 +563,24 @@ class HyprlandWatcher:
         if self.track_focused:
             try:
                 next_focused_state = await _get_focused_state(
-                    socket1_path=self._socket1_path,
+                    ipc=ipc,
                     title_max_len=self.title_max_len,
                     monitors=monitors,
                 )
             except Exception as e:
                 print(f"[hyprland] focused state fetch failed: {e}")
                 return
-            next_focused_state_json = _canonical_json(next_focused_state)
+            next_focused_state_json = canonical_json(next_focused_state)
             focused_should_send = force or next_focused_state_json != self._last_focused_sent_state
             if self.heartbeat_seconds > 0 and (now - self._last_focused_sent_at) >= self.heartbeat_seconds:
                 focused_should_send = True
             if focused_should_send:
-                payloads.append({"bucket": "window", "source": self.source, "ts": ts, "data": next_focused_state})
+                payload = {"bucket": "window", "source": self.source, "ts": ts, "data": next_focused_state}
+                if next_focused_state_json == self._last_focused_sent_state:
+                    payload[_TOUCH_KEY] = True
+                elif self._process_sampler is not None:
+                    payloads.extend(self._process_handover(next_focused_state, now_dt))
+                payloads.append(payload)
 
         workspace_state: dict[str, Any] | None = None
         workspace_key: str | None = None
@@ -510,7 +589,7 @@ class HyprlandWatcher:
         workspace_payload: dict[str, Any] | None = None
         if self.track_workspaces:
             try:
-                active_ws_raw = await _hypr_socket_json(self._socket1_path, "activeworkspace")
+                active_ws_raw = await ipc.get("activeworkspace")
                 if isinstance(active_ws_raw, dict):
                     workspace_state, workspace_key = _workspace_payload(
                         active_ws=active_ws_raw,
@@ -545,7 +624,7 @@ class HyprlandWatcher:
                             }
                         )
                 else:
-                    workspace_payload = dict(self._last_workspace_state)
+                    workspace_payload = dict(self._last_workspace_sent_data or self._last_workspace_state)
 
                 payloads.append(
                     {
@@ -553,6 +632,7 @@ class HyprlandWatcher:
                         "source": self._workspace_source(),
                         "ts": ts,
                         "data": workspace_payload,
+                        _TOUCH_KEY: not workspace_key_changed and self._last_workspace_sent_data is not None,
                     }
                 )
 
@@ -610,8 +690,11 @@ class HyprlandWatcher:
             if (now - self._last_visible_sent_at) >= self.heartbeat_seconds:
                 visible_should_force = True
 
-        next_visible_sent_state = dict(self._visible_sent_state)
-        if self.track_visible_windows and monitors is not None and clients is not None:
+        # Visible windows don't depend on which one is focused; skip the rebuild and diff
+        # when nothing but focus changed.
+        visible_dirty = visible_should_force or bool(dirty - {"focus"})
+        next_visible_sent_json: str | None = None
+        if self.track_visible_windows and visible_dirty and monitors is not None and clients is not None:
             included_monitors: list[dict[str, Any]]
             if self.visible_all_monitors:
                 included_monitors = monitors
@@ -638,71 +721,43 @@ class HyprlandWatcher:
                         continue
                     current_visible[str(data["address"])] = data
 
-            current_addrs = set(current_visible.keys())
-            sent_addrs = set(self._visible_sent_state.keys())
-
-            for addr in sorted(sent_addrs - current_addrs):
+            visible_json = canonical_json(current_visible)
+            if visible_should_force or visible_json != self._visible_sent_json:
                 payloads.append(
                     {
                         "bucket": "window_visible",
-                        "source": self._window_source(addr),
+                        "source": self._window_set_source(),
                         "ts": ts,
-                        "data": {END_MARKER_KEY: True},
+                        "items": current_visible,
                     }
                 )
-                next_visible_sent_state.pop(addr, None)
-
-            for addr in sorted(current_addrs):
-                data = current_visible[addr]
-                data_json = _canonical_json(data)
-                prev_json = self._visible_sent_state.get(addr)
-                should_send = visible_should_force or prev_json != data_json
-                if should_send:
-                    payloads.append(
-                        {
-                            "bucket": "window_visible",
-                            "source": self._window_source(addr),
-                            "ts": ts,
-                            "data": data,
-                        }
-                    )
-                    next_visible_sent_state[addr] = data_json
+                next_visible_sent_json = visible_json
 
         open_apps_should_force = force
         if self.track_open_apps and self.heartbeat_seconds > 0:
             if (now - self._last_open_apps_sent_at) >= self.heartbeat_seconds:
                 open_apps_should_force = True
 
-        next_open_apps_sent = set(self._open_apps_sent)
-        if self.track_open_apps and clients is not None:
-            current_apps: set[str] = set()
+        open_apps_dirty = open_apps_should_force or "clients" in dirty
+        next_open_apps_sent_json: str | None = None
+        if self.track_open_apps and open_apps_dirty and clients is not None:
+            current_apps: dict[str, dict[str, Any]] = {}
             for c in clients:
                 app = str(c.get("class") or "")
                 if app:
-                    current_apps.add(app)
+                    current_apps[app] = {"app": app}
 
-            for app in sorted(self._open_apps_sent - current_apps):
+            apps_json = canonical_json(current_apps)
+            if open_apps_should_force or apps_json != self._open_apps_sent_json:
                 payloads.append(
                     {
                         "bucket": "app_open",
-                        "source": self._app_source(app),
+                        "source": self._app_set_source(),
                         "ts": ts,
-                        "data": {END_MARKER_KEY: True},
+                        "items": current_apps,
                     }
                 )
-                next_open_apps_sent.discard(app)
-
-            for app in sorted(current_apps):
-                if open_apps_should_force or app not in self._open_apps_sent:
-                    payloads.append(
-                        {
-                            "bucket": "app_open",
-                            "source": self._app_source(app),
-                            "ts": ts,
-                            "data": {"app": app},
-                        }
-                    )
-                    next_open_apps_sent.add(app)
+                next_open_apps_sent_json = apps_json
 
         if not payloads:
             if next_focused_state is not None:
@@ -725,12 +780,12 @@ class HyprlandWatcher:
             self._last_focused_state = next_focused_state
 
         if self.track_visible_windows and sent_visible_payload:
-            self._visible_sent_state = next_visible_sent_state
+            self._visible_sent_json = next_visible_sent_json
         if self.track_visible_windows and (sent_visible_payload or visible_should_force):
             self._last_visible_sent_at = now
 
         if self.track_open_apps and sent_apps_payload:
-            self._open_apps_sent = next_open_apps_sent
+            self._open_apps_sent_json = next_open_apps_sent_json
         if self.track_open_apps and (sent_apps_payload or open_apps_should_force):
             self._last_open_apps_sent_at = now
 
@@ -741,9 +796,83 @@ class HyprlandWatcher:
                 self._last_workspace_state = workspace_state
             if self._last_workspace_state is None and workspace_state is not None:
                 self._last_workspace_state = workspace_state
+            if workspace_payload is not None:
+                self._last_workspace_sent_data = workspace_payload
             self._last_workspace_sent_at = now
 
-    async def send_heartbeat_if_due(self) -> None:
+    def _process_payload(self, state: dict[str, Any] | None, ts: str) -> dict[str, Any] | None:
+        """Sample the tree of `state`'s process; None for a baseline or without a pid."""
+        pid = _pid((state or {}).get("pid"))
+        if self._process_sampler is None or pid is None:
+            return None
+        sample = self._process_sampler.sample(pid)
+        if sample is None or sample.is_baseline:
+            return None
+        return {
+            "bucket": "window",
+            "source": self.source,
+            "ts": ts,
+            "pid": pid,
+            "app": (state or {}).get("app"),
+            "cpu_seconds": round(sample.cpu_seconds, 3),
+            "interval_seconds": round(sample.interval_seconds, 3),
+            "rss_bytes": sample.rss_bytes,
+            "processes": sample.processes,
+            _PROCESS_KEY: True,
+        }
+
+    def _process_handover(self, next_state: dict[str, Any], now_dt: datetime) -> list[dict[str, Any]]:
+        # Close out the interval that is ending with a final sample stamped just before the
+        # new state (so the server attributes it to the old window), then baseline the new
+        # process so its first periodic sample only covers time it had focus.
+        payloads: list[dict[str, Any]] = []
+        prev_state = self._last_focused_state
+        ts_prev = (now_dt - timedelta(milliseconds=1)).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        closing = self._process_payload(prev_state, ts_prev)
+        if closing is not None:
+            payloads.append(closing)
+        if _pid(next_state.get("pid")) != _pid((prev_state or {}).get("pid")):
+            self._process_payload(next_state, ts_prev)
+        return payloads
+
+    async def sample_focused_process(self) -> None:
+        if self._last_focused_sent_state is None:
+            return
+        ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        payload = self._process_payload(self._last_focused_state, ts)
+        if payload is not None:
+            await self._post_payloads([payload])
+
+    def start_process_sampling(self) -> None:
+        if self._process_sampler is not None and self._process_task is None:
+            self._process_task = asyncio.create_task(self._sample_processes())
+
+    async def _sample_processes(self) -> None:
+        while True:
+            await sleep_aligned(self.process_sample_seconds)
+            try:
+                await self.sample_focused_process()
+            except Exception as e:
+                print(f"[hyprland] process sample failed: {e}")
+
+    def heartbeat_due_in(self) -> float | None:
+        """Seconds until send_heartbeat_if_due would fire, or None without heartbeats."""
+        if self.heartbeat_seconds <= 0:
+            return None
+        sent_at: list[float] = []
+        if self.track_focused and self._last_focused_state is not None:
+            sent_at.append(self._last_focused_sent_at)
+        if self.track_visible_windows:
+            sent_at.append(self._last_visible_sent_at)
+        if self.track_open_apps:
+            sent_at.append(self._last_open_apps_sent_at)
+        if self.track_workspaces and self._last_workspace_state is not None:
+            sent_at.append(self._last_workspace_sent_at)
+        if not sent_at:
+            return float(self.heartbeat_seconds)
+        return max(0.0, min(sent_at) + self.heartbeat_seconds - time.monotonic())
+
+    def send_heartbeat_if_due(self) -> None:
         if self.heartbeat_seconds <= 0:
             return
         now = time.monotonic()
@@ -762,7 +891,7 @@ class HyprlandWatcher:
                 should = True
         if not should:
             return
-        await self.refresh_and_send(force=True)
+        self.trigger_refresh(force=True)
 
 
 async def run(
@@ -777,6 +906,8 @@ async def run(
     visible_all_monitors: bool,
     track_open_apps: bool,
     track_workspaces: bool,
+    stats_seconds: int = 0,
+    process_sample_seconds: float = 0.0,
 ) -> None:
     watcher = HyprlandWatcher(
         server_url=server_url,
@@ -789,7 +920,9 @@ async def run(
         visible_all_monitors=visible_all_monitors,
         track_open_apps=track_open_apps,
         track_workspaces=track_workspaces,
+        process_sample_seconds=process_sample_seconds,
     )
+    watcher.start_process_sampling()
 
     relevant_prefixes = (
         "activewindow",
@@ -806,6 +939,8 @@ async def run(
         "monitorremoved",
     )
 
+    last_stats_at = time.monotonic()
+
     while True:
         path = socket2_path()
         socket1 = socket1_path_from_socket2(path)
@@ -818,13 +953,22 @@ async def run(
             continue
 
         print(f"[hyprland] listening on {path}")
-        await watcher.refresh_and_send(force=True)
+        watcher.trigger_refresh(force=True)
 
         try:
             while True:
-                await watcher.send_heartbeat_if_due()
+                watcher.send_heartbeat_if_due()
+                if stats_seconds > 0 and (time.monotonic() - last_stats_at) >= stats_seconds:
+                    last_stats_at = time.monotonic()
+                    print(f"[hyprland] stats: {json.dumps(watcher.stats(), sort_keys=True)}")
+                # Sleep until the next heartbeat or stats report is due rather than polling every
+                # second; socket2 lines still wake the loop immediately.
+                due_in = watcher.heartbeat_due_in()
+                timeout = 30.0 if due_in is None else due_in
+                if stats_seconds > 0:
+                    timeout = min(timeout, last_stats_at + stats_seconds - time.monotonic())
                 try:
-                    line = await asyncio.wait_for(reader.readline(), timeout=1.0)
+                    line = await asyncio.wait_for(reader.readline(), timeout=min(30.0, max(0.2, timeout)))
                 except asyncio.TimeoutError:
                     continue
                 if not line:
@@ -832,9 +976,9 @@ async def run(
                 msg = line.decode("utf-8", "replace").strip()
                 if not msg:
                     continue
-                event, _, _data = msg.partition(">>")
+                event, _, data = msg.partition(">>")
                 if event.startswith(relevant_prefixes):
-                    watcher.trigger_refresh()
+                    watcher.handle_event(event, data)
         except Exception as e:
             print(f"[hyprland] disconnected: {e}")
             await asyncio.sleep(0.5)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any
+
+_DECODER = json.JSONDecoder()
+_REPLY_TIMEOUT_SECONDS = 2.0
+
+
+@dataclass
+class IpcStats:
+    requests: int = 0
+    commands: int = 0
+    cache_hits: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+
+    def record(self, *, commands: int, elapsed_ms: float) -> None:
+        self.requests += 1
+        self.commands += commands
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "commands": self.commands,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 3) if self.requests else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_ms": round(self.last_ms, 3),
+        }
+
+
+def _decode_values(text: str, count: int) -> list[Any] | None:
+    values: list[Any] = []
+    idx = 0
+    end = len(text)
+    while len(values) < count:
+        while idx < end and text[idx].isspace():
+            idx += 1
+        if idx >= end:
+            return None
+        try:
+            value, idx = _DECODER.raw_decode(text, idx)
+        except json.JSONDecodeError:
+            return None
+        values.append(value)
+    return values
+
+
+async def _read_reply(reader: asyncio.StreamReader, count: int) -> tuple[bytes, list[Any] | None]:
+    """Read until EOF or until `count` JSON values have arrived; returns the bytes and values.
+
+    Decoding is only tried on a chunk that ends like a finished value (`}`, `]` or
+    whitespace), so a large reply is not re-parsed after every chunk. The reply timeout only
+    bounds a socket that neither closes nor completes the reply.
+    """
+    buf = bytearray()
+    deadline = time.monotonic() + _REPLY_TIMEOUT_SECONDS
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        chunk = await asyncio.wait_for(reader.read(65536), timeout=remaining)
+        if not chunk:
+            return bytes(buf), _decode_values(buf.decode("utf-8", "replace"), count)
+        buf += chunk
+        if chunk[-1:] in (b"}", b"]") or chunk[-1:].isspace():
+            values = _decode_values(buf.decode("utf-8", "replace"), count)
+            if values is not None:
+                return bytes(buf), values
+
+
+async def _hypr_socket_request(socket1: str, request: str, *, count: int) -> list[Any]:
+    # Hyprland answers one request per connection and closes it; the reply is read into one
+    # buffer, returning at EOF or as soon as all `count` values decode, whichever is first.
+    last_error: Exception | None = None
+    for suffix in ("", "\n"):
+        reader, writer = await asyncio.open_unix_connection(socket1)
+        try:
+            writer.write(f"{request}{suffix}".encode("utf-8", "strict"))
+            await writer.drain()
+            raw, values = await _read_reply(reader, count)
+            if values is not None:
+                return values
+            text = raw.decode("utf-8", "replace")
+            if not text.strip():
+                last_error = RuntimeError("empty response")
+                continue
+            last_error = RuntimeError(f"invalid Hyprland IPC JSON for {request}: {text[:200]}")
+        except asyncio.TimeoutError:
+            last_error = RuntimeError(f"Hyprland IPC timeout for {request}")
+        except Exception as e:
+            last_error = e
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    if last_error:
+        raise last_error
+    return []
+
+
+class HyprlandIPC:
+    """socket1 client that fetches several JSON views in one `[[BATCH]]` round trip.
+
+    Results are cached until `invalidate()`, so one refresh never asks Hyprland for the
+    same view twice.
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self.stats = IpcStats()
+        self._cache: dict[str, Any] = {}
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+
+    def prime(self, views: dict[str, Any]) -> None:
+        self._cache.update(views)
+
+    async def query(self, *commands: str) -> dict[str, Any]:
+        wanted = list(dict.fromkeys(commands))
+        missing = [c for c in wanted if c not in self._cache]
+        self.stats.cache_hits += len(wanted) - len(missing)
+        if missing:
+            await self._fetch(missing)
+        return {c: self._cache.get(c) for c in wanted}
+
+    async def get(self, command: str) -> Any:
+        return (await self.query(command))[command]
+
+    async def _fetch(self, commands: list[str]) -> None:
+        started = time.perf_counter()
+        try:
+            if len(commands) == 1:
+                values = await _hypr_socket_request(self.socket_path, f"j/{commands[0]}", count=1)
+            else:
+                request = "[[BATCH]]" + ";".join(f"j/{c}" for c in commands)
+                try:
+                    values = await _hypr_socket_request(self.socket_path, request, count=len(commands))
+                except RuntimeError:
+                    # Older Hyprland builds or a failing sub-command: fall back to one request each.
+                    values = []
+                    for c in commands:
+                        values.extend(await _hypr_socket_request(self.socket_path, f"j/{c}", count=1))
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.record(commands=len(commands), elapsed_ms=(time.perf_counter() - started) * 1000.0)
+        for command, value in zip(commands, values):
+            self._cache[command] = value
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import copy
+from typing import Any
+
+# socket1 views a full resync loads into the model.
+MODEL_VIEWS = ("monitors", "clients", "workspaces", "activewindow", "activeworkspace")
+
+# Facets of Hyprland state an event can affect, and the socket1 views that refresh them.
+FACET_VIEWS: dict[str, tuple[str, ...]] = {
+    "focus": ("activewindow",),
+    "title": ("activewindow", "clients"),
+    "workspace": ("activeworkspace", "workspaces"),
+    "clients": ("clients", "activewindow"),
+    "monitors": ("monitors",),
+}
+ALL_FACETS = frozenset(FACET_VIEWS)
+
+_EVENT_FACETS: dict[str, frozenset[str]] = {
+    "activewindow": frozenset({"focus"}),
+    "activewindowv2": frozenset({"focus"}),
+    "windowtitle": frozenset({"title"}),
+    "windowtitlev2": frozenset({"title"}),
+    "workspace": frozenset({"workspace"}),
+    "workspacev2": frozenset({"workspace"}),
+    "focusedmon": frozenset({"monitors", "workspace", "focus"}),
+    "focusedmonv2": frozenset({"monitors", "workspace", "focus"}),
+    "openwindow": frozenset({"clients", "focus", "workspace"}),
+    "closewindow": frozenset({"clients", "focus", "workspace"}),
+    "movewindow": frozenset({"clients", "workspace"}),
+    "movewindowv2": frozenset({"clients", "workspace"}),
+    "moveworkspace": frozenset({"monitors", "workspace"}),
+    "moveworkspacev2": frozenset({"monitors", "workspace"}),
+    "monitoradded": frozenset({"monitors", "workspace"}),
+    "monitoraddedv2": frozenset({"monitors", "workspace"}),
+    "monitorremoved": frozenset({"monitors", "workspace", "clients"}),
+    "monitorremovedv2": frozenset({"monitors", "workspace", "clients"}),
+}
+
+
+def event_facets(event: str) -> frozenset[str]:
+    return _EVENT_FACETS.get(event, ALL_FACETS)
+
+
+def facet_views(facets: set[str] | frozenset[str]) -> tuple[str, ...]:
+    views: dict[str, None] = {}
+    for facet in sorted(facets):
+        for view in FACET_VIEWS.get(facet, ()):
+            views[view] = None
+    return tuple(views)
+
+
+def _address(raw: str) -> str:
+    addr = raw.strip()
+    if not addr:
+        return ""
+    return addr if addr.startswith("0x") else f"0x{addr}"
+
+
+def _int_or_none(value: Any) -> int | None:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return None
+
+
+class HyprlandModel:
+    """In-memory mirror of Hyprland's windows, workspaces and monitors.
+
+    Loaded from a full socket1 snapshot and then patched from socket2 event payloads, so
+    frequent events (focus and title changes) need no IPC round trip. `apply` returns
+    False whenever an event cannot be applied exactly; the caller must then resync.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._monitors: dict[str, dict[str, Any]] = {}
+        self._clients: dict[str, dict[str, Any]] = {}
+        self._workspaces: dict[int, dict[str, Any]] = {}
+        self._active_window: str | None = None
+        self._seen_v2 = False
+
+    def load(self, views: dict[str, Any]) -> bool:
+        monitors = views.get("monitors")
+        clients = views.get("clients")
+        workspaces = views.get("workspaces")
+        if not isinstance(monitors, list) or not isinstance(clients, list) or not isinstance(workspaces, list):
+            self.loaded = False
+            return False
+
+        self._monitors = {
+            str(m.get("name")): copy.deepcopy(m) for m in monitors if isinstance(m, dict) and m.get("name")
+        }
+        self._clients = {
+            str(c.get("address")): copy.deepcopy(c) for c in clients if isinstance(c, dict) and c.get("address")
+        }
+        self._workspaces = {}
+        for ws in workspaces:
+            if not isinstance(ws, dict):
+                continue
+            ws_id = _int_or_none(ws.get("id"))
+            if ws_id is not None:
+                self._workspaces[ws_id] = copy.deepcopy(ws)
+
+        active_window = views.get("activewindow")
+        address = active_window.get("address") if isinstance(active_window, dict) else None
+        self._active_window = str(address) if address and str(address) in self._clients else None
+        self.loaded = True
+        return True
+
+    def merge(self, views: dict[str, Any]) -> bool:
+        """Replace only the collections present in `views` (a partial, per-facet resync)."""
+        if not self.loaded:
+            return False
+        monitors = views.get("monitors")
+        if isinstance(monitors, list):
+            self._monitors = {
+                str(m.get("name")): copy.deepcopy(m) for m in monitors if isinstance(m, dict) and m.get("name")
+            }
+        clients = views.get("clients")
+        if isinstance(clients, list):
+            self._clients = {
+                str(c.get("address")): copy.deepcopy(c) for c in clients if isinstance(c, dict) and c.get("address")
+            }
+        workspaces = views.get("workspaces")
+        if isinstance(workspaces, list):
+            self._workspaces = {}
+            for ws in workspaces:
+                ws_id = _int_or_none(ws.get("id")) if isinstance(ws, dict) else None
+                if ws_id is not None:
+                    self._workspaces[ws_id] = copy.deepcopy(ws)
+        active_ws = views.get("activeworkspace")
+        if isinstance(active_ws, dict):
+            mon = self._monitors.get(str(active_ws.get("monitor") or ""))
+            ws_id = _int_or_none(active_ws.get("id"))
+            if ws_id is not None:
+                self._workspaces[ws_id] = copy.deepcopy(active_ws)
+            if mon is not None:
+                for other in self._monitors.values():
+                    other["focused"] = other is mon
+                mon["activeWorkspace"] = {"id": active_ws.get("id"), "name": active_ws.get("name")}
+        if "activewindow" in views:
+            active_window = views.get("activewindow")
+            address = active_window.get("address") if isinstance(active_window, dict) else None
+            if address and str(address) not in self._clients:
+                return False
+            self._active_window = str(address) if address else None
+        return True
+
+    def apply(self, event: str, payload: str) -> bool:
+        if not self.loaded:
+            return False
+        handler = getattr(self, f"_on_{event}", None)
+        if handler is None:
+            if event in ("activewindow", "windowtitle", "workspace", "movewindow") and self._seen_v2:
+                # Legacy twin of a v2 event that carries the same change.
+                return True
+            return False
+        if event.endswith("v2"):
+            self._seen_v2 = True
+        try:
+            return bool(handler(payload))
+        except (ValueError, KeyError, IndexError):
+            return False
+
+    # -- event handlers -------------------------------------------------------------
+
+    def _on_activewindowv2(self, payload: str) -> bool:
+        address = _address(payload.strip(","))
+        if not address:
+            self._active_window = None
+            return True
+        client = self._clients.get(address)
+        if client is None:
+            return False
+        self._active_window = address
+        ws = self._client_workspace(client)
+        if ws is not None:
+            ws["lastwindow"] = address
+            ws["lastwindowtitle"] = client.get("title", "")
+        return True
+
+    def _on_windowtitlev2(self, payload: str) -> bool:
+        raw_addr, _, title = payload.partition(",")
+        address = _address(raw_addr)
+        client = self._clients.get(address)
+        if client is None:
+            return False
+        client["title"] = title
+        ws = self._client_workspace(client)
+        if ws is not None and ws.get("lastwindow") == address:
+            ws["lastwindowtitle"] = title
+        return True
+
+    def _on_openwindow(self, payload: str) -> bool:
+        # The payload lacks xwayland/pid/geometry; only a resync yields the exact client.
+        return False
+
+    def _on_closewindow(self, payload: str) -> bool:
+        address = _address(payload)
+        client = self._clients.pop(address, None)
+        if client is None:
+            return False
+        if self._active_window == address:
+            self._active_window = None
+        ws = self._client_workspace(client)
+        if ws is not None and ws.get("lastwindow") == address:
+            ws["lastwindow"] = "0x0"
+            ws["lastwindowtitle"] = ""
+        return True
+
+    def _on_movewindowv2(self, payload: str) -> bool:
+        raw_addr, ws_id_raw, _ws_name = payload.split(",", 2)
+        client = self._clients.get(_address(raw_addr))
+        ws = self._workspace(ws_id_raw)
+        if client is None or ws is None:
+            return False
+        client["workspace"] = {"id": ws.get("id"), "name": ws.get("name")}
+        client["monitor"] = ws.get("monitorID")
+        return True
+
+    def _on_workspacev2(self, payload: str) -> bool:
+        ws_id_raw, _, _name = payload.partition(",")
+        ws = self._workspace(ws_id_raw)
+        mon = self._focused_monitor()
+        if ws is None or mon is None or str(ws.get("monitor") or "") != str(mon.get("name") or ""):
+            return False
+        mon["activeWorkspace"] = {"id": ws.get("id"), "name": ws.get("name")}
+        return True
+
+    def _on_monitoradded(self, payload: str) -> bool:
+        return False
+
+    # -- views in socket1 JSON shape ------------------------------------------------
+
+    def _workspace(self, raw_id: Any) -> dict[str, Any] | None:
+        ws_id = _int_or_none(raw_id)
+        return self._workspaces.get(ws_id) if ws_id is not None else None
+
+    def _client_workspace(self, client: dict[str, Any]) -> dict[str, Any] | None:
+        return self._workspace((client.get("workspace") or {}).get("id"))
+
+    def _focused_monitor(self) -> dict[str, Any] | None:
+        monitors = list(self._monitors.values())
+        return next((m for m in monitors if m.get("focused")), None) or (monitors[0] if monitors else None)
+
+    def _active_workspace(self) -> dict[str, Any]:
+        mon = self._focused_monitor()
+        if mon is None:
+            return {}
+        ws = self._workspace((mon.get("activeWorkspace") or {}).get("id"))
+        if ws is None:
+            return {}
+        out = dict(ws)
+        out["windows"] = sum(1 for c in self._clients.values() if self._client_workspace(c) is ws)
+        return out
+
+    def views(self) -> dict[str, Any]:
+        active = self._clients.get(self._active_window or "")
+        return {
+            "monitors": list(self._monitors.values()),
+            "clients": list(self._clients.values()),
+            "workspaces": list(self._workspaces.values()),
+            "activewindow": dict(active) if active is not None else {},
+            "activeworkspace": self._active_workspace(),
+        }
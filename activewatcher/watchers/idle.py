@@ -1,73 +1,17 @@
 from __future__ import annotations
 
 import asyncio
-import json
-import os
 import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from activewatcher.common.http import ActiveWatcherAsyncClient
+from activewatcher.common.protocol import canonical_json
+from activewatcher.common.spool import RecordKind, shared_outbox
 
-
-def _canonical_json(data: dict[str, Any]) -> str:
-    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
-
-
-async def _run(cmd: list[str]) -> str:
-    proc = await asyncio.create_subprocess_exec(
-        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    out, err = await proc.communicate()
-    if proc.returncode != 0:
-        raise RuntimeError(f"{cmd[0]} failed: {err.decode('utf-8', 'replace').strip()}")
-    return out.decode("utf-8", "replace")
-
-
-async def _get_session_id() -> str:
-    env = os.environ.get("XDG_SESSION_ID")
-    if env:
-        return env
-
-    uid = os.getuid()
-    out = await _run(["loginctl", "list-sessions", "--no-legend"])
-    candidates: list[str] = []
-    for line in out.splitlines():
-        parts = line.split()
-        if len(parts) < 3:
-            continue
-        session_id, uid_s, _user = parts[0], parts[1], parts[2]
-        if uid_s.isdigit() and int(uid_s) == uid:
-            candidates.append(session_id)
-    if not candidates:
-        raise RuntimeError("could not determine XDG_SESSION_ID (no loginctl sessions for current uid)")
-    return candidates[-1]
-
-
-async def _read_idle_props(session_id: str) -> dict[str, str]:
-    out = await _run(
-        [
-            "loginctl",
-            "show-session",
-            session_id,
-            "-p",
-            "LockedHint",
-            "-p",
-            "IdleHint",
-            "-p",
-            "IdleSinceHint",
-            "-p",
-            "IdleSinceHintMonotonic",
-        ]
-    )
-    props: dict[str, str] = {}
-    for line in out.splitlines():
-        if "=" not in line:
-            continue
-        k, v = line.split("=", 1)
-        props[k.strip()] = v.strip()
-    return props
+from .idle_logind import open_session
+from .procwatch import ProcessWatch
+from .schedule import aligned_delay
 
 
 def _truthy(value: str) -> bool:
@@ -94,44 +38,6 @@ def _idle_since_wallclock(props: dict[str, str]) -> datetime | None:
         return None
 
 
-def _read_proc_comm(pid: int) -> str | None:
-    try:
-        with open(f"/proc/{pid}/comm", encoding="utf-8", errors="replace") as f:
-            return f.readline().strip()
-    except OSError:
-        return None
-
-
-def _find_proc_by_comm(comm: str) -> int | None:
-    if not comm:
-        return None
-    try:
-        with os.scandir("/proc") as it:
-            for entry in it:
-                if not entry.name.isdigit():
-                    continue
-                pid = int(entry.name)
-                if _read_proc_comm(pid) == comm:
-                    return pid
-    except OSError:
-        return None
-    return None
-
-
-@dataclass
-class ProcessRunningCache:
-    comm: str
-    pid: int | None = None
-
-    def is_running(self) -> bool:
-        if not self.comm:
-            return False
-        if self.pid is not None and _read_proc_comm(self.pid) == self.comm:
-            return True
-        self.pid = _find_proc_by_comm(self.comm)
-        return self.pid is not None
-
-
 def _compute_afk(
     *,
     props: dict[str, str],
@@ -174,6 +80,18 @@ def _compute_afk(
     return AfkDecision(afk=True, transition_ts=now_utc)
 
 
+def _afk_due_in(*, props: dict[str, str], threshold_seconds: int, now_utc: datetime) -> float | None:
+    """Seconds until an idle (but not yet AFK) session crosses the threshold, if known."""
+    if not _truthy(props.get("IdleHint", "")):
+        return None
+    since_wall = _idle_since_wallclock(props)
+    if since_wall is None:
+        return None
+    remaining = (since_wall + timedelta(seconds=max(0, threshold_seconds)) - now_utc).total_seconds()
+    # Land just past the threshold so `_compute_afk` sees it crossed.
+    return max(0.0, remaining) + 0.05
+
+
 @dataclass
 class IdleWatcher:
     server_url: str
@@ -197,9 +115,10 @@ class IdleWatcher:
     ) -> None:
         now = time.monotonic()
         data = {"afk": afk, "threshold_seconds": self.threshold_seconds, "session_id": session_id}
-        state_json = _canonical_json(data)
+        state_json = canonical_json(data)
 
-        should_send = force or state_json != self._last_sent_state
+        changed = state_json != self._last_sent_state
+        should_send = force or changed
         if self.heartbeat_seconds > 0 and (now - self._last_sent_at) >= self.heartbeat_seconds:
             should_send = True
         if not should_send:
@@ -216,28 +135,27 @@ class IdleWatcher:
         payload = {"bucket": "idle", "source": self.source, "ts": ts_iso, "data": data}
         backfill_refresh_needed = afk and ts_dt < (now_dt - timedelta(seconds=1))
 
-        client = ActiveWatcherAsyncClient(self.server_url)
-        try:
-            await client.post_state(payload)
-            if backfill_refresh_needed:
-                # When AFK start is backdated (e.g., after suspend), immediately refresh at "now"
-                # so the open interval stays alive and is not clipped by stale timeout.
-                refresh_now = datetime.now(timezone.utc)
-                refresh_ts_dt = refresh_now if refresh_now > ts_dt else (ts_dt + timedelta(milliseconds=1))
-                refresh_iso = refresh_ts_dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
-                refresh_payload = {
-                    "bucket": "idle",
-                    "source": self.source,
-                    "ts": refresh_iso,
-                    "data": data,
-                }
-                await client.post_state(refresh_payload)
-                ts_dt = refresh_ts_dt
-            self._last_sent_state = state_json
-            self._last_sent_at = time.monotonic()
-            self._last_sent_ts_utc = ts_dt
-        finally:
-            await client.aclose()
+        records: list[tuple[RecordKind, dict[str, Any]]] = [("state" if changed else "touch", payload)]
+        sent_ts_dt = ts_dt
+        if backfill_refresh_needed:
+            # When AFK start is backdated (e.g., after suspend), immediately refresh at "now"
+            # so the open interval stays alive and is not clipped by stale timeout.
+            refresh_now = datetime.now(timezone.utc)
+            refresh_ts_dt = refresh_now if refresh_now > ts_dt else (ts_dt + timedelta(milliseconds=1))
+            refresh_iso = refresh_ts_dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+            refresh_payload = {
+                "bucket": "idle",
+                "source": self.source,
+                "ts": refresh_iso,
+                "data": data,
+            }
+            records.append(("touch", refresh_payload))
+            sent_ts_dt = refresh_ts_dt
+
+        await shared_outbox(self.server_url, "idle").put_many(records)
+        self._last_sent_state = state_json
+        self._last_sent_at = time.monotonic()
+        self._last_sent_ts_utc = sent_ts_dt
 
 
 async def run(
@@ -248,8 +166,9 @@ async def run(
     poll_seconds: float,
     heartbeat_seconds: int,
     lock_process: str,
+    backend: str = "auto",
 ) -> None:
-    session_id = await _get_session_id()
+    session = await open_session(backend)
     watcher = IdleWatcher(
         server_url=server_url,
         source=source,
@@ -257,13 +176,19 @@ async def run(
         poll_seconds=poll_seconds,
         heartbeat_seconds=heartbeat_seconds,
     )
-    lock_proc = ProcessRunningCache(lock_process)
-    print(f"[idle] session={session_id} threshold={threshold_seconds}s poll={poll_seconds}s")
+    # Wake the loop as soon as the lock process starts or exits.
+    lock_proc = ProcessWatch(lock_process, on_change=lambda: session.wake())
+    lock_proc.start()
+    print(
+        f"[idle] session={session.session_id} backend={session.name} "
+        f"threshold={threshold_seconds}s poll={poll_seconds}s lock_process={lock_proc.mode}"
+    )
 
     while True:
+        delay = aligned_delay(poll_seconds)
         try:
             now_utc = datetime.now(timezone.utc)
-            props = await _read_idle_props(session_id)
+            props = await session.read()
             force_afk = lock_proc.is_running()
             decision = _compute_afk(
                 props=props,
@@ -273,10 +198,22 @@ async def run(
             )
             await watcher.maybe_send(
                 afk=decision.afk,
-                session_id=session_id,
+                session_id=session.session_id,
                 force=False,
                 ts=decision.transition_ts or now_utc,
             )
+            if not decision.afk:
+                due = _afk_due_in(props=props, threshold_seconds=threshold_seconds, now_utc=now_utc)
+                if due is not None:
+                    delay = min(delay, due)
         except Exception as e:
             print(f"[idle] error: {e}")
-        await asyncio.sleep(max(0.2, poll_seconds))
+            if session.event_driven:
+                # Lost the bus or the session object went away: start over, falling back
+                # to loginctl if the bus stays unreachable.
+                await session.close()
+                await asyncio.sleep(delay)
+                session = await open_session(backend)
+                print(f"[idle] reopened session={session.session_id} backend={session.name}")
+                continue
+        await session.wait_changed(delay)
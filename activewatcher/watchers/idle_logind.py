@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any
+
+_LOGIN1 = "org.freedesktop.login1"
+_LOGIN1_PATH = "/org/freedesktop/login1"
+_MANAGER_IFACE = "org.freedesktop.login1.Manager"
+_SESSION_IFACE = "org.freedesktop.login1.Session"
+
+# Session properties the AFK decision reads, in `loginctl show-session` naming.
+IDLE_PROPERTIES = ("LockedHint", "IdleHint", "IdleSinceHint", "IdleSinceHintMonotonic")
+
+BACKENDS = ("auto", "dbus", "loginctl")
+
+
+async def _run(cmd: list[str]) -> str:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed: {err.decode('utf-8', 'replace').strip()}")
+    return out.decode("utf-8", "replace")
+
+
+async def _get_session_id() -> str:
+    env = os.environ.get("XDG_SESSION_ID")
+    if env:
+        return env
+
+    uid = os.getuid()
+    out = await _run(["loginctl", "list-sessions", "--no-legend"])
+    candidates: list[str] = []
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        session_id, uid_s, _user = parts[0], parts[1], parts[2]
+        if uid_s.isdigit() and int(uid_s) == uid:
+            candidates.append(session_id)
+    if not candidates:
+        raise RuntimeError("could not determine XDG_SESSION_ID (no loginctl sessions for current uid)")
+    return candidates[-1]
+
+
+async def _read_idle_props(session_id: str) -> dict[str, str]:
+    cmd = ["loginctl", "show-session", session_id]
+    for name in IDLE_PROPERTIES:
+        cmd.extend(["-p", name])
+    out = await _run(cmd)
+    props: dict[str, str] = {}
+    for line in out.splitlines():
+        if "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        props[k.strip()] = v.strip()
+    return props
+
+
+def _prop_text(value: Any) -> str:
+    # Render D-Bus values the way `loginctl show-session` prints them, so both backends
+    # feed the same strings to `_compute_afk`.
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    return str(value)
+
+
+class LoginctlSession:
+    """Reads the session's idle properties by running `loginctl` on every poll.
+
+    `wake()` cuts the current wait short (e.g. when the lock process starts).
+    """
+
+    name = "loginctl"
+    event_driven = False
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self._changed = asyncio.Event()
+
+    @classmethod
+    async def open(cls) -> LoginctlSession:
+        return cls(await _get_session_id())
+
+    async def read(self) -> dict[str, str]:
+        return await _read_idle_props(self.session_id)
+
+    def wake(self) -> None:
+        self._changed.set()
+
+    async def wait_changed(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    async def close(self) -> None:
+        return None
+
+
+class DbusSession:
+    """Follows the session's idle properties through logind PropertiesChanged signals.
+
+    Properties are read once with GetAll and then kept current from signals, so `read()`
+    needs no round trip and `wait_changed()` returns as soon as logind reports a change.
+    The system bus address honours `DBUS_SYSTEM_BUS_ADDRESS`, which lets this run against
+    a private dbus-daemon with a mock login1 service (see scripts/mock_logind.py).
+    """
+
+    name = "dbus"
+    event_driven = True
+
+    def __init__(self, bus: Any, session_id: str, properties: Any) -> None:
+        self.session_id = session_id
+        self._bus = bus
+        self._properties = properties
+        self._props: dict[str, str] = {}
+        self._changed = asyncio.Event()
+        self._refetch = False
+
+    @classmethod
+    async def open(cls) -> DbusSession:
+        # Optional dependency (`pip install activewatcher[dbus]`).
+        from dbus_next import BusType
+        from dbus_next.aio import MessageBus
+
+        bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        try:
+            manager_node = await bus.introspect(_LOGIN1, _LOGIN1_PATH)
+            manager = bus.get_proxy_object(_LOGIN1, _LOGIN1_PATH, manager_node).get_interface(_MANAGER_IFACE)
+            session_id, session_path = await cls._find_session(manager)
+            session_node = await bus.introspect(_LOGIN1, session_path)
+            properties = bus.get_proxy_object(_LOGIN1, session_path, session_node).get_interface(
+                "org.freedesktop.DBus.Properties"
+            )
+            session = cls(bus, session_id, properties)
+            properties.on_properties_changed(session._on_properties_changed)
+            await session._fetch()
+        except BaseException:
+            bus.disconnect()
+            raise
+        return session
+
+    @staticmethod
+    async def _find_session(manager: Any) -> tuple[str, str]:
+        session_id = os.environ.get("XDG_SESSION_ID")
+        if session_id:
+            return session_id, str(await manager.call_get_session(session_id))
+        uid = os.getuid()
+        # ListSessions -> a(susso): id, uid, user, seat, object path.
+        candidates = [(str(s[0]), str(s[4])) for s in await manager.call_list_sessions() if int(s[1]) == uid]
+        if not candidates:
+            raise RuntimeError("could not determine XDG_SESSION_ID (no logind sessions for current uid)")
+        return candidates[-1]
+
+    async def _fetch(self) -> None:
+        values = await self._properties.call_get_all(_SESSION_IFACE)
+        self._props = {k: _prop_text(values[k].value) for k in IDLE_PROPERTIES if k in values}
+        self._refetch = False
+
+    def _on_properties_changed(self, interface: str, changed: dict[str, Any], invalidated: list[str]) -> None:
+        if interface != _SESSION_IFACE:
+            return
+        touched = False
+        for name in IDLE_PROPERTIES:
+            if name in changed:
+                self._props[name] = _prop_text(changed[name].value)
+                touched = True
+            elif name in invalidated:
+                self._refetch = True
+                touched = True
+        if touched:
+            self._changed.set()
+
+    async def read(self) -> dict[str, str]:
+        if not self._bus.connected:
+            raise ConnectionError("system bus connection lost")
+        if self._refetch:
+            await self._fetch()
+        return dict(self._props)
+
+    def wake(self) -> None:
+        self._changed.set()
+
+    async def wait_changed(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    async def close(self) -> None:
+        self._bus.disconnect()
+
+
+async def open_session(backend: str) -> LoginctlSession | DbusSession:
+    """Open the idle property source for the current session.
+
+    `auto` prefers D-Bus signals and falls back to polling `loginctl` when dbus-next is
+    not installed or the system bus / logind is unreachable.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown idle backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+    if backend == "loginctl":
+        return await LoginctlSession.open()
+    try:
+        return await DbusSession.open()
+    except Exception as e:
+        if backend == "dbus":
+            raise
+        print(f"[idle] D-Bus unavailable ({type(e).__name__}: {e}); polling loginctl")
+    return await LoginctlSession.open()
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, field
+
+_SECTOR_BYTES = 512
+_PSI_RESOURCES = ("cpu", "memory", "io")
+# Virtual block devices that only add noise to disk I/O totals.
+_SKIP_DISK_PREFIXES = (b"loop", b"ram")
+
+
+class ProcFile:
+    """A /proc file kept open and re-read from offset 0 with pread into one reused buffer.
+
+    procfs regenerates the content on every read at offset 0, so the open/close (and the
+    text decoding of the old `open().read()`) per sample is unnecessary.
+    """
+
+    def __init__(self, path: str, *, size: int = 16384) -> None:
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        self._buf = bytearray(size)
+
+    def read(self) -> bytes:
+        while True:
+            n = os.preadv(self._fd, [self._buf], 0)
+            if n < len(self._buf):
+                return bytes(memoryview(self._buf)[:n])
+            # Content filled the buffer: it may be truncated, so grow and re-read.
+            self._buf = bytearray(len(self._buf) * 2)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def _open_optional(path: str) -> ProcFile | None:
+    try:
+        return ProcFile(path)
+    except OSError:
+        return None
+
+
+@dataclass
+class ProcSample:
+    cpu_percent: float = 0.0
+    cpu_cores: list[float] = field(default_factory=list)
+    mem_total_bytes: int = 0
+    mem_used_bytes: int = 0
+    mem_percent: float = 0.0
+    net_rx_bps: float = 0.0
+    net_tx_bps: float = 0.0
+    net_interfaces: list[str] = field(default_factory=list)
+    # interface -> (rx_bps, tx_bps)
+    net_rates: dict[str, tuple[float, float]] = field(default_factory=dict)
+    disk_read_bps: float = 0.0
+    disk_write_bps: float = 0.0
+    # device -> (read_bps, write_bps)
+    disk_rates: dict[str, tuple[float, float]] = field(default_factory=dict)
+    # "<resource>_some" / "<resource>_full" -> percent of wall time stalled since last sample
+    psi: dict[str, float] = field(default_factory=dict)
+    # CPU time this sample took the sampler itself.
+    sample_cpu_us: float = 0.0
+
+
+def _cpu_times(data: bytes) -> dict[bytes, tuple[int, int]]:
+    """cpu line name -> (total jiffies, idle + iowait jiffies)."""
+    out: dict[bytes, tuple[int, int]] = {}
+    # The cpu lines come first; stop before the long intr/softirq lines.
+    pos = 0
+    while data.startswith(b"cpu", pos):
+        end = data.find(b"\n", pos)
+        parts = data[pos:end].split()
+        pos = end + 1
+        values = [int(v) for v in parts[1:]]
+        if len(values) >= 4:
+            out[parts[0]] = (sum(values), values[3] + (values[4] if len(values) > 4 else 0))
+    return out
+
+
+def _field_kb(data: bytes, key: bytes) -> int:
+    start = data.find(key)
+    if start < 0:
+        return 0
+    end = data.find(b"\n", start)
+    return int(data[start + len(key) : end].split()[0])
+
+
+def _meminfo(data: bytes) -> tuple[int, int]:
+    total_kb = _field_kb(data, b"MemTotal:")
+    available_kb = _field_kb(data, b"MemAvailable:")
+    if total_kb <= 0:
+        raise RuntimeError("could not read MemTotal from /proc/meminfo")
+    return total_kb * 1024, max(0, total_kb - max(0, available_kb)) * 1024
+
+
+def _net_totals(data: bytes, *, include_loopback: bool) -> dict[str, tuple[int, int]]:
+    out: dict[str, tuple[int, int]] = {}
+    for raw in data.split(b"\n")[2:]:
+        iface, sep, rest = raw.partition(b":")
+        name = iface.strip()
+        if not sep or not name or (not include_loopback and name == b"lo"):
+            continue
+        cols = rest.split()
+        if len(cols) < 16:
+            continue
+        out[name.decode("utf-8", "replace")] = (int(cols[0]), int(cols[8]))
+    return out
+
+
+def _disk_totals(data: bytes, whole_disks: dict[bytes, bool]) -> dict[str, tuple[int, int]]:
+    out: dict[str, tuple[int, int]] = {}
+    for raw in data.split(b"\n"):
+        cols = raw.split(None, 10)
+        if len(cols) < 10:
+            continue
+        name = cols[2]
+        whole = whole_disks.get(name)
+        if whole is None:
+            # Whole disks only; partitions would double-count their disk's traffic.
+            whole = not name.startswith(_SKIP_DISK_PREFIXES) and os.path.isdir(b"/sys/block/" + name)
+            whole_disks[name] = whole
+        if whole:
+            out[name.decode("utf-8", "replace")] = (int(cols[5]) * _SECTOR_BYTES, int(cols[9]) * _SECTOR_BYTES)
+    return out
+
+
+def _psi_totals(data: bytes) -> dict[str, int]:
+    """"some"/"full" -> cumulative stall time in microseconds."""
+    out: dict[str, int] = {}
+    for line in data.split(b"\n"):
+        kind, _, rest = line.partition(b" ")
+        total = rest.rpartition(b"total=")[2]
+        if kind and total.isdigit():
+            out[kind.decode()] = int(total)
+    return out
+
+
+def _rate(now: int, prev: int | None, seconds: float) -> float:
+    if prev is None or seconds <= 0:
+        return 0.0
+    return max(0.0, (now - prev) / seconds)
+
+
+class ProcSampler:
+    """Reads CPU, memory, network, disk and pressure counters from persistent /proc fds.
+
+    Rates and percentages are computed against the previous `sample()`; the first sample
+    reports zeros for them. Missing sources (no PSI support, no /proc/diskstats) are
+    skipped.
+    """
+
+    def __init__(self, *, include_loopback: bool) -> None:
+        self.include_loopback = include_loopback
+        self._stat = ProcFile("/proc/stat")
+        self._meminfo = ProcFile("/proc/meminfo")
+        self._netdev = ProcFile("/proc/net/dev")
+        self._diskstats = _open_optional("/proc/diskstats")
+        self._pressure = {r: f for r in _PSI_RESOURCES if (f := _open_optional(f"/proc/pressure/{r}")) is not None}
+        self._prev_at: float | None = None
+        self._prev_cpu: dict[bytes, tuple[int, int]] = {}
+        self._prev_net: dict[str, tuple[int, int]] = {}
+        self._prev_disk: dict[str, tuple[int, int]] = {}
+        self._whole_disks: dict[bytes, bool] = {}
+        self._prev_psi: dict[str, int] = {}
+        self.samples = 0
+        self.total_cpu_us = 0.0
+
+    def close(self) -> None:
+        for f in (self._stat, self._meminfo, self._netdev, self._diskstats, *self._pressure.values()):
+            if f is not None:
+                f.close()
+
+    def sample(self) -> ProcSample:
+        started_cpu = time.thread_time()
+        now = time.monotonic()
+        seconds = now - self._prev_at if self._prev_at is not None else 0.0
+        out = ProcSample()
+
+        cpu = _cpu_times(self._stat.read())
+        cores: list[float] = []
+        for name, (total, idle) in cpu.items():
+            prev = self._prev_cpu.get(name)
+            percent = 0.0
+            if prev is not None and total > prev[0]:
+                percent = max(0.0, min(100.0, (1.0 - (max(0, idle - prev[1]) / (total - prev[0]))) * 100.0))
+            if name == b"cpu":
+                out.cpu_percent = percent
+            else:
+                cores.append(percent)
+        out.cpu_cores = cores
+        self._prev_cpu = cpu
+
+        out.mem_total_bytes, out.mem_used_bytes = _meminfo(self._meminfo.read())
+        out.mem_percent = out.mem_used_bytes / out.mem_total_bytes * 100.0
+
+        net = _net_totals(self._netdev.read(), include_loopback=self.include_loopback)
+        for name, (rx, tx) in net.items():
+            prev_rx, prev_tx = self._prev_net.get(name, (None, None))
+            rates = (_rate(rx, prev_rx, seconds), _rate(tx, prev_tx, seconds))
+            out.net_rates[name] = rates
+            out.net_rx_bps += rates[0]
+            out.net_tx_bps += rates[1]
+        out.net_interfaces = sorted(net, key=str.lower)
+        self._prev_net = net
+
+        if self._diskstats is not None:
+            disk = _disk_totals(self._diskstats.read(), self._whole_disks)
+            for name, (read, written) in disk.items():
+                prev_read, prev_written = self._prev_disk.get(name, (None, None))
+                rates = (_rate(read, prev_read, seconds), _rate(written, prev_written, seconds))
+                out.disk_rates[name] = rates
+                out.disk_read_bps += rates[0]
+                out.disk_write_bps += rates[1]
+            self._prev_disk = disk
+
+        psi: dict[str, int] = {}
+        for resource, f in self._pressure.items():
+            for kind, total in _psi_totals(f.read()).items():
+                key = f"{resource}_{kind}"
+                psi[key] = total
+                if key in self._prev_psi and seconds > 0:
+                    # Stall microseconds per wall microsecond, as a percentage.
+                    out.psi[key] = min(100.0, _rate(total, self._prev_psi[key], seconds) / 10_000.0)
+        self._prev_psi = psi
+
+        self._prev_at = now
+        out.sample_cpu_us = (time.thread_time() - started_cpu) * 1_000_000.0
+        self.samples += 1
+        self.total_cpu_us += out.sample_cpu_us
+        return out
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from .procfs import ProcFile
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_TREE_TTL_SECONDS = 30.0
+
+
+def _parse_stat(data: bytes) -> tuple[int, int, int]:
+    """(ppid, utime + stime ticks, rss pages) from a /proc/<pid>/stat line."""
+    # comm may contain spaces or parentheses; the numeric fields resume after the last ")".
+    fields = data[data.rfind(b")") + 2 :].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21])
+
+
+def _parent_map() -> dict[int, int]:
+    """pid -> ppid for every process, from one /proc walk."""
+    parents: dict[int, int] = {}
+    try:
+        with os.scandir("/proc") as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    with open(f"/proc/{entry.name}/stat", "rb") as f:
+                        parents[int(entry.name)] = _parse_stat(f.read())[0]
+                except (OSError, ValueError, IndexError):
+                    continue
+    except OSError:
+        pass
+    return parents
+
+
+def _descendants(root: int, parents: dict[int, int]) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+    out = [root]
+    i = 0
+    while i < len(out):
+        out.extend(children.get(out[i], ()))
+        i += 1
+    return out
+
+
+@dataclass(frozen=True)
+class ProcessTreeSample:
+    pid: int
+    # CPU time the tree used since the previous sample of the same root (0 for a baseline).
+    cpu_seconds: float
+    interval_seconds: float
+    rss_bytes: int
+    processes: int
+    sample_cpu_us: float
+
+    @property
+    def is_baseline(self) -> bool:
+        return self.interval_seconds <= 0
+
+
+class ProcessTreeSampler:
+    """CPU time and RSS of a process and its descendants from /proc/<pid>/stat deltas.
+
+    Each root's descendant list comes from one /proc walk and is cached for
+    `tree_ttl_seconds`, or until one of its members exits; between walks a sample is a
+    single pread per process through kept-open stat fds (which also can't be fooled by
+    pid reuse). CPU is only counted for processes seen in both samples, so short-lived
+    children that start and exit between walks are missed. RSS is summed per process and
+    so counts shared pages more than once.
+
+    Sampling a different root than last time only records a baseline: CPU burned while
+    an app was not being sampled is never attributed to it.
+    """
+
+    def __init__(self, *, tree_ttl_seconds: float = _TREE_TTL_SECONDS) -> None:
+        self.tree_ttl_seconds = tree_ttl_seconds
+        self.walks = 0
+        self.samples = 0
+        self.total_cpu_us = 0.0
+        self._trees: dict[int, tuple[float, list[int]]] = {}
+        self._files: dict[int, ProcFile] = {}
+        self._prev_root: int | None = None
+        self._prev_at: float | None = None
+        self._prev_ticks: dict[int, int] = {}
+
+    def _tree(self, root: int, now: float) -> list[int]:
+        cached = self._trees.get(root)
+        if cached is not None and now - cached[0] < self.tree_ttl_seconds:
+            return cached[1]
+        self.walks += 1
+        pids = _descendants(root, _parent_map())
+        # Trees of apps that lost focus long ago would only go stale.
+        self._trees = {pid: tree for pid, tree in self._trees.items() if now - tree[0] < self.tree_ttl_seconds}
+        self._trees[root] = (now, pids)
+        return pids
+
+    def sample(self, root: int) -> ProcessTreeSample | None:
+        """Sample `root`'s tree; None once the root process itself is gone."""
+        started_cpu = time.thread_time()
+        now = time.monotonic()
+        ticks: dict[int, int] = {}
+        rss_pages = 0
+        exited = False
+        for pid in self._tree(root, now):
+            try:
+                f = self._files.get(pid)
+                if f is None:
+                    f = self._files[pid] = ProcFile(f"/proc/{pid}/stat", size=1024)
+                _ppid, cpu_ticks, pages = _parse_stat(f.read())
+            except (OSError, ValueError, IndexError):
+                exited = True
+                continue
+            ticks[pid] = cpu_ticks
+            rss_pages += pages
+        if exited:
+            # Re-walk next time: exited members are dropped and their siblings may be new.
+            self._trees.pop(root, None)
+        for pid in [pid for pid in self._files if pid not in ticks]:
+            self._files.pop(pid).close()
+
+        if root not in ticks:
+            self._prev_root, self._prev_at, self._prev_ticks = None, None, {}
+            return None
+
+        interval = 0.0
+        used_ticks = 0
+        if self._prev_root == root and self._prev_at is not None:
+            interval = now - self._prev_at
+            prev = self._prev_ticks
+            used_ticks = sum(max(0, t - prev[pid]) for pid, t in ticks.items() if pid in prev)
+        self._prev_root, self._prev_at, self._prev_ticks = root, now, ticks
+
+        sample_cpu_us = (time.thread_time() - started_cpu) * 1_000_000.0
+        self.samples += 1
+        self.total_cpu_us += sample_cpu_us
+        return ProcessTreeSample(
+            pid=root,
+            cpu_seconds=used_ticks / _CLK_TCK,
+            interval_seconds=interval,
+            rss_bytes=rss_pages * _PAGE_SIZE,
+            processes=len(ticks),
+            sample_cpu_us=sample_cpu_us,
+        )
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._trees = {}
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "walks": self.walks,
+            "open_fds": len(self._files),
+            "avg_sample_cpu_us": round(self.total_cpu_us / self.samples, 1) if self.samples else 0.0,
+        }
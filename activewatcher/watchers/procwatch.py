@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import errno
+import os
+import shutil
+import struct
+from collections.abc import Callable
+from typing import Any
+
+_IN_OPEN = 0x00000020
+_IN_IGNORED = 0x00008000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+# After the binary is opened by execve, the new comm is set a moment later.
+_EXEC_SCAN_DELAYS = (0.05, 0.25, 1.0)
+_BACKOFF_MIN_SECONDS = 5.0
+_BACKOFF_MAX_SECONDS = 30.0
+
+
+def _read_proc_comm(pid: int) -> str | None:
+    try:
+        with open(f"/proc/{pid}/comm", encoding="utf-8", errors="replace") as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def _is_live(pid: int) -> bool:
+    # An exited but not yet reaped process keeps its comm; its state is Z (or X).
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8", errors="replace") as f:
+            stat = f.read()
+    except OSError:
+        return False
+    state = stat[stat.rfind(")") + 2 : stat.rfind(")") + 3]
+    return state not in ("Z", "X", "")
+
+
+def _find_proc_by_comm(comm: str) -> int | None:
+    if not comm:
+        return None
+    try:
+        with os.scandir("/proc") as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                pid = int(entry.name)
+                if _read_proc_comm(pid) == comm and _is_live(pid):
+                    return pid
+    except OSError:
+        return None
+    return None
+
+
+class _Inotify:
+    """Minimal inotify(7) wrapper (via libc) watching one file for IN_OPEN."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            self.add_watch()
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_watch(self) -> None:
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(self.path), _IN_OPEN) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {self.path}")
+
+    def read_masks(self) -> list[int]:
+        masks: list[int] = []
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return masks
+            if not data:
+                return masks
+            offset = 0
+            while offset + _INOTIFY_EVENT.size <= len(data):
+                _wd, mask, _cookie, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+                masks.append(mask)
+                offset += _INOTIFY_EVENT.size + name_len
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ProcessWatch:
+    """Tracks whether a process with a given comm is running without rescanning /proc.
+
+    A found process is held through a pidfd whose readability signals its exit. While
+    none is running, an inotify IN_OPEN watch on the process's binary (found on PATH)
+    triggers a /proc scan only when the binary is executed; if inotify is unavailable
+    the scan repeats with exponential back-off instead. `is_running()` just returns the
+    tracked state, and `on_change` fires on every start/exit.
+    """
+
+    def __init__(self, comm: str, *, on_change: Callable[[], None] | None = None) -> None:
+        self.comm = comm
+        self.on_change = on_change
+        self.pid: int | None = None
+        self.scans = 0
+        self._pidfd: int | None = None
+        self._inotify: _Inotify | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._scan_handles: list[asyncio.TimerHandle] = []
+        self._backoff_task: asyncio.Task[None] | None = None
+
+    @property
+    def mode(self) -> str:
+        if not self.comm:
+            return "disabled"
+        return "inotify" if self._inotify is not None else "backoff-scan"
+
+    def start(self) -> None:
+        if not self.comm or self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        binary = shutil.which(self.comm)
+        if binary:
+            try:
+                self._inotify = _Inotify(os.path.realpath(binary))
+                self._loop.add_reader(self._inotify.fd, self._on_inotify)
+            except OSError:
+                self._inotify = None
+        self._scan()
+        if self.pid is None:
+            self._wait_for_start()
+
+    def close(self) -> None:
+        self._cancel_scans()
+        if self._backoff_task is not None:
+            self._backoff_task.cancel()
+            self._backoff_task = None
+        if self._inotify is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        self._release_pid()
+        self._loop = None
+
+    def is_running(self) -> bool:
+        if self.pid is None:
+            return False
+        if self._pidfd is None and (_read_proc_comm(self.pid) != self.comm or not _is_live(self.pid)):
+            # No pidfd support: confirm the pid directly (two small reads, no /proc walk).
+            self._set_pid(None)
+            self._wait_for_start()
+        return self.pid is not None
+
+    def stats(self) -> dict[str, Any]:
+        return {"mode": self.mode, "pid": self.pid, "pidfd": self._pidfd is not None, "scans": self.scans}
+
+    # -- start detection --------------------------------------------------------------
+
+    def _scan(self) -> bool:
+        self.scans += 1
+        pid = _find_proc_by_comm(self.comm)
+        if pid is None:
+            return False
+        self._hold(pid)
+        return self.pid is not None
+
+    def _wait_for_start(self) -> None:
+        if self._inotify is None and self._loop is not None and self._backoff_task is None:
+            self._backoff_task = self._loop.create_task(self._backoff_scan())
+
+    async def _backoff_scan(self) -> None:
+        delay = _BACKOFF_MIN_SECONDS
+        try:
+            while self.pid is None:
+                await asyncio.sleep(delay)
+                if self._scan():
+                    return
+                delay = min(_BACKOFF_MAX_SECONDS, delay * 2)
+        finally:
+            self._backoff_task = None
+
+    def _on_inotify(self) -> None:
+        assert self._inotify is not None
+        masks = self._inotify.read_masks()
+        if any(mask & _IN_IGNORED for mask in masks):
+            # The binary was replaced (e.g. a package upgrade); watch the new inode.
+            try:
+                self._inotify.add_watch()
+            except OSError:
+                assert self._loop is not None
+                self._loop.remove_reader(self._inotify.fd)
+                self._inotify.close()
+                self._inotify = None
+                self._wait_for_start()
+        if self.pid is not None or not any(mask & _IN_OPEN for mask in masks) or self._scan_handles:
+            return
+        loop = self._loop
+        assert loop is not None
+        self._scan_handles = [loop.call_later(delay, self._exec_scan) for delay in _EXEC_SCAN_DELAYS]
+
+    def _exec_scan(self) -> None:
+        loop = self._loop
+        assert loop is not None
+        self._scan_handles = [h for h in self._scan_handles if h.when() > loop.time()]
+        if self.pid is None and self._scan():
+            self._cancel_scans()
+
+    def _cancel_scans(self) -> None:
+        for handle in self._scan_handles:
+            handle.cancel()
+        self._scan_handles = []
+
+    # -- exit detection ---------------------------------------------------------------
+
+    def _hold(self, pid: int) -> None:
+        pidfd: int | None = None
+        try:
+            pidfd = os.pidfd_open(pid)
+        except AttributeError:
+            pass
+        except OSError as e:
+            if e.errno == errno.ESRCH:
+                return
+        # The pid may have exited or been reused between the scan and pidfd_open.
+        if _read_proc_comm(pid) != self.comm or not _is_live(pid):
+            if pidfd is not None:
+                os.close(pidfd)
+            return
+        self._pidfd = pidfd
+        if pidfd is not None and self._loop is not None:
+            self._loop.add_reader(pidfd, self._on_exit)
+        self._set_pid(pid)
+
+    def _on_exit(self) -> None:
+        self._release_pid()
+        self._set_pid(None)
+        # Another instance may still be running (or have been started meanwhile).
+        if not self._scan():
+            self._wait_for_start()
+
+    def _release_pid(self) -> None:
+        if self._pidfd is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+
+    def _set_pid(self, pid: int | None) -> None:
+        changed = (pid is None) != (self.pid is None)
+        self.pid = pid
+        if changed and self.on_change is not None:
+            self.on_change()
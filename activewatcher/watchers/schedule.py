@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+def aligned_delay(period: float, *, minimum: float = 0.2, now: float | None = None) -> float:
+    """Seconds until the next multiple of `period` on the monotonic clock.
+
+    Pollers with commensurate periods (5s, 15s, 30s, ...) then wake on the same ticks,
+    so a process running several of them wakes once per tick instead of once per poller.
+    """
+    period = max(minimum, period)
+    now = time.monotonic() if now is None else now
+    delay = period - (now % period)
+    if delay < minimum:
+        delay += period
+    return delay
+
+
+async def sleep_aligned(period: float, *, minimum: float = 0.2) -> None:
+    await asyncio.sleep(aligned_delay(period, minimum=minimum))
@@ -1,82 +1,115 @@
 from __future__ import annotations
 
-import asyncio
-import json
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Any
 
-from activewatcher.common.http import ActiveWatcherAsyncClient
-
-
-def _canonical_json(data: dict[str, Any]) -> str:
-    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
-
-
-def _read_cpu_sample() -> tuple[int, int]:
-    with open("/proc/stat", encoding="utf-8", errors="replace") as f:
-        line = f.readline().strip()
-    parts = line.split()
-    if len(parts) < 6 or parts[0] != "cpu":
-        raise RuntimeError("invalid /proc/stat cpu line")
-    values = [int(v) for v in parts[1:]]
-    total = sum(values)
-    idle = values[3] + (values[4] if len(values) > 4 else 0)
-    return total, idle
-
-
-def _read_mem_sample() -> tuple[int, int]:
-    mem_total_kb = 0
-    mem_available_kb = 0
-    with open("/proc/meminfo", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            if line.startswith("MemTotal:"):
-                fields = line.split()
-                if len(fields) >= 2 and fields[1].isdigit():
-                    mem_total_kb = int(fields[1])
-            elif line.startswith("MemAvailable:"):
-                fields = line.split()
-                if len(fields) >= 2 and fields[1].isdigit():
-                    mem_available_kb = int(fields[1])
-            if mem_total_kb > 0 and mem_available_kb > 0:
-                break
-    if mem_total_kb <= 0:
-        raise RuntimeError("could not read MemTotal from /proc/meminfo")
-    if mem_available_kb < 0:
-        mem_available_kb = 0
-    mem_used_kb = max(0, mem_total_kb - mem_available_kb)
-    return mem_total_kb * 1024, mem_used_kb * 1024
-
-
-def _read_network_totals(*, include_loopback: bool) -> tuple[int, int, list[str]]:
-    rx_total = 0
-    tx_total = 0
-    interfaces: list[str] = []
-    with open("/proc/net/dev", encoding="utf-8", errors="replace") as f:
-        lines = f.readlines()
-    for raw in lines[2:]:
-        if ":" not in raw:
-            continue
-        iface, rest = raw.split(":", 1)
-        name = iface.strip()
-        if not name:
-            continue
-        if not include_loopback and name == "lo":
-            continue
-        cols = rest.split()
-        if len(cols) < 16:
-            continue
-        try:
-            rx_bytes = int(cols[0])
-            tx_bytes = int(cols[8])
-        except ValueError:
-            continue
-        rx_total += max(0, rx_bytes)
-        tx_total += max(0, tx_bytes)
-        interfaces.append(name)
-    interfaces.sort(key=lambda s: s.lower())
-    return rx_total, tx_total, interfaces
+from activewatcher.common.protocol import canonical_json
+from activewatcher.common.spool import shared_outbox
+
+from .procfs import ProcSample, ProcSampler
+from .schedule import sleep_aligned
+
+
+@dataclass(frozen=True)
+class MetricFilter:
+    """Quantization step and deadband for one metric.
+
+    A sample only counts as a change once it leaves the deadband around the last sent
+    value: `deadband` units, or with `relative` that fraction of the sent value (never
+    less than one quantum). A zero deadband reports every quantized change.
+    """
+
+    quantum: float = 0.0
+    deadband: float = 0.0
+    relative: bool = False
+
+    def quantize(self, value: float) -> float:
+        if self.quantum <= 0:
+            return round(value, 3)
+        return round(round(value / self.quantum) * self.quantum, 3)
+
+    def changed(self, value: float, sent: float | None) -> bool:
+        if sent is None:
+            return True
+        band = self.deadband * abs(sent) if self.relative else self.deadband
+        if self.relative:
+            band = max(band, self.quantum)
+        return abs(value - sent) > band if band > 0 else value != sent
+
+
+def metric_filters(
+    *,
+    cpu_quantum: float = 1.0,
+    cpu_deadband: float = 5.0,
+    mem_quantum: float = 0.5,
+    mem_deadband: float = 2.0,
+    net_quantum: float = 4096.0,
+    net_deadband: float = 0.2,
+) -> dict[str, MetricFilter]:
+    """Filters keyed by data field; CPU/memory bands are percent points, network is relative."""
+    net = MetricFilter(quantum=net_quantum, deadband=net_deadband, relative=True)
+    return {
+        "cpu_percent": MetricFilter(quantum=cpu_quantum, deadband=cpu_deadband),
+        "mem_percent": MetricFilter(quantum=mem_quantum, deadband=mem_deadband),
+        "net_rx_bps": net,
+        "net_tx_bps": net,
+    }
+
+
+@dataclass
+class _MetricStats:
+    samples: int = 0
+    minimum: dict[str, float] = field(default_factory=dict)
+    maximum: dict[str, float] = field(default_factory=dict)
+    total: dict[str, float] = field(default_factory=dict)
+
+    def add(self, values: dict[str, float]) -> None:
+        self.samples += 1
+        for key, value in values.items():
+            self.minimum[key] = min(self.minimum.get(key, value), value)
+            self.maximum[key] = max(self.maximum.get(key, value), value)
+            self.total[key] = self.total.get(key, 0.0) + value
+
+    def to_values(self) -> dict[str, float]:
+        out: dict[str, float] = {}
+        for key, total in self.total.items():
+            out[f"{key}_interval_min"] = round(self.minimum[key], 3)
+            out[f"{key}_interval_max"] = round(self.maximum[key], 3)
+            out[f"{key}_interval_mean"] = round(total / self.samples, 3)
+        return out
+
+
+def _metric_values(sample: ProcSample, *, detail: bool) -> dict[str, float]:
+    values: dict[str, float] = {
+        "cpu_percent": sample.cpu_percent,
+        "mem_used_bytes": sample.mem_used_bytes,
+        "mem_percent": sample.mem_percent,
+        "net_rx_bps": sample.net_rx_bps,
+        "net_tx_bps": sample.net_tx_bps,
+        "disk_read_bps": sample.disk_read_bps,
+        "disk_write_bps": sample.disk_write_bps,
+        # The sampler's own cost, to keep its overhead budget visible.
+        "sampler_cpu_us": sample.sample_cpu_us,
+    }
+    if not detail:
+        return {key: round(float(value), 3) for key, value in values.items()}
+    # Per-core/-interface/-disk series only when they differ from the totals.
+    if len(sample.cpu_cores) > 1:
+        for core, percent in enumerate(sample.cpu_cores):
+            values[f"cpu{core}_percent"] = percent
+    if len(sample.net_rates) > 1:
+        for iface, (rx, tx) in sample.net_rates.items():
+            values[f"net_{iface}_rx_bps"] = rx
+            values[f"net_{iface}_tx_bps"] = tx
+    if len(sample.disk_rates) > 1:
+        for device, (read, written) in sample.disk_rates.items():
+            values[f"disk_{device}_read_bps"] = read
+            values[f"disk_{device}_write_bps"] = written
+    for key, percent in sample.psi.items():
+        values[f"psi_{key}_percent"] = percent
+    return {key: round(float(value), 3) for key, value in values.items()}
 
 
 @dataclass
@@ -86,20 +119,57 @@ class SystemWatcher:
     poll_seconds: float
     heartbeat_seconds: int
     include_loopback: bool
+    filters: dict[str, MetricFilter] = field(default_factory=metric_filters)
+    # Per-core, per-interface, per-disk and PSI series; each adds a series per poll.
+    detail_metrics: bool = False
 
     def __post_init__(self) -> None:
         self._last_sent_state: str | None = None
+        self._last_sent_data: dict[str, Any] | None = None
         self._last_sent_at: float = 0.0
-        self._prev_cpu_total: int | None = None
-        self._prev_cpu_idle: int | None = None
-        self._prev_net_rx: int | None = None
-        self._prev_net_tx: int | None = None
-        self._prev_net_ts: float | None = None
+        # Raw samples folded into the interval that is currently open on the server, which
+        # started at `_interval_started`.
+        self._interval_stats = _MetricStats()
+        self._interval_started: str | None = None
+        self.samples = 0
+        self.state_changes = 0
+        self._sampler = ProcSampler(include_loopback=self.include_loopback)
+
+    def _filtered_change(self, data: dict[str, Any]) -> bool:
+        last = self._last_sent_data
+        if last is None:
+            return True
+        for key in ("mem_total_bytes", "net_interfaces"):
+            if data.get(key) != last.get(key):
+                return True
+        return any(f.changed(data[key], last.get(key)) for key, f in self.filters.items() if key in data)
 
     async def maybe_send(self, *, data: dict[str, Any], force: bool) -> None:
+        """Send `data` as a new state when a metric leaves its deadband, else keep the open
+        interval alive with heartbeats carrying the last sent data.
+
+        Min/max/mean of the raw samples over the interval being closed go to the metric
+        store first (see flush_interval_stats), so filtered-out peaks are not lost.
+        """
         now = time.monotonic()
-        state_json = _canonical_json(data)
-        should_send = force or state_json != self._last_sent_state
+        raw = {key: float(data[key]) for key in self.filters if key in data}
+        self.samples += 1
+        changed = self._filtered_change(data)
+        if changed:
+            data = dict(data)
+            for key, f in self.filters.items():
+                if key in data:
+                    data[key] = f.quantize(data[key])
+            if "net_rx_bps" in data and "net_tx_bps" in data:
+                data["net_total_bps"] = round(data["net_rx_bps"] + data["net_tx_bps"], 3)
+            await self.flush_interval_stats()
+        elif self._last_sent_data is not None:
+            data = self._last_sent_data
+        self._interval_stats.add(raw)
+
+        state_json = canonical_json(data)
+        changed = changed or state_json != self._last_sent_state
+        should_send = force or changed
         if self.heartbeat_seconds > 0 and (now - self._last_sent_at) >= self.heartbeat_seconds:
             should_send = True
         if not should_send:
@@ -108,56 +178,47 @@ class SystemWatcher:
         ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
         payload = {"bucket": "system", "source": self.source, "ts": ts, "data": data}
 
-        client = ActiveWatcherAsyncClient(self.server_url)
-        try:
-            await client.post_state(payload)
-            self._last_sent_state = state_json
-            self._last_sent_at = now
-        finally:
-            await client.aclose()
+        # Spooled to disk first; the outbox drains it to the server in the background.
+        await shared_outbox(self.server_url, "system").put("state" if changed else "touch", payload)
+        if changed:
+            self.state_changes += 1
+            self._interval_started = ts
+        self._last_sent_state = state_json
+        self._last_sent_data = data
+        self._last_sent_at = now
 
-    async def tick(self) -> None:
-        cpu_total, cpu_idle = _read_cpu_sample()
-        cpu_percent = 0.0
-        if self._prev_cpu_total is not None and self._prev_cpu_idle is not None:
-            dt = max(0, cpu_total - self._prev_cpu_total)
-            di = max(0, cpu_idle - self._prev_cpu_idle)
-            if dt > 0:
-                cpu_percent = max(0.0, min(100.0, (1.0 - (di / dt)) * 100.0))
-        self._prev_cpu_total = cpu_total
-        self._prev_cpu_idle = cpu_idle
-
-        mem_total, mem_used = _read_mem_sample()
-        mem_percent = (mem_used / mem_total * 100.0) if mem_total > 0 else 0.0
+    async def flush_interval_stats(self) -> None:
+        """Send min/max/mean of the current interval's raw samples and start a new interval.
 
-        now = time.monotonic()
-        rx_total, tx_total, ifaces = _read_network_totals(include_loopback=self.include_loopback)
-        rx_bps = 0.0
-        tx_bps = 0.0
-        if (
-            self._prev_net_ts is not None
-            and self._prev_net_rx is not None
-            and self._prev_net_tx is not None
-            and now > self._prev_net_ts
-        ):
-            seconds = now - self._prev_net_ts
-            rx_bps = max(0.0, (rx_total - self._prev_net_rx) / seconds)
-            tx_bps = max(0.0, (tx_total - self._prev_net_tx) / seconds)
-        self._prev_net_rx = rx_total
-        self._prev_net_tx = tx_total
-        self._prev_net_ts = now
+        They go to the metric store as `<metric>_interval_min/_max/_mean`, stamped with the
+        interval's start, so each point lines up with the `system` row it describes.
+        """
+        stats, self._interval_stats = self._interval_stats, _MetricStats()
+        if self._interval_started is None or stats.samples == 0:
+            return
+        await shared_outbox(self.server_url, "system").put(
+            "metrics", {"source": self.source, "ts": self._interval_started, "values": stats.to_values()}
+        )
 
+    async def send_metrics(self, values: dict[str, float]) -> None:
+        # Every raw sample also goes to the server's metric store, unfiltered.
+        ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        await shared_outbox(self.server_url, "system").put("metrics", {"source": self.source, "ts": ts, "values": values})
+
+    async def tick(self) -> None:
+        sample = self._sampler.sample()
         data = {
-            "cpu_percent": round(cpu_percent, 3),
-            "mem_total_bytes": mem_total,
-            "mem_used_bytes": mem_used,
-            "mem_percent": round(mem_percent, 3),
-            "net_rx_bps": round(rx_bps, 3),
-            "net_tx_bps": round(tx_bps, 3),
-            "net_total_bps": round(rx_bps + tx_bps, 3),
-            "net_interfaces": ifaces,
+            "cpu_percent": round(sample.cpu_percent, 3),
+            "mem_total_bytes": sample.mem_total_bytes,
+            "mem_used_bytes": sample.mem_used_bytes,
+            "mem_percent": round(sample.mem_percent, 3),
+            "net_rx_bps": round(sample.net_rx_bps, 3),
+            "net_tx_bps": round(sample.net_tx_bps, 3),
+            "net_total_bps": round(sample.net_rx_bps + sample.net_tx_bps, 3),
+            "net_interfaces": sample.net_interfaces,
         }
         await self.maybe_send(data=data, force=False)
+        await self.send_metrics(_metric_values(sample, detail=self.detail_metrics))
 
 
 async def run(
@@ -167,6 +228,13 @@ async def run(
     poll_seconds: float,
     heartbeat_seconds: int,
     include_loopback: bool,
+    cpu_quantum: float = 1.0,
+    cpu_deadband: float = 5.0,
+    mem_quantum: float = 0.5,
+    mem_deadband: float = 2.0,
+    net_quantum: float = 4096.0,
+    net_deadband: float = 0.2,
+    detail_metrics: bool = False,
 ) -> None:
     watcher = SystemWatcher(
         server_url=server_url,
@@ -174,14 +242,28 @@ async def run(
         poll_seconds=poll_seconds,
         heartbeat_seconds=heartbeat_seconds,
         include_loopback=include_loopback,
+        filters=metric_filters(
+            cpu_quantum=cpu_quantum,
+            cpu_deadband=cpu_deadband,
+            mem_quantum=mem_quantum,
+            mem_deadband=mem_deadband,
+            net_quantum=net_quantum,
+            net_deadband=net_deadband,
+        ),
+        detail_metrics=detail_metrics,
     )
     print(
-        f"[system] poll={poll_seconds}s heartbeat={heartbeat_seconds}s include_loopback={include_loopback}"
+        f"[system] poll={poll_seconds}s heartbeat={heartbeat_seconds}s include_loopback={include_loopback} "
+        f"deadband cpu={cpu_deadband} mem={mem_deadband} net={net_deadband:.0%} detail_metrics={detail_metrics}"
     )
 
-    while True:
-        try:
-            await watcher.tick()
-        except Exception as e:
-            print(f"[system] error: {e}")
-        await asyncio.sleep(max(0.2, poll_seconds))
+    try:
+        while True:
+            try:
+                await watcher.tick()
+            except Exception as e:
+                print(f"[system] error: {e}")
+            await sleep_aligned(poll_seconds)
+    finally:
+        # The open interval's stats; spooled right away, delivered on the next start if need be.
+        await watcher.flush_interval_stats()
@@ -5,8 +5,13 @@ const DEFAULTS = {
   browserLabel: "auto",
 };
 
+const BATCH_WINDOW_MS = 1500;
+const MAX_SPOOL_BATCHES = 500;
+const STREAM_KEY = "awTabStream";
+
 let sendTimer = null;
-let lastPayload = "";
+let stream = null;
+let draining = false;
 
 function callApi(fn, ...args) {
   return new Promise((resolve, reject) => {
@@ -39,98 +44,224 @@ function detectBrowserLabel() {
   return "browser";
 }
 
-async function collectTabsSnapshot() {
-  const tabs = await callApi(api.tabs.query, {});
-  const windowIds = new Set();
-  let incognito = 0;
-  let pinned = 0;
-  let audible = 0;
-  let muted = 0;
-  const tabItems = [];
-  for (const t of tabs || []) {
-    if (t.windowId != null) windowIds.add(t.windowId);
-    if (t.incognito) incognito += 1;
-    if (t.pinned) pinned += 1;
-    if (t.audible) audible += 1;
-    if (t.mutedInfo && t.mutedInfo.muted) muted += 1;
-    tabItems.push({
-      id: t.id ?? null,
-      window_id: t.windowId ?? null,
-      index: t.index ?? null,
-      url: t.url || t.pendingUrl || "",
-      pending_url: t.pendingUrl || "",
-      title: t.title || "",
-      fav_icon_url: t.favIconUrl || "",
-      status: t.status || "",
-      last_accessed: t.lastAccessed ?? null,
-      discarded: !!t.discarded,
-      auto_discardable: !!t.autoDiscardable,
-      group_id: t.groupId ?? null,
-      opener_tab_id: t.openerTabId ?? null,
-      active: !!t.active,
-      pinned: !!t.pinned,
-      highlighted: !!t.highlighted,
-      incognito: !!t.incognito,
-      audible: !!t.audible,
-      muted: !!(t.mutedInfo && t.mutedInfo.muted),
-    });
-  }
-  return {
-    count: (tabs || []).length,
-    window_count: windowIds.size,
-    incognito_tabs: incognito,
-    pinned_tabs: pinned,
-    audible_tabs: audible,
-    muted_tabs: muted,
-    tabs: tabItems,
-  };
-}
-
-async function postState() {
+async function resolveTarget() {
   const settings = await getSettings();
   const serverUrl = String(settings.serverUrl || DEFAULTS.serverUrl).replace(/\/+$/, "");
   const browserLabel =
     settings.browserLabel && settings.browserLabel !== "auto"
       ? String(settings.browserLabel)
       : detectBrowserLabel();
+  return { serverUrl, browserLabel };
+}
+
+function tabItem(t) {
+  return {
+    id: t.id ?? null,
+    window_id: t.windowId ?? null,
+    index: t.index ?? null,
+    url: t.url || t.pendingUrl || "",
+    pending_url: t.pendingUrl || "",
+    title: t.title || "",
+    fav_icon_url: t.favIconUrl || "",
+    status: t.status || "",
+    last_accessed: t.lastAccessed ?? null,
+    discarded: !!t.discarded,
+    auto_discardable: !!t.autoDiscardable,
+    group_id: t.groupId ?? null,
+    opener_tab_id: t.openerTabId ?? null,
+    active: !!t.active,
+    pinned: !!t.pinned,
+    highlighted: !!t.highlighted,
+    incognito: !!t.incognito,
+    audible: !!t.audible,
+    muted: !!(t.mutedInfo && t.mutedInfo.muted),
+  };
+}
+
+async function collectTabs() {
+  const tabs = await callApi(api.tabs.query, {});
+  const out = {};
+  for (const t of tabs || []) {
+    if (t.id == null) continue;
+    out[String(t.id)] = tabItem(t);
+  }
+  return out;
+}
+
+async function loadStream() {
+  if (stream) return stream;
+  let saved = null;
+  try {
+    const data = await callApi(api.storage.local.get, { [STREAM_KEY]: null });
+    saved = data ? data[STREAM_KEY] : null;
+  } catch {
+    saved = null;
+  }
+  stream = {
+    source: "",
+    seq: 0,
+    known: {},
+    spool: [],
+    needReset: true,
+    legacy: false,
+    ...(saved || {}),
+  };
+  return stream;
+}
 
-  let snapshot;
+async function saveStream() {
   try {
-    snapshot = await collectTabsSnapshot();
+    await callApi(api.storage.local.set, { [STREAM_KEY]: stream });
+  } catch {
+    // ignore storage errors; worst case the next batch resyncs
+  }
+}
+
+function diffTabs(prev, next) {
+  const ops = [];
+  for (const [key, tab] of Object.entries(prev)) {
+    if (!(key in next)) ops.push({ op: "remove", id: tab.id ?? key });
+  }
+  for (const [key, tab] of Object.entries(next)) {
+    const old = prev[key];
+    if (!old) {
+      ops.push({ op: "add", id: tab.id, tab });
+      continue;
+    }
+    const changed = {};
+    let dirty = false;
+    for (const [k, v] of Object.entries(tab)) {
+      if (old[k] !== v) {
+        changed[k] = v;
+        dirty = true;
+      }
+    }
+    if (dirty) ops.push({ op: "update", id: tab.id, tab: changed });
+  }
+  return ops;
+}
+
+async function enqueueBatch({ ping = false } = {}) {
+  const s = await loadStream();
+  const { browserLabel } = await resolveTarget();
+
+  let tabs;
+  try {
+    tabs = await collectTabs();
   } catch {
     return;
   }
 
-  const payload = {
+  const source = `tabs:${browserLabel}`;
+  if (s.source !== source) s.needReset = true;
+
+  const batch = { source, browser: browserLabel, ts: new Date().toISOString(), seq: s.seq + 1, reset: false, ops: [] };
+  if (s.needReset || s.spool.length >= MAX_SPOOL_BATCHES) {
+    // A reset carries the full set and supersedes anything still spooled.
+    s.spool = [];
+    batch.reset = true;
+    batch.ops = Object.values(tabs).map((tab) => ({ op: "add", id: tab.id, tab }));
+    s.needReset = false;
+  } else {
+    batch.ops = diffTabs(s.known, tabs);
+    // An empty batch on the ping alarm keeps the server-side interval alive.
+    if (!batch.ops.length && !ping) return;
+  }
+
+  s.seq = batch.seq;
+  s.source = source;
+  s.known = tabs;
+  s.spool.push(batch);
+  await saveStream();
+  await drainSpool();
+}
+
+function legacySnapshot(batch) {
+  const tabs = Object.values(stream.known);
+  const windowIds = new Set(tabs.map((t) => t.window_id).filter((v) => v != null));
+  return {
     bucket: "browser_tabs",
-    source: `tabs:${browserLabel}`,
-    ts: new Date().toISOString(),
+    source: batch.source,
+    ts: batch.ts,
     data: {
-      browser: browserLabel,
-      ...snapshot,
+      browser: batch.browser,
+      count: tabs.length,
+      window_count: windowIds.size,
+      incognito_tabs: tabs.filter((t) => t.incognito).length,
+      pinned_tabs: tabs.filter((t) => t.pinned).length,
+      audible_tabs: tabs.filter((t) => t.audible).length,
+      muted_tabs: tabs.filter((t) => t.muted).length,
+      tabs,
     },
   };
+}
 
-  const body = JSON.stringify(payload);
-  if (body === lastPayload) return;
-  lastPayload = body;
-
+async function drainSpool() {
+  if (draining) return;
+  draining = true;
+  let resync = false;
   try {
-    await fetch(`${serverUrl}/v1/state`, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body,
-    });
-  } catch {
-    // ignore network errors
+    const s = await loadStream();
+    const { serverUrl } = await resolveTarget();
+    while (s.spool.length) {
+      const batch = s.spool[0];
+      let resp;
+      try {
+        if (s.legacy) {
+          // Server without the delta endpoint: collapse the spool into one full-state post.
+          resp = await fetch(`${serverUrl}/v1/state`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(legacySnapshot(s.spool[s.spool.length - 1])),
+          });
+        } else {
+          resp = await fetch(`${serverUrl}/v1/tabs/delta`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(batch),
+          });
+        }
+      } catch {
+        return; // offline; keep the spool and replay on the next event/alarm
+      }
+
+      if (!s.legacy && resp.status === 404) {
+        s.legacy = true;
+        continue;
+      }
+      if (s.legacy) {
+        if (!resp.ok && resp.status !== 409) return;
+        s.spool = [];
+        await saveStream();
+        return;
+      }
+      if (resp.status === 409) {
+        s.spool = [];
+        s.needReset = true;
+        await saveStream();
+        resync = true;
+        return;
+      }
+      if (!resp.ok) return;
+      // A reset may have replaced the spool while this request was in flight.
+      if (s.spool[0] === batch) s.spool.shift();
+      await saveStream();
+    }
+  } finally {
+    draining = false;
+    if (resync) await enqueueBatch();
   }
 }
 
-function scheduleSend(delayMs = 400) {
-  if (sendTimer) clearTimeout(sendTimer);
+function scheduleSend(delayMs = BATCH_WINDOW_MS, options = {}) {
+  if (sendTimer) {
+    // Keep the pending deadline so a burst of tab events lands in one batch.
+    if (!options.ping && delayMs > 0) return;
+    clearTimeout(sendTimer);
+  }
   sendTimer = setTimeout(() => {
     sendTimer = null;
-    postState();
+    enqueueBatch(options);
   }, delayMs);
 }
 
@@ -156,7 +287,7 @@ function bindEvents() {
     try {
       api.alarms.create("aw_tabs_ping", { periodInMinutes: 1 });
       api.alarms.onAlarm.addListener((a) => {
-        if (a && a.name === "aw_tabs_ping") scheduleSend(0);
+        if (a && a.name === "aw_tabs_ping") scheduleSend(0, { ping: true });
       });
     } catch {
       // ignore
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""Replay a synthetic socket2 trace against HyprlandWatcher and count socket1 traffic.
+
+A fake Hyprland socket1 server answers from a simulated compositor state that the trace
+mutates, so the watcher's model stays consistent with what IPC would return. Each mode
+replays the same trace:
+
+  no-model      every refresh re-reads all views (behaviour before the event model)
+  full-resync   model, but any event it can't apply triggers a full resync
+  selective     model plus per-facet partial resyncs (current behaviour)
+
+Usage: python scripts/bench_hyprland_ipc.py [--events 1000] [--seed 1]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+from typing import Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# Nothing is posted; keep the benchmark from creating an on-disk spool.
+os.environ["ACTIVEWATCHER_SPOOL"] = "0"
+
+from activewatcher.watchers.hyprland import HyprlandWatcher  # noqa: E402
+
+
+class FakeHyprland:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.commands = 0
+        self.monitors = [
+            {"id": 0, "name": "DP-1", "focused": True, "activeWorkspace": {"id": 1, "name": "1"}},
+            {"id": 1, "name": "HDMI-A-1", "focused": False, "activeWorkspace": {"id": 6, "name": "6"}},
+        ]
+        self.workspaces = {
+            ws_id: {
+                "id": ws_id,
+                "name": str(ws_id),
+                "monitor": "DP-1" if ws_id <= 5 else "HDMI-A-1",
+                "monitorID": 0 if ws_id <= 5 else 1,
+                "windows": 0,
+                "hasfullscreen": False,
+                "lastwindow": "0x0",
+                "lastwindowtitle": "",
+            }
+            for ws_id in range(1, 11)
+        }
+        self.clients: dict[str, dict[str, Any]] = {}
+        self.active: str | None = None
+        self._next_addr = 0x1000
+        for ws_id in (1, 1, 2, 3, 6, 6, 7):
+            self.open_window(ws_id)
+
+    def focused_monitor(self) -> dict[str, Any]:
+        return next(m for m in self.monitors if m["focused"])
+
+    def open_window(self, ws_id: int) -> str:
+        address = hex(self._next_addr)
+        self._next_addr += 1
+        ws = self.workspaces[ws_id]
+        self.clients[address] = {
+            "address": address,
+            "class": random.choice(["kitty", "firefox", "code", "slack", "mpv"]),
+            "title": f"window {address}",
+            "workspace": {"id": ws_id, "name": ws["name"]},
+            "monitor": ws["monitorID"],
+            "xwayland": False,
+            "hidden": False,
+            "mapped": True,
+        }
+        return address
+
+    def views(self) -> dict[str, Any]:
+        mon = self.focused_monitor()
+        active_ws = dict(self.workspaces[mon["activeWorkspace"]["id"]])
+        active_ws["windows"] = sum(1 for c in self.clients.values() if c["workspace"]["id"] == active_ws["id"])
+        return {
+            "monitors": self.monitors,
+            "clients": list(self.clients.values()),
+            "workspaces": list(self.workspaces.values()),
+            "activewindow": dict(self.clients[self.active]) if self.active else {},
+            "activeworkspace": active_ws,
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        request = (await reader.read(65536)).decode().strip()
+        commands = request[len("[[BATCH]]") :].split(";") if request.startswith("[[BATCH]]") else [request]
+        views = self.views()
+        self.requests += 1
+        self.commands += len(commands)
+        writer.write("\n".join(json.dumps(views[c[2:]]) for c in commands if c).encode())
+        await writer.drain()
+        writer.close()
+
+
+def make_trace(hypr: FakeHyprland, count: int) -> list[tuple[str, str]]:
+    """Mutate `hypr` step by step, recording the socket2 lines Hyprland would emit.
+
+    Each step is followed by a ("__state__", json) entry holding the compositor state it
+    reached, so replay can expose exactly what socket1 would answer at that point.
+    """
+    trace: list[tuple[str, str]] = []
+    weights = [
+        ("title", 60),
+        ("focus", 20),
+        ("workspace", 6),
+        ("focusedmon", 4),
+        ("open", 3),
+        ("close", 3),
+        ("move", 4),
+    ]
+    kinds = [k for k, _ in weights]
+    cum = [w for _, w in weights]
+    events = 0
+    while events < count:
+        before = len(trace)
+        kind = random.choices(kinds, weights=cum)[0]
+        mon = hypr.focused_monitor()
+        on_ws = [a for a, c in hypr.clients.items() if c["workspace"]["id"] == mon["activeWorkspace"]["id"]]
+        if kind == "title" and hypr.active:
+            client = hypr.clients[hypr.active]
+            client["title"] = f"{client['class']} {random.randint(0, 9999)}"
+            trace.append(("windowtitle", hypr.active[2:]))
+            trace.append(("windowtitlev2", f"{hypr.active[2:]},{client['title']}"))
+        elif kind == "focus" and on_ws:
+            hypr.active = random.choice(on_ws)
+            client = hypr.clients[hypr.active]
+            trace.append(("activewindow", f"{client['class']},{client['title']}"))
+            trace.append(("activewindowv2", hypr.active[2:]))
+        elif kind == "workspace":
+            ws_id = random.choice([w for w in hypr.workspaces.values() if w["monitor"] == mon["name"]])["id"]
+            mon["activeWorkspace"] = {"id": ws_id, "name": str(ws_id)}
+            hypr.active = next((a for a, c in hypr.clients.items() if c["workspace"]["id"] == ws_id), None)
+            trace.append(("workspace", str(ws_id)))
+            trace.append(("workspacev2", f"{ws_id},{ws_id}"))
+        elif kind == "focusedmon":
+            for m in hypr.monitors:
+                m["focused"] = not m["focused"]
+            mon = hypr.focused_monitor()
+            ws_id = mon["activeWorkspace"]["id"]
+            hypr.active = next((a for a, c in hypr.clients.items() if c["workspace"]["id"] == ws_id), None)
+            trace.append(("focusedmon", f"{mon['name']},{ws_id}"))
+        elif kind == "open":
+            hypr.active = hypr.open_window(mon["activeWorkspace"]["id"])
+            client = hypr.clients[hypr.active]
+            trace.append(("openwindow", f"{hypr.active[2:]},{mon['activeWorkspace']['id']},{client['class']},x"))
+        elif kind == "close" and len(hypr.clients) > 3 and hypr.active:
+            closed = hypr.active
+            del hypr.clients[closed]
+            hypr.active = None
+            trace.append(("closewindow", closed[2:]))
+        elif kind == "move" and hypr.active:
+            ws = random.choice([w for w in hypr.workspaces.values() if w["monitor"] == mon["name"]])
+            client = hypr.clients[hypr.active]
+            client["workspace"] = {"id": ws["id"], "name": ws["name"]}
+            trace.append(("movewindow", f"{hypr.active[2:]},{ws['name']}"))
+            trace.append(("movewindowv2", f"{hypr.active[2:]},{ws['id']},{ws['name']}"))
+        if len(trace) == before:
+            continue
+        events += len(trace) - before
+        # Record the compositor state reached after this step.
+        trace.append(("__state__", json.dumps(hypr.views())))
+    return trace
+
+
+class BenchWatcher(HyprlandWatcher):
+    mode = "selective"
+
+    async def _post_payloads(self, payloads: list[dict[str, Any]]) -> bool:
+        return True
+
+    async def _load_views(self, ipc, *, resync: bool) -> None:
+        await super()._load_views(ipc, resync=resync or self.mode == "no-model")
+
+    def handle_event(self, event: str, payload: str) -> None:
+        super().handle_event(event, payload)
+        if self.mode == "full-resync" and self._stale:
+            self._stale.clear()
+            self._resync_needed = True
+
+
+async def replay(mode: str, trace: list[tuple[str, str]], initial: dict[str, Any]) -> dict[str, Any]:
+    hypr = FakeHyprland()
+    state: dict[str, Any] = initial
+    hypr.views = lambda: state  # type: ignore[method-assign]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, ".socket.sock")
+        server = await asyncio.start_unix_server(hypr.handle, path)
+        watcher = BenchWatcher(
+            server_url="http://127.0.0.1:0",
+            source="bench",
+            debounce_ms=0,
+            title_max_len=256,
+            heartbeat_seconds=0,
+            track_focused=True,
+            track_visible_windows=True,
+            visible_all_monitors=False,
+            track_open_apps=True,
+            track_workspaces=True,
+        )
+        watcher.mode = mode
+        # Refreshes are driven explicitly below instead of through the debounce task.
+        watcher.trigger_refresh = lambda: None  # type: ignore[method-assign]
+        watcher.set_socket1_path(path)
+        await watcher.refresh_and_send(force=True)
+        start_requests, start_commands = hypr.requests, hypr.commands
+        events = 0
+        for event, payload in trace:
+            if event == "__state__":
+                state = json.loads(payload)
+                # One refresh per step, as the debouncer would coalesce a v1/v2 pair.
+                await watcher.refresh_and_send(force=False)
+                continue
+            events += 1
+            watcher.handle_event(event, payload)
+        server.close()
+        await server.wait_closed()
+    scale = 1000.0 / max(events, 1)
+    return {
+        "mode": mode,
+        "events": events,
+        "ipc_requests_per_1000": round((hypr.requests - start_requests) * scale, 1),
+        "ipc_commands_per_1000": round((hypr.commands - start_commands) * scale, 1),
+        "stats": {k: v for k, v in watcher.stats().items() if k not in ("http", "spool")},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000, help="socket2 lines in the trace")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    hypr = FakeHyprland()
+    initial = json.loads(json.dumps(hypr.views()))
+    trace = make_trace(hypr, args.events)
+    for mode in ("no-model", "full-resync", "selective"):
+        result = await replay(mode, trace, json.loads(json.dumps(initial)))
+        print(json.dumps(result, sort_keys=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Check that interval range queries scale with the result, not with the history.
+
+Builds synthetic databases with the same interval density (window/idle/system) but
+increasingly long histories, then for a recent and a 60-days-old one-week range reports:
+
+  plan     EXPLAIN QUERY PLAN of both branches (closed rows: a two-sided start_ts
+           SEARCH on idx_events_bucket_start; open rows: idx_events_end); the script
+           exits with status 1 if any query uses another plan
+  rows     intervals returned by reports.load_intervals(bucket="window")
+  sql_ms   the overlap query alone (best of --runs)
+
+Usage: python scripts/bench_interval_queries.py [--days 90,730] [--runs 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from activewatcher.common.time import to_rfc3339  # noqa: E402
+from activewatcher.server import db, reports  # noqa: E402
+
+END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+CLOSED_PLAN = "SEARCH main.events USING INDEX idx_events_bucket_start (bucket=? AND start_ts>? AND start_ts<?)"
+OPEN_PLAN = "SEARCH main.events USING INDEX idx_events_end "
+# bucket -> mean seconds between interval starts
+BUCKETS = (("window", 30.0), ("idle", 300.0), ("system", 60.0))
+
+
+def build(path: str, days: int) -> int:
+    conn = db.connect(path)
+    db.init_db(conn)
+    rng = random.Random(days)
+    start = END - timedelta(days=days)
+    rows = []
+    for bucket, step in BUCKETS:
+        for i in range(int(days * 86400 / step)):
+            s = start + timedelta(seconds=i * step)
+            e = s + timedelta(seconds=min(step, rng.expovariate(1 / step)))
+            rows.append((bucket, bucket, to_rfc3339(s), to_rfc3339(e), to_rfc3339(e), '{"app":"a"}'))
+    conn.executemany(
+        "INSERT INTO events(bucket, source, start_ts, end_ts, last_seen_ts, data_json) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def measure(conn: sqlite3.Connection, from_dt: datetime, to_dt: datetime, runs: int) -> tuple[str, int, float]:
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    rows = reports._overlapping_rows(
+        conn, "bucket, source, start_ts", from_iso=to_rfc3339(from_dt), to_iso=to_rfc3339(to_dt), bucket="window", where=[], params=[]
+    )
+    conn.set_trace_callback(None)
+    overlap_sql = next(s for s in statements if "UNION ALL" in s)
+    plan = [str(r[3]) for r in conn.execute("EXPLAIN QUERY PLAN " + overlap_sql)]
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        reports._overlapping_rows(
+            conn, "bucket, source, start_ts", from_iso=to_rfc3339(from_dt), to_iso=to_rfc3339(to_dt), bucket="window", where=[], params=[]
+        )
+        best = min(best, time.perf_counter() - t0)
+    searches = [p for p in plan if p.startswith("SEARCH main.events")]
+    return searches, len(rows), best * 1000.0
+
+
+def plan_ok(searches: list[str]) -> bool:
+    """Closed rows: a start_ts range bounded on both sides; open rows: idx_events_end."""
+    return len(searches) == 2 and searches[0] == CLOSED_PLAN and searches[1].startswith(OPEN_PLAN)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", default="90,730")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    ranges = {
+        "last week": (END - timedelta(days=7), END),
+        "week 60 days ago": (END - timedelta(days=67), END - timedelta(days=60)),
+    }
+    bad_plans = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for days in (int(d) for d in args.days.split(",")):
+            path = os.path.join(tmp, f"events-{days}d.sqlite3")
+            size = build(path, days)
+            conn = db.connect(path)
+            for label, (from_dt, to_dt) in ranges.items():
+                searches, rows, ms = measure(conn, from_dt, to_dt, args.runs)
+                ok = plan_ok(searches)
+                bad_plans += not ok
+                plan = " | ".join(searches)
+                status = "ok" if ok else "UNEXPECTED"
+                print(f"events={size:>8} {label:18} rows={rows:>6} sql_ms={ms:7.2f}  plan {status}: {plan}")
+            conn.close()
+    if bad_plans:
+        print(f"{bad_plans} queries did not use the bounded plan", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
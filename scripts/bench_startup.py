@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Measure import time and memory of each activewatcher entry point.
+
+Every entry point is started in a fresh interpreter (several runs, median reported):
+
+  import_ms   importing the CLI and the modules the command loads
+  ready_ms    import plus building what the command needs before its loop starts
+              (the HTTP client for watchers, the FastAPI app for the server)
+  rss_mb      resident memory once ready
+  pydantic    whether the validation stack got loaded
+
+Usage: python scripts/bench_startup.py [--runs 5] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+_WATCHER_READY = "from activewatcher.common.http import shared_sender; shared_sender('http://127.0.0.1:1')"
+
+ENTRY_POINTS: dict[str, tuple[list[str], str]] = {
+    "cli": (["activewatcher.cli.main"], ""),
+    "watch hyprland": (["activewatcher.cli.main", "activewatcher.watchers.hyprland"], _WATCHER_READY),
+    "watch idle": (["activewatcher.cli.main", "activewatcher.watchers.idle"], _WATCHER_READY),
+    "watch system": (["activewatcher.cli.main", "activewatcher.watchers.system"], _WATCHER_READY),
+    "watch battery": (["activewatcher.cli.main", "activewatcher.watchers.battery"], _WATCHER_READY),
+    "watch all": (
+        [
+            "activewatcher.cli.main",
+            "activewatcher.watchers.combined",
+            "activewatcher.watchers.hyprland",
+            "activewatcher.watchers.idle",
+            "activewatcher.watchers.system",
+            "activewatcher.watchers.battery",
+        ],
+        _WATCHER_READY,
+    ),
+    "server": (
+        ["activewatcher.cli.main", "activewatcher.server.app"],
+        "import os; from activewatcher.server.app import create_app; create_app(os.environ['BENCH_DB'])",
+    ),
+}
+
+_PROBE = """
+import importlib, json, sys, time
+t0 = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+t1 = time.perf_counter()
+{ready}
+t2 = time.perf_counter()
+with open("/proc/self/status") as f:
+    rss_kb = int(f.read().split("VmRSS:")[1].split()[0])
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000.0,
+    "ready_ms": (t2 - t0) * 1000.0,
+    "rss_mb": rss_kb / 1024.0,
+    "pydantic": "pydantic" in sys.modules,
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def probe(modules: list[str], ready: str, *, env: dict[str, str]) -> dict:
+    code = _PROBE.format(modules=modules, ready=ready or "pass")
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, env=env)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print one JSON object per entry point")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, env.get("PYTHONPATH")) if p)
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+        env["BENCH_DB"] = os.path.join(tmp, "bench.sqlite3")
+        env["XDG_DATA_HOME"] = tmp
+
+        if not args.json:
+            print(f"{'entry point':<16} {'import_ms':>10} {'ready_ms':>10} {'rss_mb':>8} {'modules':>8}  pydantic")
+        for name, (modules, ready) in ENTRY_POINTS.items():
+            # One warm-up run so every entry point sees the same bytecode cache state.
+            probe(modules, ready, env=env)
+            runs = [probe(modules, ready, env=env) for _ in range(max(1, args.runs))]
+            result = {
+                "entry_point": name,
+                "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+                "ready_ms": round(statistics.median(r["ready_ms"] for r in runs), 1),
+                "rss_mb": round(statistics.median(r["rss_mb"] for r in runs), 1),
+                "modules": runs[-1]["modules"],
+                "pydantic": runs[-1]["pydantic"],
+            }
+            if args.json:
+                print(json.dumps(result, sort_keys=True))
+            else:
+                print(
+                    f"{name:<16} {result['import_ms']:>10.1f} {result['ready_ms']:>10.1f} "
+                    f"{result['rss_mb']:>8.1f} {result['modules']:>8}  {result['pydantic']}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Run a private dbus-daemon with a mock org.freedesktop.login1 service.
+
+The mock exports the Manager (GetSession, ListSessions) and one Session object for the
+current uid, and emits PropertiesChanged like logind does. Point the idle watcher at it:
+
+  python scripts/mock_logind.py            # prints the bus address, then reads commands
+  DBUS_SYSTEM_BUS_ADDRESS=<address> activewatcher watch idle --backend dbus
+
+Commands on stdin: idle, active, lock, unlock, quit.
+
+Requires dbus-daemon and dbus-next (`pip install -e .[dbus]`).
+"""
+
+# No `from __future__ import annotations`: dbus-next reads the D-Bus signatures from the
+# method annotations at runtime.
+import argparse
+import asyncio
+import os
+import pwd
+import subprocess
+import sys
+import time
+
+from dbus_next import PropertyAccess
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, dbus_property, method
+
+SESSION_PATH = "/org/freedesktop/login1/session/mock"
+
+
+class MockSession(ServiceInterface):
+    def __init__(self) -> None:
+        super().__init__("org.freedesktop.login1.Session")
+        self.idle = False
+        self.locked = False
+        self.idle_since_us = 0
+        self.idle_since_monotonic_us = 0
+
+    @dbus_property(access=PropertyAccess.READ)
+    def IdleHint(self) -> "b":  # noqa: F821
+        return self.idle
+
+    @dbus_property(access=PropertyAccess.READ)
+    def LockedHint(self) -> "b":  # noqa: F821
+        return self.locked
+
+    @dbus_property(access=PropertyAccess.READ)
+    def IdleSinceHint(self) -> "t":  # noqa: F821
+        return self.idle_since_us
+
+    @dbus_property(access=PropertyAccess.READ)
+    def IdleSinceHintMonotonic(self) -> "t":  # noqa: F821
+        return self.idle_since_monotonic_us
+
+    def set_idle(self, idle: bool) -> None:
+        self.idle = idle
+        self.idle_since_us = time.time_ns() // 1000
+        self.idle_since_monotonic_us = time.monotonic_ns() // 1000
+        self.emit_properties_changed(
+            {
+                "IdleHint": self.idle,
+                "IdleSinceHint": self.idle_since_us,
+                "IdleSinceHintMonotonic": self.idle_since_monotonic_us,
+            }
+        )
+
+    def set_locked(self, locked: bool) -> None:
+        self.locked = locked
+        self.emit_properties_changed({"LockedHint": self.locked})
+
+
+class MockManager(ServiceInterface):
+    def __init__(self, session_id: str) -> None:
+        super().__init__("org.freedesktop.login1.Manager")
+        self.session_id = session_id
+
+    @method()
+    def GetSession(self, session_id: "s") -> "o":  # noqa: F821
+        return SESSION_PATH
+
+    @method()
+    def ListSessions(self) -> "a(susso)":  # noqa: F821
+        uid = os.getuid()
+        return [[self.session_id, uid, pwd.getpwuid(uid).pw_name, "seat0", SESSION_PATH]]
+
+
+async def serve(address: str, session_id: str) -> None:
+    bus = await MessageBus(bus_address=address).connect()
+    session = MockSession()
+    bus.export(SESSION_PATH, session)
+    bus.export("/org/freedesktop/login1", MockManager(session_id))
+    await bus.request_name("org.freedesktop.login1")
+
+    loop = asyncio.get_running_loop()
+    actions = {
+        "idle": lambda: session.set_idle(True),
+        "active": lambda: session.set_idle(False),
+        "lock": lambda: session.set_locked(True),
+        "unlock": lambda: session.set_locked(False),
+    }
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        command = line.strip()
+        if not line or command == "quit":
+            break
+        action = actions.get(command)
+        if action is None:
+            print(f"unknown command {command!r} (expected {', '.join(actions)}, quit)", flush=True)
+            continue
+        action()
+        print(f"{command}: IdleHint={session.idle} LockedHint={session.locked}", flush=True)
+    bus.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--session-id", default="mock")
+    args = parser.parse_args()
+
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        address = daemon.stdout.readline().strip() if daemon.stdout else ""
+        if not address:
+            raise SystemExit("dbus-daemon did not report an address")
+        print(f"DBUS_SYSTEM_BUS_ADDRESS={address}", flush=True)
+        asyncio.run(serve(address, args.session_id))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+if __name__ == "__main__":
+    main()